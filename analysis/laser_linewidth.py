@@ -1,6 +1,6 @@
 from typing import Optional
 import numpy as np
-from onix.analysis.power_spectrum import PowerSpectrum, _get_binned_variable
+from onix.analysis.power_spectrum import PowerSpectrum, _bin_variable
 
     
 class LaserLinewidth(PowerSpectrum):
@@ -37,45 +37,64 @@ class LaserLinewidth(PowerSpectrum):
         ):
         super().__init__(num_samples, time_resolution, max_points_per_decade)
         self._discrimator_slope = discriminator_slope
+        self._frequency_resolution = self._frequencies[1] - self._frequencies[0]
+        # W_phi = W_V * _phase_noise_factor.
+        self._phase_noise_factor = 1 / (self._discrimator_slope ** 2 * self._frequencies ** 2)
+        # the phase noise integral is linear in the spectrum, so it is averaged with the same running mean.
+        self._W_phi_integral = np.zeros(len(self._frequencies))
+        self._cache = {}
+        self._cache_generation = self._generation
+
+    def _accumulate(self, error_signal, weight):
+        power_spectrum = super()._accumulate(error_signal, weight)
+        W_phi_integral = self._phase_noise_integral(power_spectrum * self._phase_noise_factor)
+        self._W_phi_integral += weight * (W_phi_integral - self._W_phi_integral)
+        return power_spectrum
+
+    def _phase_noise_integral(self, W_phi):
+        # integrating from the highest frequency.
+        return np.cumsum(W_phi[::-1] * self._frequency_resolution)[::-1]
+
+    def _cached(self, name, calculate):
+        """Returns a read-only value calculated from the spectrum, calculated again only after new data is added."""
+        if self._cache_generation != self._generation:
+            self._cache = {}
+            self._cache_generation = self._generation
+        if name not in self._cache:
+            value = calculate()
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            self._cache[name] = value
+        return self._cache[name]
+
+    def _binned(self, name, calculate):
+        if self._max_points_per_decade == None:
+            return self._cached(name, calculate)
+        return self._cached("binned_" + name, lambda: _bin_variable(self._bin_map, self._cached(name, calculate)))
 
     @property
     def W_nu(self):
-        self._get_frequency_and_phase_noise_spectra()
-        if self._max_points_per_decade == None:
-            return self._W_nu
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, self._W_nu)
+        return self._binned("W_nu", lambda: self._power_spectrum_mean / self._discrimator_slope ** 2)
 
     @property
     def W_phi(self):
-        self._get_frequency_and_phase_noise_spectra()
-        if self._max_points_per_decade == None:
-            return self._W_phi
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, self._W_phi)
+        return self._binned("W_phi", lambda: self._power_spectrum_mean * self._phase_noise_factor)
 
     @property
     def W_phi_integral(self):
-        _W_phi_integral, linewidth = self._get_phase_noise_integral()
-        if self._max_points_per_decade == None:
-            return _W_phi_integral
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, _W_phi_integral)
+        return self._binned("W_phi_integral", lambda: self._W_phi_integral.copy())
     
     @property
     def linewidth(self):
-        W_phi_integral, linewidth = self._get_phase_noise_integral()
-        return linewidth
+        return self._cached("linewidth", self._calculate_linewidth)
 
-    def _get_frequency_and_phase_noise_spectra(self):
-        unbinned_power_spectrum = np.mean(self._power_spectrums, axis=0)
-        self._W_nu = unbinned_power_spectrum / self._discrimator_slope ** 2 
-        self._W_phi = self._W_nu / self._frequencies ** 2
+    def _calculate_linewidth(self):
+        """
+        Frequency where the phase noise integral falls to 1 / pi.
 
-    def _get_phase_noise_integral(self):
-        self._get_frequency_and_phase_noise_spectra()
-        frequency_resolution = self._frequencies[1] - self._frequencies[0]
-        # integrating from the highest frequency.
-        _W_phi_integral = np.cumsum(self._W_phi[::-1] * frequency_resolution)[::-1]
-        linewidth = self._frequencies[np.argmin(_W_phi_integral > 1 / np.pi)]
-        return _W_phi_integral, linewidth
\ No newline at end of file
+        The integral does not increase with frequency, so the frequency is found by a binary search.
+        """
+        above = len(self._W_phi_integral) - np.searchsorted(self._W_phi_integral[::-1], 1 / np.pi, side="right")
+        if above == len(self._W_phi_integral):
+            above = 0
+        return self._frequencies[above]
@@ -1,4 +1,6 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window
 
 def _get_bin_start(_max_points_per_decade, _frequencies):
         if _max_points_per_decade is not None:
@@ -20,29 +22,48 @@ def _get_bin_start(_max_points_per_decade, _frequencies):
         
         return _bin_edges, _digitized, _frequency_start_bin_index
 
-def _get_binned_variable(_max_points_per_decade, _frequency_start_bin_index, _bin_edges, _digitized, variable):
-    if _max_points_per_decade is None or _frequency_start_bin_index is None:
+def _get_bin_map(_frequency_start_bin_index, _digitized):
+    """
+    Returns (start index, number of points) arrays of the bins, or None if no points are binned.
+
+    Points before _frequency_start_bin_index are bins of one point each. Later points are binned
+    by their digitized bin number, which does not decrease with frequency, so each bin is a contiguous
+    run of points.
+    """
+    if _frequency_start_bin_index is None:
+        return None
+    digitized = np.asarray(_digitized[_frequency_start_bin_index:])
+    run_starts = np.flatnonzero(np.diff(digitized, prepend=digitized[0] - 1) != 0)
+    starts = np.concatenate((np.arange(_frequency_start_bin_index), _frequency_start_bin_index + run_starts))
+    counts = np.diff(np.append(starts, len(_digitized)))
+    return starts, counts
+
+def _bin_variable(bin_map, variable):
+    """Averages the points of each bin of a bin map from _get_bin_map, along the last axis of variable."""
+    if bin_map is None:
         return variable
-    else:
-        first_part = variable[:_frequency_start_bin_index]
-        second_part = [[] for kk in _bin_edges]
-        for kk in range(_frequency_start_bin_index, len(variable)):
-            digitized_kk = _digitized[kk]
-            second_part[digitized_kk].append(variable[kk])
-        second_part = [kk for kk in second_part if len(kk) > 0]
-        second_part = [np.average(kk) for kk in second_part]
-        return np.append(first_part, second_part)
-    
-# TODO: scipy.welch will be faster than np.fft
+    starts, counts = bin_map
+    return np.add.reduceat(variable, starts, axis=-1) / counts
+
+
 class PowerSpectrum:
     """
     Calculates the power spectrum of a voltage signal.
 
+    Each trace is split into Welch segments, which are windowed and Fourier-transformed, and the segment
+    spectra are averaged. Only the running mean and variance of the trace spectra are kept, so memory does
+    not grow with the number of traces. add_data averages all traces equally, and update_data exponentially
+    forgets old traces, with the new trace weighted as one of num_of_averages traces by default.
+
     Args:
         num_of_samples: int, number of samples per trace
         time_resolution: float, error signal time resolution in s.
         max_points_per_decade: int or None. If int, it averages points if the points are denser than
             the set value.
+        segment_length: int or None, number of samples per Welch segment. Default None uses the whole trace.
+        overlap: int or None, number of samples that neighboring segments overlap. Default None overlaps
+            half of a segment.
+        window: str, window of the segments, see scipy.signal.get_window. Default "boxcar" (no window).
 
     Properties:
         f: np.array, frequency axis for Fourier-transformed data.
@@ -51,49 +72,108 @@ class PowerSpectrum:
         voltage_spectrum: ndarray, voltage noise spectrum
         relative_voltage_spectrum: ndarray, voltage noise spectrum divided by average voltage
         power_spectrum: ndarray, power noise spectrum
+        power_spectrum_variance: ndarray, variance of the power noise spectra of the traces
         relative_power_spectrum: ndarray, power noise spectrum divided by average voltage squared
     """
-    def __init__(self, num_of_samples: int, time_resolution: float, max_points_per_decade: int = None):
+    def __init__(
+        self,
+        num_of_samples: int,
+        time_resolution: float,
+        max_points_per_decade: int = None,
+        segment_length: int = None,
+        overlap: int = None,
+        window: str = "boxcar",
+    ):
         self._num_of_samples = num_of_samples
         self._time_resolution = time_resolution
         self._max_points_per_decade = max_points_per_decade
-        self._duration = time_resolution * self._num_of_samples
+        if segment_length is None:
+            segment_length = num_of_samples
+        if overlap is None:
+            overlap = segment_length // 2
+        if segment_length > num_of_samples or not 0 <= overlap < segment_length:
+            raise ValueError("Segments must be shorter than the trace, and overlap less than one segment.")
+        self._segment_length = segment_length
+        self._segment_step = segment_length - overlap
+        self._window = get_window(window, segment_length)
+        self._windowed = np.any(self._window != 1)
+        # one-sided power spectral density of a windowed segment.
+        self._scale = 2 * time_resolution / np.sum(self._window ** 2)
+        self._duration = time_resolution * segment_length
         self._frequencies = self._calculate_frequencies()
-        self._error_signal_avgs = []
-        self._power_spectrums = []
-        self._last_updated_index = -1
+        self._num_of_averages = 0
+        self._error_signal_average = 0.0
+        self._power_spectrum_mean = np.zeros(len(self._frequencies))
+        self._power_spectrum_variance = np.zeros(len(self._frequencies))
+        # increased by each new trace, so that subclasses can cache values calculated from the spectrum.
+        self._generation = 0
+        self._bin_map = None
         if max_points_per_decade != None:
             self._bin_edges, self._digitized, self._frequency_start_bin_index = _get_bin_start(self._max_points_per_decade, self._frequencies)
+            self._bin_map = _get_bin_map(self._frequency_start_bin_index, self._digitized)
+
+    def _accumulate(self, error_signal, weight):
+        """
+        Adds a trace to the running mean and variance (Welford's update), with weight of the new trace.
+
+        Returns the power spectrum of the trace.
+        """
+        power_spectrum = self._voltages_to_power_spectrum(error_signal)
+        delta = power_spectrum - self._power_spectrum_mean
+        self._power_spectrum_mean += weight * delta
+        self._power_spectrum_variance = (1 - weight) * (self._power_spectrum_variance + weight * delta ** 2)
+        self._error_signal_average += weight * (np.add.reduce(error_signal) / len(error_signal) - self._error_signal_average)
+        self._generation += 1
+        return power_spectrum
 
     def add_data(self, error_signal):
-        self._power_spectrums.append(self._voltages_to_power_spectrum(error_signal))
-        self._error_signal_avgs.append(np.average(error_signal))
+        self._num_of_averages += 1
+        self._accumulate(error_signal, 1 / self._num_of_averages)
+
+    def update_data(self, error_signal, weight: float = None):
+        """
+        Replaces old traces exponentially.
 
-    def update_data(self, error_signal):
-        index_to_update = self._last_updated_index + 1
-        if index_to_update == len(self._error_signal_avgs):
-            index_to_update = 0
-        self._power_spectrums[index_to_update] = self._voltages_to_power_spectrum(error_signal)
-        self._error_signal_avgs[index_to_update] = np.average(error_signal)
-        self._last_updated_index = index_to_update
+        weight: float or None, weight of the new trace. Default None uses 1 / num_of_averages.
+        """
+        if self._num_of_averages == 0:
+            # not add_data, which subclasses override with a different signature.
+            self._num_of_averages = 1
+            self._accumulate(error_signal, 1)
+            return
+        if weight is None:
+            weight = 1 / self._num_of_averages
+        self._accumulate(error_signal, weight)
 
     def _calculate_frequencies(self): 
         """
         Calculates the frequencies at which we will find the spectrum. 
         """
-        frequencies = np.fft.fftfreq(self._num_of_samples, self._time_resolution) 
-        self.fft_mask = frequencies > 0
-        f = frequencies[self.fft_mask]
+        frequencies = np.fft.rfftfreq(self._segment_length, self._time_resolution)
+        # the Nyquist frequency of even segment lengths is excluded, the same as positive frequencies of np.fft.fftfreq.
+        self._frequency_slice = slice(1, (self._segment_length + 1) // 2)
+        f = frequencies[self._frequency_slice]
         return f
 
+    def _fourier_transform(self, voltage_traces):
+        """
+        Fourier transforms of the windowed segments of traces, in an array of shape (..., segments, frequencies).
+        """
+        voltage_traces = np.asarray(voltage_traces, dtype=float)
+        if voltage_traces.shape[-1] == self._segment_length:
+            segments = voltage_traces[..., np.newaxis, :]
+        else:
+            segments = sliding_window_view(voltage_traces, self._segment_length, axis=-1)[..., ::self._segment_step, :]
+        if self._windowed:
+            segments = segments * self._window
+        return np.fft.rfft(segments, axis=-1)[..., self._frequency_slice]
+
     def _voltages_to_power_spectrum(self, voltage_trace): 
         """
-        Calculate the power spectrum of one trace worth of data.
+        Calculate the power spectrum of one trace worth of data, averaged over its segments.
         """
-        V_T = voltage_trace / np.sqrt(self._duration)
-        V_f = np.fft.fft(V_T) * self._time_resolution
-        W_V_calculated = np.abs(V_f) ** 2
-        W_V = 2 * W_V_calculated[self.fft_mask] 
+        V_f = self._fourier_transform(voltage_trace)
+        W_V = self._scale * np.add.reduce(V_f.real ** 2 + V_f.imag ** 2, axis=-2) / V_f.shape[-2]
         return W_V 
 
     @property
@@ -101,26 +181,33 @@ class PowerSpectrum:
         if self._max_points_per_decade == None:
             return self._frequencies
         else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, self._frequencies)
+            return _bin_variable(self._bin_map, self._frequencies)
 
     @property
     def num_of_averages(self):
-        return len(self._error_signal_avgs)
+        return self._num_of_averages
 
     @property
     def error_signal_average(self):
-        return np.average(self._error_signal_avgs)
+        return self._error_signal_average
     
     @property
     def power_spectrum(self):
         if self._max_points_per_decade == None:
-            return np.mean(self._power_spectrums, axis=0)
+            return self._power_spectrum_mean.copy()
+        else:
+            return _bin_variable(self._bin_map, self._power_spectrum_mean)
+
+    @property
+    def power_spectrum_variance(self):
+        if self._max_points_per_decade == None:
+            return self._power_spectrum_variance.copy()
         else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, np.mean(self._power_spectrums, axis=0))
+            return _bin_variable(self._bin_map, self._power_spectrum_variance)
     
     @property
     def relative_power_spectrum(self):
-        return self.power_spectrum / self.error_signal_average ** 2
+        return self.power_spectrum / np.asarray(self.error_signal_average)[..., np.newaxis] ** 2
 
     @property
     def voltage_spectrum(self):
@@ -128,99 +215,143 @@ class PowerSpectrum:
     
     @property
     def relative_voltage_spectrum(self):
-        return self.voltage_spectrum / np.abs(self.error_signal_average)
+        return self.voltage_spectrum / np.abs(np.asarray(self.error_signal_average)[..., np.newaxis])
 
 
-class CCedPowerSpectrum:
-    def __init__(self, num_of_samples: int, time_resolution: float, max_points_per_decade: int = None):
-        self._num_of_samples = num_of_samples
-        self._time_resolution = time_resolution
-        self._max_points_per_decade = max_points_per_decade
-        self._duration = time_resolution * self._num_of_samples
-        self._frequencies = self._calculate_frequencies()
-        self._error_signal_1_avgs = []
-        self._error_signal_2_avgs = []
-        self._power_spectrums = []
-        self._error_signal_1_power_spectrum = []
-        self._error_signal_2_power_spectrum = []
-        self._last_updated_index = -1
-        if self._max_points_per_decade != None:
-            self._bin_edges, self._digitized, self._frequency_start_bin_index = _get_bin_start(self._max_points_per_decade, self._frequencies)
+class CrossSpectrum(PowerSpectrum):
+    """
+    Calculates the cross spectral density matrix of several voltage signals.
 
-    def add_data(self, error_signal_1, error_signal_2):
-        self._power_spectrums.append(self._voltages_to_power_spectrum(error_signal_1, error_signal_2))
-        self._error_signal_1_power_spectrum.append(self.single_voltage_to_power_spectrum(error_signal_1))
-        self._error_signal_2_power_spectrum.append(self.single_voltage_to_power_spectrum(error_signal_2))
-        self._error_signal_1_avgs.append(np.average(error_signal_1))
-        self._error_signal_2_avgs.append(np.average(error_signal_2))
-
-    def update_data(self, error_signal_1, error_signal_2):
-        index_to_update = self._last_updated_index + 1
-        if index_to_update == len(self._error_signal_1_avgs):
-            index_to_update = 0
-        self._power_spectrums[index_to_update] = self._voltages_to_power_spectrum(error_signal_1, error_signal_2)
-        self._error_signal_1_power_spectrum[index_to_update] = self.single_voltage_to_power_spectrum(error_signal_1)
-        self._error_signal_2_power_spectrum[index_to_update] = self.single_voltage_to_power_spectrum(error_signal_2)
-        self._error_signal_1_avgs[index_to_update] = np.average(error_signal_1)
-        self._error_signal_2_avgs[index_to_update] = np.average(error_signal_2)
-        self._last_updated_index = index_to_update
+    The traces of all channels are Fourier-transformed together, and the cross spectra of all channel
+    pairs are averaged in the same running mean. Power spectra (auto spectra), cross spectra, and
+    coherence are all calculated from the averaged matrix. Segments, windows, add_data and update_data
+    are the same as PowerSpectrum.
 
-    def _calculate_frequencies(self): 
+    Args:
+        num_of_channels: int, number of signals.
+        num_of_samples: int, number of samples per trace
+        time_resolution: float, error signal time resolution in s.
+        max_points_per_decade: int or None. If int, it averages points if the points are denser than
+            the set value.
+        segment_length: int or None, number of samples per Welch segment. Default None uses the whole trace.
+        overlap: int or None, number of samples that neighboring segments overlap.
+        window: str, window of the segments, see scipy.signal.get_window.
+
+    Properties:
+        f: np.array, frequency axis for Fourier-transformed data.
+        num_of_averages: int, number of traces calculated
+        error_signal_average: ndarray, average voltage of each channel
+        csd: ndarray, complex cross spectral density matrix, in shape (channels, channels, frequencies).
+        power_spectrum: ndarray, power noise spectrum of each channel, in shape (channels, frequencies).
+        Other properties of PowerSpectrum are also calculated for each channel.
+    """
+    def __init__(
+        self,
+        num_of_channels: int,
+        num_of_samples: int,
+        time_resolution: float,
+        max_points_per_decade: int = None,
+        segment_length: int = None,
+        overlap: int = None,
+        window: str = "boxcar",
+    ):
+        super().__init__(num_of_samples, time_resolution, max_points_per_decade, segment_length, overlap, window)
+        self._num_of_channels = num_of_channels
+        num_of_frequencies = len(self._frequencies)
+        self._error_signal_average = np.zeros(num_of_channels)
+        self._power_spectrum_mean = np.zeros((num_of_channels, num_of_frequencies))
+        self._power_spectrum_variance = np.zeros((num_of_channels, num_of_frequencies))
+        self._csd_mean = np.zeros((num_of_channels, num_of_channels, num_of_frequencies), dtype=complex)
+
+    def _accumulate(self, error_signals, weight):
         """
-        Calculates the frequencies at which we will find the spectrum. 
+        Adds traces of all channels, in shape (channels, samples), to the running means.
+
+        Returns the cross spectral density matrix of the traces.
         """
-        frequencies = np.fft.fftfreq(self._num_of_samples, self._time_resolution) 
-        self.fft_mask = frequencies > 0
-        f = frequencies[self.fft_mask]
-        return f
+        error_signals = np.asarray(error_signals, dtype=float)
+        if error_signals.shape[0] != self._num_of_channels:
+            raise ValueError(f"Traces of {self._num_of_channels} channels are expected.")
+        V_f = self._fourier_transform(error_signals)
+        csd = self._scale * np.einsum("ksf,lsf->klf", V_f.conj(), V_f) / V_f.shape[-2]
+        self._csd_mean += weight * (csd - self._csd_mean)
+        power_spectrum = np.einsum("kkf->kf", csd).real
+        delta = power_spectrum - self._power_spectrum_mean
+        self._power_spectrum_mean += weight * delta
+        self._power_spectrum_variance = (1 - weight) * (self._power_spectrum_variance + weight * delta ** 2)
+        self._error_signal_average += weight * (np.mean(error_signals, axis=-1) - self._error_signal_average)
+        self._generation += 1
+        return csd
+
+    @property
+    def error_signal_average(self):
+        return self._error_signal_average.copy()
 
-    def _voltages_to_power_spectrum(self, voltage_trace_1, voltage_trace_2): 
+    @property
+    def csd(self):
+        if self._max_points_per_decade == None:
+            return self._csd_mean.copy()
+        else:
+            return _bin_variable(self._bin_map, self._csd_mean)
+
+    def cross_spectrum(self, channel_1: int, channel_2: int):
         """
-        Calculate cross correlated power spectrum of two signals
+        Complex cross spectrum, the average of conj(V_1(f)) * V_2(f).
         """
-        V_T_1 = voltage_trace_1 / np.sqrt(self._duration)
-        V_T_2 = voltage_trace_2 / np.sqrt(self._duration)
-        V_f_1 = np.fft.fft(V_T_1) * self._time_resolution
-        V_f_2 = np.fft.fft(V_T_2) * self._time_resolution
-        W_V_calculated = np.conjugate(V_f_1) * V_f_2
-        W_V = 2 * W_V_calculated[self.fft_mask] 
-        return W_V 
-    
-    def single_voltage_to_power_spectrum(self, voltage_trace):
+        if self._max_points_per_decade == None:
+            return self._csd_mean[channel_1, channel_2].copy()
+        else:
+            return _bin_variable(self._bin_map, self._csd_mean[channel_1, channel_2])
+
+    def coherence(self, channel_1: int, channel_2: int):
         """
-        Calculate the power spectrum of one trace worth of data.
+        Magnitude-squared coherence of two channels, between 0 and 1.
         """
-        V_T = voltage_trace / np.sqrt(self._duration)
-        V_f = np.fft.fft(V_T) * self._time_resolution
-        W_V_calculated = np.abs(V_f) ** 2
-        W_V = 2 * W_V_calculated[self.fft_mask] 
-        return W_V 
+        cross_spectrum = self.cross_spectrum(channel_1, channel_2)
+        power_spectrum = self.power_spectrum
+        return np.abs(cross_spectrum) ** 2 / (power_spectrum[channel_1] * power_spectrum[channel_2])
 
-    @property
-    def f(self):
-        if self._max_points_per_decade == None:
-            return self._frequencies
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, self._frequencies)
 
-    @property
-    def num_of_averages(self):
-        return len(self._error_signal_1_avgs)
+class CCedPowerSpectrum(CrossSpectrum):
+    """
+    Calculates the cross-correlated power spectrum of two voltage signals, and the power spectrum of each signal.
+
+    Both signals are Fourier-transformed once per trace, see CrossSpectrum.
+    """
+    def __init__(
+        self,
+        num_of_samples: int,
+        time_resolution: float,
+        max_points_per_decade: int = None,
+        segment_length: int = None,
+        overlap: int = None,
+        window: str = "boxcar",
+    ):
+        super().__init__(2, num_of_samples, time_resolution, max_points_per_decade, segment_length, overlap, window)
+
+    def add_data(self, error_signal_1, error_signal_2):
+        super().add_data((error_signal_1, error_signal_2))
+
+    def update_data(self, error_signal_1, error_signal_2, weight: float = None):
+        super().update_data((error_signal_1, error_signal_2), weight)
+
+    def single_voltage_to_power_spectrum(self, voltage_trace):
+        """
+        Calculate the power spectrum of one trace worth of data.
+        """
+        return self._voltages_to_power_spectrum(voltage_trace)
 
     @property
     def error_signal_1_average(self):
-        return np.average(self._error_signal_1_avgs)
+        return self._error_signal_average[0]
     
     @property
     def error_signal_2_average(self):
-        return np.average(self._error_signal_2_avgs)
+        return self._error_signal_average[1]
     
     @property
     def cc_power_spectrum(self):
-        if self._max_points_per_decade == None:
-            return np.mean(self._power_spectrums, axis=0)
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, np.mean(self._power_spectrums, axis=0))
+        return self.cross_spectrum(0, 1)
 
     @property
     def cc_voltage_spectrum(self):
@@ -233,13 +364,14 @@ class CCedPowerSpectrum:
     @property
     def cc_relative_voltage_spectrum(self):
         return np.sqrt(self.cc_relative_power_spectrum)
+
+    @property
+    def cc_coherence(self):
+        return self.coherence(0, 1)
    
     @property
     def signal_1_power_spectrum(self):
-        if self._max_points_per_decade == None:
-            np.mean(self._error_signal_1_power_spectrum, axis=0)
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, np.mean(self._error_signal_1_power_spectrum, axis=0))
+        return self.power_spectrum[0]
     
     @property
     def signal_1_relative_power_spectrum(self):
@@ -255,10 +387,7 @@ class CCedPowerSpectrum:
    
     @property
     def signal_2_power_spectrum(self):
-        if self._max_points_per_decade == None:
-            return np.mean(self._error_signal_2_power_spectrum, axis=0)
-        else:
-            return _get_binned_variable(self._max_points_per_decade, self._frequency_start_bin_index, self._bin_edges, self._digitized, np.mean(self._error_signal_2_power_spectrum, axis=0))
+        return self.power_spectrum[1]
     
     @property
     def signal_2_relative_power_spectrum(self):
@@ -271,4 +400,3 @@ class CCedPowerSpectrum:
     @property
     def signal_2_relative_voltage_spectrum(self):
         return np.sqrt(self.signal_2_relative_power_spectrum)
-
@@ -0,0 +1,80 @@
+"""Benchmarks the log-binning of power spectra.
+
+Compares the bin map binning of PowerSpectrum (np.add.reduceat over precomputed bin starts) against
+the previous binning, which grouped the points of each bin in Python lists on every access,
+and checks that both give the same binned spectra.
+
+Run as a script:
+    python -m onix.analysis.power_spectrum_benchmark
+"""
+import time
+
+import numpy as np
+
+from onix.analysis.laser_linewidth import LaserLinewidth
+from onix.analysis.power_spectrum import _bin_variable
+
+# (number of samples per trace, max points per decade)
+BENCHMARK_CASES = [(1000, 200), (30000, 200), (100000, 50)]
+
+
+def _list_binned_variable(_frequency_start_bin_index, _bin_edges, _digitized, variable):
+    """Previous binning, kept as the reference."""
+    first_part = variable[:_frequency_start_bin_index]
+    second_part = [[] for kk in _bin_edges]
+    for kk in range(_frequency_start_bin_index, len(variable)):
+        digitized_kk = _digitized[kk]
+        second_part[digitized_kk].append(variable[kk])
+    second_part = [kk for kk in second_part if len(kk) > 0]
+    second_part = [np.average(kk) for kk in second_part]
+    return np.append(first_part, second_part)
+
+
+def _time(function, repeats):
+    start = time.perf_counter()
+    for kk in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def benchmark(repeats=20):
+    """Runs the benchmark and returns the results.
+
+    Args:
+        repeats: int, number of times each binning is timed.
+
+    Returns:
+        dict, keys are (number of samples, max points per decade), and values are dicts of the mean
+        binning time in s of the "list" and "bin_map" binning, and whether the binned spectra are "equal".
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for num_of_samples, max_points_per_decade in BENCHMARK_CASES:
+        laser = LaserLinewidth(num_of_samples, 2e-6, 4.2e-5, max_points_per_decade)
+        for kk in range(10):
+            laser.add_data(rng.normal(0, 1e-3, num_of_samples))
+        spectrum = laser._power_spectrum_mean
+
+        def bin_list():
+            return _list_binned_variable(
+                laser._frequency_start_bin_index, laser._bin_edges, laser._digitized, spectrum
+            )
+
+        def bin_map():
+            return _bin_variable(laser._bin_map, spectrum)
+
+        results[(num_of_samples, max_points_per_decade)] = {
+            "list": _time(bin_list, repeats),
+            "bin_map": _time(bin_map, repeats),
+            "equal": np.allclose(bin_list(), bin_map(), rtol=1e-12, atol=0),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for (num_of_samples, max_points_per_decade), result in benchmark().items():
+        print(
+            f"{num_of_samples:>7} samples, {max_points_per_decade:>4} points per decade: "
+            f"list {result['list'] * 1e3:8.3f} ms, bin map {result['bin_map'] * 1e3:8.3f} ms, "
+            f"speedup {result['list'] / result['bin_map']:6.0f}x, equal: {result['equal']}"
+        )
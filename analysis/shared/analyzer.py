@@ -4,11 +4,29 @@ from uncertainties import unumpy
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
 import datetime
+import hashlib
+import inspect
+import json
+import os
+import sys
+import warnings
+import pandas as pd
 
 from onix.units import ureg, Q_
-from onix.data_tools import get_experiment_data_from_edf, get_experiment_data
-from onix.analysis.shared.fitter import get_fitter, two_peak_gaussian, cosx
+from onix.data_tools import (
+    data_folder,
+    copy_headers,
+    get_experiment_data_from_edf,
+    get_experiment_data,
+    get_lazy_experiment_data,
+    get_lazy_experiment_data_from_edf,
+    get_processed_data,
+    register_derived_cache,
+    save_processed_data,
+)
+from onix.analysis.shared.fitter import BatchFitter, get_fitter, fit_cosx_linear, two_peak_gaussian, cosx
 from onix.helpers import present_float
 
 # RAW DATA DICTIONARY KEYS
@@ -22,6 +40,26 @@ I_DOT_X_A = 1.48
 I_DOT_X_B = 0.75
 I_DOT_X_C = 0.05
 
+# PHASE SCAN
+PHASE_SCAN_LIST = ["lf", "ramsey", "phase"]
+PHASE_FIT_METHODS = ["linear", "nonlinear"]
+
+# PARALLEL ANALYSIS
+PARALLEL_MIN_EDFS = 256  # fewer EDFs are analyzed serially
+PARALLEL_MIN_CHUNK_SIZE = 64
+OPTICAL_FIT_CACHE_SIZE = 10000  # number of EDF fit results cached in the main process
+_OPTICAL_FIT_CACHE = {}  # data cache key: (a1, a2, headers)
+register_derived_cache(_OPTICAL_FIT_CACHE)
+_PROCESS_POOL = None
+_PROCESS_POOL_WORKERS = None
+_ANALYSIS_CODE_HASH = None
+
+# TIME SERIES CACHE
+ANALYSIS_VERSION = 1  # increase to invalidate cached time series results
+TIME_SERIES_CACHE_FOLDER = os.path.join(data_folder, "processed", "time_series")
+CACHE_SAVE_PACKETS = 256  # number of packets analyzed between cache saves
+CACHE_JSON_ITEMSIZE = 1024  # characters saved for header values of the cache that are saved as JSON strings
+
 # VALUES TO SAVE IN ANALYSIS FILES (ALSO USED FOR MASKS)
 HEADER_LOC = {
     # FORMAT:
@@ -69,19 +107,20 @@ class OpticalAnalysis:
         normalized: if true normalizes the transmission with monitors photodiode data; output is a single array
         optical_depth: if true returns -log(transmission)
         use_data_number: if true uses the edf_number as the data number.
+        use_cache: if true keeps the loaded data in the data cache of this process.
         TODO: fix bugs when optical_depth false.
         TODO: implement when electric field off.
     """
-    def __init__(self, edf_number: int, normalized: bool = True, optical_depth: bool = True, use_data_number: bool = False):
+    def __init__(self, edf_number: int, normalized: bool = True, optical_depth: bool = True, use_data_number: bool = False, use_cache: bool = True):
         if optical_depth == False:
             raise NotImplementedError("optical depth = False not implemented")
 
         self._edf_number = edf_number
         self._optical_depth = optical_depth
         if not use_data_number:
-            self._data, self._headers = get_experiment_data_from_edf(self._edf_number)
+            self._data, self._headers = get_experiment_data_from_edf(self._edf_number, use_cache=use_cache)
         else:
-            self._data, self._headers = get_experiment_data(self._edf_number)
+            self._data, self._headers = get_experiment_data(self._edf_number, use_cache=use_cache)
         self._detunings = self._data["detunings_MHz"]
         self._optical_depths = self.get_optical_spectrum()
         
@@ -116,9 +155,9 @@ class OpticalAnalysis:
         detect = unumpy.uarray(detect_avg, detect_err)
         return detect
 
-    def fit_optical_spectrum(self, p0user: dict = None):
+    def get_fit_p0_and_bounds(self, p0user: dict = None):
         """
-        Fit the optical spectrum to two gaussians.
+        Initial guess and bounds of the two gaussian fit.
         """
         # initial fit guess
         field_plate = self._headers["params"]["field_plate"]
@@ -149,7 +188,13 @@ class OpticalAnalysis:
             "sigma2": [0, (max_detuning - min_detuning)],
             "c": [-np.inf, np.inf],
         }
+        return p0, bounds
 
+    def fit_optical_spectrum(self, p0user: dict = None):
+        """
+        Fit the optical spectrum to two gaussians.
+        """
+        p0, bounds = self.get_fit_p0_and_bounds(p0user)
         fitter = get_fitter(
             two_peak_gaussian, 
             self._detunings, 
@@ -201,14 +246,149 @@ class OpticalAnalysis:
 
 
 
+def fit_optical_spectra(optical_analyses: list, p0user: dict = None):
+    """
+    Fit the optical spectra of many OpticalAnalysis objects to two gaussians at once.
+    Spectra sharing the same detunings are fitted together by a BatchFitter.
+    Returns arrays of a1 and a2 in the order of optical_analyses. a1 and a2 of fits that did not converge are NaN.
+    """
+    groups = {}
+    for kk, optical_data in enumerate(optical_analyses):
+        groups.setdefault(optical_data._detunings.tobytes(), []).append(kk)
+
+    a1s = np.full(len(optical_analyses), np.nan)
+    a2s = np.full(len(optical_analyses), np.nan)
+    num_not_converged = 0
+    for indices in groups.values():
+        p0s_and_bounds = [optical_analyses[kk].get_fit_p0_and_bounds(p0user) for kk in indices]
+        p0 = {name: np.array([p0_kk[name] for p0_kk, _ in p0s_and_bounds]) for name in p0s_and_bounds[0][0]}
+        bounds = p0s_and_bounds[0][1]
+        optical_depths = np.array([optical_analyses[kk]._optical_depths for kk in indices])
+
+        fitter = BatchFitter(two_peak_gaussian)
+        fitter.set_absolute_sigma(False)
+        fitter.set_data(
+            optical_analyses[indices[0]]._detunings,
+            unumpy.nominal_values(optical_depths),
+            unumpy.std_devs(optical_depths),
+        )
+        fitter.set_p0(p0)
+        for bound_var, bound in bounds.items():
+            fitter.set_bounds(bound_var, bound[0], bound[1])
+        fitter.fit()
+        converged = fitter.converged
+        indices = np.array(indices)
+        a1s[indices[converged]] = fitter.results["a1"][converged]
+        a2s[indices[converged]] = fitter.results["a2"][converged]
+        num_not_converged += np.count_nonzero(~converged)
+    if num_not_converged > 0:
+        warnings.warn(f"{num_not_converged} of {len(optical_analyses)} optical spectrum fits did not converge, and their a1 and a2 are NaN.")
+    return a1s, a2s
+
+
+def _fit_optical_peaks_chunk(edf_numbers, use_data_number: bool = False, use_cache: bool = True):
+    """
+    Load and fit one chunk of EDFs. Work unit of get_optical_fit_peaks, also run in worker processes.
+    Worker processes run it with use_cache False, so that each worker does not fill its own data cache.
+    """
+    optical_analyses = [
+        OpticalAnalysis(edf_number, use_data_number=use_data_number, use_cache=use_cache)
+        for edf_number in edf_numbers
+    ]
+    a1s, a2s = fit_optical_spectra(optical_analyses)
+    headers = [optical_data._headers for optical_data in optical_analyses]
+    return a1s, a2s, headers
+
+
+def _get_process_pool(max_workers: int = None):
+    """
+    Get the process pool shared by all analyses, so that worker processes are reused.
+    """
+    global _PROCESS_POOL, _PROCESS_POOL_WORKERS
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if _PROCESS_POOL is None or _PROCESS_POOL_WORKERS != max_workers:
+        if _PROCESS_POOL is not None:
+            _PROCESS_POOL.shutdown()
+        _PROCESS_POOL = ProcessPoolExecutor(max_workers=max_workers)
+        _PROCESS_POOL_WORKERS = max_workers
+    return _PROCESS_POOL
+
+
+def _optical_fit_cache_key(edf_number: int, use_data_number: bool = False) -> tuple:
+    """
+    Key of the data of an EDF, which changes when the EDF is run again or its file is changed.
+    """
+    if use_data_number:
+        return get_lazy_experiment_data(int(edf_number), mmap=False).cache_key()
+    return get_lazy_experiment_data_from_edf(int(edf_number), mmap=False).cache_key()
+
+
+def get_optical_fit_peaks(edf_numbers, use_data_number: bool = False, chunk_size: int = 1000, progress: bool = False, max_workers: int = None):
+    """
+    Get a1, a2 and headers of many EDFs with fit_optical_spectra.
+    EDFs are loaded and fitted in chunks so that the raw data of all EDFs is not kept in memory.
+    With PARALLEL_MIN_EDFS or more EDFs the chunks are analyzed in a process pool, and results are kept in order.
+    Fit results are cached in this process by the data file of each EDF, and only EDFs that are not cached
+    are loaded. data_tools.clear_cache also clears the fit results. Returned headers are copies.
+    max_workers: number of worker processes. Default None uses all cores. If 1, runs serially.
+    """
+    edf_numbers = np.asarray(edf_numbers)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # fit results are cached in this process only, so only EDFs that are not cached are sent to workers.
+    keys = [_optical_fit_cache_key(edf_number, use_data_number) for edf_number in edf_numbers]
+    results = [_OPTICAL_FIT_CACHE.get(key) for key in keys]
+    missing = np.array([kk for kk, result in enumerate(results) if result is None], dtype=int)
+    missing_edf_numbers = edf_numbers[missing]
+    parallel = max_workers > 1 and len(missing_edf_numbers) >= PARALLEL_MIN_EDFS
+    if parallel:
+        # several chunks per worker to balance the load, but large enough for efficient batch fits.
+        chunk_size = min(chunk_size, max(PARALLEL_MIN_CHUNK_SIZE, int(np.ceil(len(missing_edf_numbers) / (4 * max_workers)))))
+    chunk_starts = range(0, len(missing_edf_numbers), chunk_size)
+    chunks = [missing_edf_numbers[start:start + chunk_size] for start in chunk_starts]
+
+    if parallel:
+        pool = _get_process_pool(max_workers)
+        chunk_results = pool.map(
+            _fit_optical_peaks_chunk, chunks, [use_data_number] * len(chunks), [False] * len(chunks)
+        )
+    else:
+        chunk_results = (_fit_optical_peaks_chunk(chunk, use_data_number) for chunk in chunks)
+    if progress:
+        chunk_results = tqdm(chunk_results, total=len(chunks))
+
+    for start, (a1s_chunk, a2s_chunk, headers_chunk) in zip(chunk_starts, chunk_results):
+        for kk, a1, a2, headers_kk in zip(missing[start:start + chunk_size], a1s_chunk, a2s_chunk, headers_chunk):
+            results[kk] = (a1, a2, headers_kk)
+            _OPTICAL_FIT_CACHE[keys[kk]] = results[kk]
+    while len(_OPTICAL_FIT_CACHE) > OPTICAL_FIT_CACHE_SIZE:
+        # dicts keep insertion order, so this removes the oldest entry.
+        _OPTICAL_FIT_CACHE.pop(next(iter(_OPTICAL_FIT_CACHE)))
+
+    if len(results) == 0:
+        return np.array([]), np.array([]), []
+    a1s = np.array([result[0] for result in results])
+    a2s = np.array([result[1] for result in results])
+    # copies, so that changing the headers does not change the cache.
+    headers = [copy_headers(result[2]) for result in results]
+    return a1s, a2s, headers
+
+
+
 
 class ScanAnalysis:
     # TODO: change name; not necessarily "frequency" related
-    def __init__(self, edf_numbers: list | np.ndarray | tuple, use_data_number: bool = False):
+    def __init__(self, edf_numbers: list | np.ndarray | tuple, use_data_number: bool = False, batch_fit: bool = True, phase_fit: str = "linear"):
         """
         Takes list, array or tuple of edf_numbers. If two valued tuple, considers entire range between two values.
         Data_
+        batch_fit: if true fits all optical spectra together with fit_optical_spectra.
+        phase_fit: "linear" fits phase scans with the exact linear least-squares solution (fit_cosx_linear),
+            "nonlinear" fits with curve_fit. Both give the same minimum.
         """
+        if phase_fit not in PHASE_FIT_METHODS:
+            raise ValueError(f"phase_fit must be one of {PHASE_FIT_METHODS}.")
         if isinstance(edf_numbers, list):
             edf_numbers = np.array(edf_numbers)
         elif isinstance(edf_numbers, np.ndarray):
@@ -221,14 +401,36 @@ class ScanAnalysis:
         # shave down edf_numbers to acceptable range (0 to len-len%packet_size)
         self._edf_numbers = edf_numbers #[0:len(data_numbers) - len(data_numbers) % data_packet_size]
         self._use_data_number = use_data_number
+        self._batch_fit = batch_fit
+        self._phase_fit = phase_fit
  
         self._optical_depths_pi_m1, self._optical_depths_pi_p1, self._headers = self.get_fits()
 
+    @classmethod
+    def from_fits(cls, edf_numbers: np.ndarray, a1s: np.ndarray, a2s: np.ndarray, headers: list, use_data_number: bool = False, phase_fit: str = "linear"):
+        """
+        Construct from optical depth fits that are already computed, e.g. by get_optical_fit_peaks.
+        """
+        if phase_fit not in PHASE_FIT_METHODS:
+            raise ValueError(f"phase_fit must be one of {PHASE_FIT_METHODS}.")
+        scan_analysis = cls.__new__(cls)
+        scan_analysis._edf_numbers = np.array(edf_numbers)
+        scan_analysis._use_data_number = use_data_number
+        scan_analysis._batch_fit = True
+        scan_analysis._phase_fit = phase_fit
+        scan_analysis._optical_depths_pi_m1 = np.array(a1s)
+        scan_analysis._optical_depths_pi_p1 = np.array(a2s)
+        scan_analysis._headers = list(headers)
+        return scan_analysis
+
     def get_fits(self):
         """
         Obtain optical depth fits of edf_numbers list. Returns optical depths for + and -.
         Note a1 corresponds to freq < 0, a2 corresponds to freq > 0.
         """
+        if self._batch_fit:
+            return get_optical_fit_peaks(self._edf_numbers, self._use_data_number)
+
         a1s = []
         a2s = []
         headers = []
@@ -272,15 +474,28 @@ class ScanAnalysis:
         return np.array(xaxis) * unit
     
     ## FOR PHASE SCAN
-    def fit_phase_scan(self):
+    def get_phase_scan_axis(self):
         """
-        Specifically fit a phase scan.
+        Get the scanned phases in rad.
         """
-        scan_list = ["lf", "ramsey", "phase"]
+        scan_list = PHASE_SCAN_LIST
         if scan_list[0] == scan_list[1]:
             raise ValueError("This is not a phase scanned data number range.")
-        
+
         xaxis = self.get_list_from_header(scan_list)
+        if isinstance(xaxis, Q_):
+            xaxis = xaxis.magnitude
+        return xaxis
+
+    def fit_phase_scan(self):
+        """
+        Specifically fit a phase scan.
+        """
+        xaxis = self.get_phase_scan_axis()
+        if self._phase_fit == "linear":
+            results, _ = fit_cosx_linear(xaxis, np.array([self._optical_depths_pi_m1, self._optical_depths_pi_p1]))
+            phi_pi_m1, phi_pi_p1 = self.wrap_phase(results["x0"])
+            return phi_pi_m1, phi_pi_p1
 
         fitter = get_fitter(
             cosx, 
@@ -311,14 +526,17 @@ class ScanAnalysis:
         freq_center = phi0 / (2 * np.pi * ramsey_time) + probe_freq
         return freq_center
     
-    def get_frequency_center(self):
+    def get_frequency_center(self, phases: tuple = None):
         """
         Get frequency center from phase scan.
+        phases: (phi_pi_m1, phi_pi_p1) if the phase scan is already fitted, e.g. by fit_phase_scans_linear.
         """
         ramsey_params = self._headers[0]["params"]["lf"]["ramsey"]
         probe_freq = ramsey_params["center_frequency"] + ramsey_params["detuning"] + ramsey_params["Sigma"]*ramsey_params["Zeeman_shift_along_b"]
         ramsey_time = ramsey_params["wait_time"] + ramsey_params["piov2_time"]
-        phi_pi_m1, phi_pi_p1 = self.fit_phase_scan()
+        if phases is None:
+            phases = self.fit_phase_scan()
+        phi_pi_m1, phi_pi_p1 = phases
         f_pi_m1 = self.phase_to_frequency(phi_pi_m1, ramsey_time, probe_freq)
         f_pi_p1 = self.phase_to_frequency(phi_pi_p1, ramsey_time, probe_freq)
         return f_pi_m1.to("Hz").magnitude, f_pi_p1.to("Hz").magnitude, self._headers[0]
@@ -364,13 +582,102 @@ class ScanAnalysis:
 
 
 
+def _analysis_code_hash():
+    """
+    Hash of the source code that computes time series results, used to invalidate cached results when it changes.
+    """
+    global _ANALYSIS_CODE_HASH
+    if _ANALYSIS_CODE_HASH is None:
+        sources = [repr(HEADER_LOC)]
+        analysis_objects = [
+            sys.modules[BatchFitter.__module__],
+            sys.modules[get_experiment_data.__module__],  # data loading
+            OpticalAnalysis,
+            fit_optical_spectra,
+            _fit_optical_peaks_chunk,
+            get_optical_fit_peaks,
+            ScanAnalysis,
+            fit_phase_scans_linear,
+            TimeSeriesAnalysis._analyze_packets,
+            _to_cache_columns,  # format of the cached results
+            _from_cache_column,
+        ]
+        for obj in analysis_objects:
+            try:
+                sources.append(inspect.getsource(obj))
+            except (OSError, TypeError):
+                sources.append(getattr(obj, "__qualname__", getattr(obj, "__name__", "")))
+        _ANALYSIS_CODE_HASH = hashlib.sha256("".join(sources).encode()).hexdigest()
+    return _ANALYSIS_CODE_HASH
+
+
+def _json_default(value):
+    if isinstance(value, Q_):
+        value = value.magnitude
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} cannot be saved in the time series cache.")
+
+
+def _is_cache_scalar(value) -> bool:
+    return isinstance(value, (int, float, bool, np.integer, np.floating, np.bool_))
+
+
+def _to_cache_columns(block_data: dict) -> tuple[dict, dict]:
+    """
+    HEADER_LOC columns of the time series cache. Columns with values other than numbers (e.g. lists of chasm
+    amplitudes) are saved as JSON strings, as the table format only saves scalar columns.
+    Returns the columns and the min_itemsize of the JSON columns.
+    """
+    columns = {}
+    min_itemsize = {}
+    for name in HEADER_LOC:
+        values = block_data[name]
+        if all(_is_cache_scalar(value) for value in values):
+            columns[name] = values
+        else:
+            columns[name] = [json.dumps(value, default=_json_default) for value in values]
+            min_itemsize[name] = CACHE_JSON_ITEMSIZE
+    return columns, min_itemsize
+
+
+def _from_cache_column(column: pd.Series) -> list:
+    """Inverse of _to_cache_columns for one column."""
+    return [json.loads(value) if isinstance(value, str) else value for value in column]
+
+
+def fit_phase_scans_linear(scan_analyses: list):
+    """
+    Fit the phase scans of many ScanAnalysis objects with a single fit_cosx_linear call.
+    All scans must have the same number of EDFs. Returns wrapped phase arrays for Pi = -1 and Pi = +1.
+    """
+    if len(scan_analyses) == 0:
+        return np.array([]), np.array([])
+    xaxes = np.array([scan_analysis.get_phase_scan_axis() for scan_analysis in scan_analyses])
+    xaxes = np.concatenate((xaxes, xaxes))
+    optical_depths = np.concatenate((
+        [scan_analysis._optical_depths_pi_m1 for scan_analysis in scan_analyses],
+        [scan_analysis._optical_depths_pi_p1 for scan_analysis in scan_analyses],
+    ))
+    results, _ = fit_cosx_linear(xaxes, optical_depths)
+    phases = scan_analyses[0].wrap_phase(results["x0"])
+    return phases[:len(scan_analyses)], phases[len(scan_analyses):]
+
+
 class TimeSeriesAnalysis:
     # TODO: get_scanned_data output compatible with saving/loading data sets
     # TODO: 
-    def __init__(self, edf_numbers: list | np.ndarray | tuple, data_packet_size: int = 8, use_data_number: bool = False):
+    def __init__(self, edf_numbers: list | np.ndarray | tuple, data_packet_size: int = 8, use_data_number: bool = False, batch_fit: bool = True, phase_fit: str = "linear", max_workers: int = None, use_cache: bool = True):
         """
         Compute time series phase fits, then plot time series center frequencies and perform T-violation calculation (computing Z, W).
+        batch_fit: if true fits the optical spectra of all EDFs together with get_optical_fit_peaks.
+        phase_fit: "linear" or "nonlinear", see ScanAnalysis. If "linear" and batch_fit, the phase scans of all
+            data packets are fitted together with fit_phase_scans_linear.
+        max_workers: number of processes to load and fit EDFs with if batch_fit. Default None uses all cores.
+        use_cache: if true, packet results are saved in TIME_SERIES_CACHE_FOLDER and only new packets are analyzed.
         """
+        if phase_fit not in PHASE_FIT_METHODS:
+            raise ValueError(f"phase_fit must be one of {PHASE_FIT_METHODS}.")
         if isinstance(edf_numbers, list):
             edf_numbers = np.array(edf_numbers)
         elif isinstance(edf_numbers, np.ndarray):
@@ -386,6 +693,10 @@ class TimeSeriesAnalysis:
         self._edf_numbers = edf_numbers[0:len(edf_numbers) - len(edf_numbers) % data_packet_size]
         self._data_packet_size = data_packet_size
         self._use_data_number = use_data_number
+        self._batch_fit = batch_fit
+        self._phase_fit = phase_fit
+        self._max_workers = max_workers
+        self._use_cache = use_cache
 
         # Break down data numbers into groups of data packets with size data_packet_size
         self._edf_numbers_list = [edf_numbers[i:i+data_packet_size] for i in range(0, len(self._edf_numbers), data_packet_size)]
@@ -419,6 +730,24 @@ class TimeSeriesAnalysis:
     def get_scanned_data(self):
         """
         Get time domain data using the frequency center analysis from ScanAnalysis with phase scans.
+        If use_cache, only data packets that are not in the cache are analyzed.
+        """
+        if self._use_cache:
+            data = self._get_cached_packet_data()
+        else:
+            data = self._analyze_packets(self._edf_numbers_list)
+
+        # Convert to ndarray and add units back
+        for Pi in self._pis:
+            data["f"][Pi] = np.array(data["f"][Pi])
+        for name in HEADER_LOC.keys():
+            data[name] = np.array(data[name]) #* units[name] (leaving units off for now)
+
+        return data
+
+    def _analyze_packets(self, edf_numbers_list):
+        """
+        Analyze data packets. Returns the frequency centers and header values of each packet in lists.
         """
 
         # Prepare dictionary to save data
@@ -429,12 +758,30 @@ class TimeSeriesAnalysis:
             data[name] = []
             units[name] = 1
 
+        # Fit the optical spectra and the phase scans of all data packets at once
+        if self._batch_fit:
+            edf_numbers = np.concatenate(edf_numbers_list) if len(edf_numbers_list) > 0 else np.array([], dtype=int)
+            a1s, a2s, headers = get_optical_fit_peaks(edf_numbers, self._use_data_number, progress=True, max_workers=self._max_workers)
+            scan_analyses = []
+            for kk, edf_numbers_packet in enumerate(edf_numbers_list):
+                packet = slice(kk * self._data_packet_size, (kk + 1) * self._data_packet_size)
+                scan_analyses.append(ScanAnalysis.from_fits(edf_numbers_packet, a1s[packet], a2s[packet], headers[packet], self._use_data_number, self._phase_fit))
+            if self._phase_fit == "linear":
+                phases = list(zip(*fit_phase_scans_linear(scan_analyses)))
+            else:
+                phases = [None] * len(scan_analyses)
+        else:
+            scan_analyses = (
+                ScanAnalysis(edf_numbers_packet, self._use_data_number, batch_fit=False, phase_fit=self._phase_fit)
+                for edf_numbers_packet in tqdm(edf_numbers_list)
+            )
+            phases = [None] * len(edf_numbers_list)
+
         # Append values from ScanAnalysis to dictionary for each data packet of size data_packet_size
-        for edf_numbers_packet in tqdm(self._edf_numbers_list):
+        for scan_analysis, phases_packet in zip(scan_analyses, phases):
 
             # Get frequency centers and headers for each phase scan of a data packet
-            scan_analysis = ScanAnalysis(edf_numbers_packet, self._use_data_number)
-            f_pi_m1, f_pi_p1, header = scan_analysis.get_frequency_center()
+            f_pi_m1, f_pi_p1, header = scan_analysis.get_frequency_center(phases_packet)
 
             # Append Pi+ and Pi- frequency centers to data dictionary
             data["f"]["+1"].append(f_pi_p1)
@@ -450,12 +797,60 @@ class TimeSeriesAnalysis:
                     units[name] = unit
                 data[name].append(quantity_from_header)
 
-        # Convert to ndarray and add units back
-        for Pi in self._pis:
-            data["f"][Pi] = np.array(data["f"][Pi])
-        for name in header_loc.keys():
-            data[name] = np.array(data[name]) #* units[name] (leaving units off for now)
+        return data
+
+    def _cache_directory(self):
+        """
+        Folder of cached packet results. Each analysis version, analysis code and set of analysis parameters
+        uses its own folder, so changing any of them invalidates the cache.
+        """
+        params = {
+            "data_packet_size": self._data_packet_size,
+            "use_data_number": self._use_data_number,
+            "batch_fit": self._batch_fit,
+            "phase_fit": self._phase_fit,
+        }
+        key = hashlib.sha256((json.dumps(params, sort_keys=True) + _analysis_code_hash()).encode()).hexdigest()[:16]
+        return os.path.join(TIME_SERIES_CACHE_FOLDER, f"v{ANALYSIS_VERSION}_{key}") + os.sep
 
+    def _get_cached_packet_data(self):
+        """
+        Load packet results from the cache, analyze packets that are not cached and save them to the cache.
+        New packets are saved every CACHE_SAVE_PACKETS packets, so an interrupted analysis resumes where it stopped.
+        """
+        if len(self._edf_numbers_list) == 0:
+            return self._analyze_packets([])
+        directory = self._cache_directory()
+        os.makedirs(directory, exist_ok=True)
+        first_edf_numbers = [int(edf_numbers_packet[0]) for edf_numbers_packet in self._edf_numbers_list]
+        cached = get_processed_data(min(first_edf_numbers), max(first_edf_numbers), directory)
+
+        new_packets = []
+        for first_edf_number, edf_numbers_packet in zip(first_edf_numbers, self._edf_numbers_list):
+            if first_edf_number not in cached.index or cached.loc[first_edf_number, "edf_number_last"] != edf_numbers_packet[-1]:
+                new_packets.append(edf_numbers_packet)
+
+        for start in range(0, len(new_packets), CACHE_SAVE_PACKETS):
+            block = new_packets[start:start + CACHE_SAVE_PACKETS]
+            block_data = self._analyze_packets(block)
+            header_columns, min_itemsize = _to_cache_columns(block_data)
+            block_frame = pd.DataFrame(
+                {
+                    "edf_number_last": [int(edf_numbers_packet[-1]) for edf_numbers_packet in block],
+                    "f+1": block_data["f"]["+1"],
+                    "f-1": block_data["f"]["-1"],
+                    **header_columns,
+                },
+                index=[int(edf_numbers_packet[0]) for edf_numbers_packet in block],
+            )
+            save_processed_data(block_frame, directory, min_itemsize=min_itemsize)
+            cached = pd.concat((cached, block_frame))
+        cached = cached[~cached.index.duplicated(keep="last")]
+
+        rows = cached.loc[first_edf_numbers]
+        data = {"f": {"+1": list(rows["f+1"]), "-1": list(rows["f-1"])}}
+        for name in HEADER_LOC:
+            data[name] = _from_cache_column(rows[name])
         return data
 
     def _append_Z(self):
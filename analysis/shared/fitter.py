@@ -5,12 +5,16 @@ from scipy.optimize import curve_fit as _curve_fit
 from onix.helpers import present_float
 from typing import Union, Iterable, Callable, Tuple, Annotated, Any, Dict, List
 
-__all__ = ["Fitter"]
+__all__ = ["Fitter", "BatchFitter", "FitModel", "register_model", "get_model"]
 
 
 class Fitter:
     """Wraps scipy.optimize.curve_fit.
 
+    If the fit function is registered with register_model (all fit functions in this module are),
+    its analytic Jacobian is passed to curve_fit, and parameters without user set p0 values
+    are estimated from the data.
+
     Example:
         fitter = Fitter(fit_function)
         fitter.set_data(xdata, ydata, ydata_err)
@@ -18,9 +22,13 @@ class Fitter:
         print(fitter.all_results_str())
     """
 
-    def __init__(self, fit_function, array_compatible=True):
+    def __init__(self, fit_function, array_compatible=True, use_model_registry=True):
         self._fit_kwargs = {"xdata": None, "ydata": None, "sigma": None}
-        if array_compatible:
+        if use_model_registry:
+            self._model = get_model(fit_function)
+        else:
+            self._model = None
+        if array_compatible or self._model is not None:
             self._fit_kwargs["f"] = fit_function
         else:
             self._fit_kwargs["f"] = self._wrap_array_noncompatible_function(fit_function)
@@ -28,6 +36,7 @@ class Fitter:
 
         self._fit_kwargs["absolute_sigma"] = True
         self._p0 = {}
+        self._p0_user_set = set()
         self._nicknames = {}
         self._units = {}
         self._lower_bounds = {}
@@ -121,6 +130,7 @@ class Fitter:
                 if name not in self._p0:
                     raise ValueError(f"Parameter {name} is not defined.")
                 self._p0[name] = p0[name]
+                self._p0_user_set.add(name)
         elif isinstance(p0, (list, _np.ndarray)):
             if isinstance(p0, _np.ndarray) and p0.ndim != 1:
                 raise ValueError("Dimension of p0 must be 1.")
@@ -128,10 +138,33 @@ class Fitter:
                 raise ValueError(f"p0 must have a length of {len(self.parameters)}.")
             for kk, value in enumerate(p0):
                 self._p0[self.parameters[kk]] = value
+            self._p0_user_set.update(self.parameters)
         else:
             raise TypeError("p0 must be a dict, a list, or an array.")
         self._update_p0_kwargs()
 
+    def estimate_p0(self):
+        """Estimates p0 of parameters not set by set_p0 from the data.
+
+        Only works if the fit function is registered with a p0 estimator. Estimated values are
+        moved inside the bounds.
+        """
+        if self._model is None or self._model.p0_estimator is None:
+            return
+        if self._fit_kwargs["xdata"] is None or self._fit_kwargs["ydata"] is None:
+            raise Exception("xdata and ydata are not defined.")
+        if self._fit_kwargs["xdata"].ndim != 1 or len(self._fit_kwargs["xdata"]) == 0:
+            return
+        try:
+            estimates = self._model.p0_estimator(self._fit_kwargs["xdata"], self._fit_kwargs["ydata"])
+        except (ValueError, IndexError, _np.linalg.LinAlgError):
+            return
+        for name, value in estimates.items():
+            if name in self._p0_user_set or not _np.isfinite(value):
+                continue
+            self._p0[name] = float(_np.clip(value, self._lower_bounds[name], self._upper_bounds[name]))
+        self._update_p0_kwargs()
+
     def _update_bounds_kwargs(self):
         lower_bounds = []
         upper_bounds = []
@@ -175,9 +208,12 @@ class Fitter:
         Keyword arguments are passed to the scipy.optimize.curve_fit function.
         """
         try:
+            self.estimate_p0()
             fit_kwargs = self._fit_kwargs.copy()
             if fit_kwargs["sigma"] is None:
                 fit_kwargs["absolute_sigma"] = False
+            if self._model is not None and self._model.jacobian is not None and "jac" not in kwargs:
+                fit_kwargs["jac"] = self._model.jacobian
             self._opt, cov = _curve_fit(**fit_kwargs, **kwargs)
             self._err = _np.sqrt(_np.diag(cov))
         except RuntimeError as e:
@@ -297,7 +333,271 @@ class Fitter:
         if deg_of_freedom == 0:
             raise Exception("Degree of freedom is 0. Cannot calculate reduced chi square.")
         return _np.sum(_np.power(studentized_residuals, 2)) / deg_of_freedom
-    
+
+
+class BatchFitter:
+    """Fits many data sets that share the same x-axis data at once.
+
+    Uses a Levenberg-Marquardt least-squares fit vectorised over the data sets, so
+    the parameters are a (N, len(parameters)) array. Fit functions with an analytic
+    Jacobian (see jacobian_function) use it, and other fit functions use a forward
+    difference Jacobian. Results and errors are computed the same way as Fitter.
+
+    Example:
+        fitter = BatchFitter(two_peak_gaussian)
+        fitter.set_data(xdata, ydata, ydata_err)  # ydata has shape (N, len(xdata)).
+        fitter.set_p0({"f1": f1_guesses, "f2": 2.0})  # arrays of length N or floats.
+        fitter.fit()
+        print(fitter.results["a1"])  # array of length N.
+    """
+
+    def __init__(self, fit_function, jacobian=None):
+        self._fit_function = fit_function
+        if jacobian is None:
+            jacobian = jacobian_function(fit_function)
+        self._jacobian = jacobian
+        self.parameters = _getfullargspec(fit_function).args[1:]
+        self._xdata = None
+        self._ydata = None
+        self._sigma = None
+        self._absolute_sigma = True
+        self._p0 = {name: 1.0 for name in self.parameters}
+        self._lower_bounds = {name: -_np.inf for name in self.parameters}
+        self._upper_bounds = {name: _np.inf for name in self.parameters}
+
+        self._opt = None
+        self._err = None
+        self._cov = None
+        self.converged = None
+        self.chi_squares = None
+
+    @property
+    def fit_function(self):
+        """Fit function."""
+        return self._fit_function
+
+    @property
+    def number_of_data_sets(self):
+        """Number of data sets N."""
+        if self._ydata is None:
+            return 0
+        return self._ydata.shape[0]
+
+    def set_data(self, xdata, ydata, sigma=None):
+        """Sets fitting data.
+
+        Args:
+            xdata: 1D array of floats, x-axis data shared by all data sets.
+            ydata: 2D array of floats with shape (N, len(xdata)), y-axis data of N data sets.
+            sigma: 2D array of floats with the same shape as ydata, y-axis data uncertainties.
+                Default None. If None, weights on all data points are the same, and the reduced
+                chi-square is set to 1 to estimate fitting errors.
+        """
+        xdata = _np.asarray(xdata, dtype=float)
+        ydata = _np.asarray(ydata, dtype=float)
+        if xdata.ndim != 1:
+            raise ValueError("xdata must be a 1D array.")
+        if ydata.ndim == 1:
+            ydata = ydata[_np.newaxis, :]
+        if ydata.ndim != 2 or ydata.shape[1] != len(xdata):
+            raise ValueError("ydata must have a shape of (N, len(xdata)).")
+        if sigma is not None:
+            sigma = _np.broadcast_to(_np.asarray(sigma, dtype=float), ydata.shape)
+        self._xdata = xdata
+        self._ydata = ydata
+        self._sigma = sigma
+
+    def set_absolute_sigma(self, absolute_sigma):
+        """Sets whether the uncertainties are absolute. See Fitter.set_absolute_sigma."""
+        self._absolute_sigma = absolute_sigma
+
+    def set_p0(self, p0):
+        """Sets fitting parameter default values.
+
+        Args:
+            p0: dict, keys are the parameter names and values are floats or arrays of length N.
+        """
+        if not isinstance(p0, dict):
+            raise TypeError("p0 must be a dict.")
+        for name in p0:
+            if name not in self._p0:
+                raise ValueError(f"Parameter {name} is not defined.")
+            self._p0[name] = p0[name]
+
+    def set_bounds(self, name, lower_bound=-_np.inf, upper_bound=_np.inf):
+        """Sets fitting bounds of a parameter. The bounds are shared by all data sets."""
+        if name not in self.parameters:
+            raise ValueError(f"Parameter {name} is not defined.")
+        self._lower_bounds[name] = lower_bound
+        self._upper_bounds[name] = upper_bound
+
+    def _p0_array(self):
+        p0 = _np.empty((self.number_of_data_sets, len(self.parameters)))
+        for kk, name in enumerate(self.parameters):
+            p0[:, kk] = self._p0[name]
+        return p0
+
+    def _model(self, params):
+        """Evaluates the fit function for params of shape (n, len(parameters)). Returns (n, M)."""
+        return self._fit_function(self._xdata, *[params[:, [kk]] for kk in range(params.shape[1])])
+
+    def _model_jacobian(self, params, model):
+        """Returns the Jacobian of the fit function with shape (n, M, len(parameters))."""
+        if self._jacobian is not None:
+            jac = self._jacobian(self._xdata, *[params[:, [kk]] for kk in range(params.shape[1])])
+            return _np.broadcast_to(jac, model.shape + (params.shape[1],))
+        jac = _np.empty(model.shape + (params.shape[1],))
+        for kk in range(params.shape[1]):
+            step = _np.sqrt(_np.finfo(float).eps) * _np.maximum(_np.abs(params[:, kk]), 1.0)
+            shifted = params.copy()
+            shifted[:, kk] += step
+            jac[:, :, kk] = (self._model(shifted) - model) / step[:, _np.newaxis]
+        return jac
+
+    def fit(self, max_iterations=1000, ftol=1e-8, xtol=1e-8):
+        """Fits all data sets.
+
+        Args:
+            max_iterations: int, maximum number of Levenberg-Marquardt iterations.
+            ftol: float, relative reduction of chi-square for convergence.
+            xtol: float, relative parameter change for convergence.
+
+        Sets converged, which is True only for the data sets that met ftol or xtol, and chi_squares.
+        """
+        if self._xdata is None or self._ydata is None:
+            raise Exception("xdata and ydata are not defined.")
+        lower = _np.array([self._lower_bounds[name] for name in self.parameters], dtype=float)
+        upper = _np.array([self._upper_bounds[name] for name in self.parameters], dtype=float)
+        params = self._p0_array()
+        if _np.any(params < lower) or _np.any(params > upper):
+            raise ValueError("p0 is outside of the bounds.")
+        # keeps parameters strictly inside the bounds, the same as the scipy trf method.
+        margin = 1e-10 * _np.maximum(1.0, _np.abs(_np.where(_np.isfinite(lower), lower, upper)))
+        lower_inner = lower + _np.where(_np.isfinite(lower), margin, 0.0)
+        upper_inner = upper - _np.where(_np.isfinite(upper), margin, 0.0)
+        params = _np.clip(params, lower_inner, upper_inner)
+
+        if self._sigma is None:
+            weights = _np.ones_like(self._ydata)
+        else:
+            weights = 1 / self._sigma
+
+        n_sets = self.number_of_data_sets
+        n_params = len(self.parameters)
+        damping = _np.full(n_sets, 1e-2)
+        converged = _np.zeros(n_sets, dtype=bool)
+        stalled = _np.zeros(n_sets, dtype=bool)
+        model = self._model(params)
+        chi_squares = _np.sum(((self._ydata - model) * weights) ** 2, axis=1)
+        active = _np.arange(n_sets)
+        for _ in range(max_iterations):
+            if len(active) == 0:
+                break
+            p = params[active]
+            w = weights[active]
+            residuals = (self._ydata[active] - model[active]) * w
+            jac = self._model_jacobian(p, model[active]) * w[:, :, _np.newaxis]
+            jtj = _np.einsum("nmi,nmj->nij", jac, jac)
+            jtr = _np.einsum("nmi,nm->ni", jac, residuals)
+            diagonal = _np.diagonal(jtj, axis1=1, axis2=2)
+            diagonal = _np.maximum(diagonal, 1e-12 * _np.max(diagonal, axis=1, keepdims=True) + 1e-300)
+            lhs = jtj + (damping[active, _np.newaxis] * diagonal)[:, :, _np.newaxis] * _np.eye(n_params)
+            step = _batched_solve(lhs, jtr)
+            new_p = p + _truncate_step(p, step, lower, upper)
+            new_model = self._model(new_p)
+            new_chi_squares = _np.sum(((self._ydata[active] - new_model) * w) ** 2, axis=1)
+
+            accepted = new_chi_squares <= chi_squares[active]
+            accepted_index = active[accepted]
+            relative_reduction = (chi_squares[accepted_index] - new_chi_squares[accepted]) / _np.maximum(
+                chi_squares[accepted_index], 1e-300
+            )
+            relative_step = _np.max(
+                _np.abs(new_p[accepted] - p[accepted]) / (_np.abs(p[accepted]) + xtol), axis=1
+            )
+            params[accepted_index] = new_p[accepted]
+            model[accepted_index] = new_model[accepted]
+            chi_squares[accepted_index] = new_chi_squares[accepted]
+            damping[accepted_index] = _np.maximum(damping[accepted_index] / 10, 1e-10)
+            damping[active[~accepted]] *= 10
+            converged[accepted_index[(relative_reduction < ftol) | (relative_step < xtol)]] = True
+            # a step cannot be found even with very large damping. The fit is stopped, but it is not
+            # converged, as it may be stuck away from the minimum.
+            stalled[active[~accepted & (damping[active] > 1e10)]] = True
+            active = active[~converged[active] & ~stalled[active]]
+
+        jac = self._model_jacobian(params, model) * weights[:, :, _np.newaxis]
+        cov = _np.linalg.pinv(_np.einsum("nmi,nmj->nij", jac, jac))
+        absolute_sigma = self._absolute_sigma and self._sigma is not None
+        if not absolute_sigma:
+            deg_of_freedom = len(self._xdata) - n_params
+            if deg_of_freedom > 0:
+                cov = cov * (chi_squares / deg_of_freedom)[:, _np.newaxis, _np.newaxis]
+            else:
+                cov = _np.full_like(cov, _np.inf)
+        self._opt = params
+        self._cov = cov
+        with _np.errstate(invalid="ignore"):
+            self._err = _np.sqrt(_np.diagonal(cov, axis1=1, axis2=2))
+        self.converged = converged
+        self.chi_squares = chi_squares
+
+    def _param_array_to_dict(self, variable_array):
+        return {param: variable_array[:, kk] for kk, param in enumerate(self.parameters)}
+
+    @property
+    def results(self):
+        """Fitting results. Each value is an array of length N."""
+        if self._opt is None:
+            raise Exception("Fitting results are not generated")
+        return self._param_array_to_dict(self._opt)
+
+    @property
+    def errors(self):
+        """Fitting errors. Each value is an array of length N."""
+        if self._err is None:
+            raise Exception("Fitting errors are not generated")
+        return self._param_array_to_dict(self._err)
+
+    @property
+    def covariances(self):
+        """Covariance matrices of the fitted parameters with shape (N, len(parameters), len(parameters))."""
+        return self._cov
+
+    def fitted_value(self, x, index):
+        """Returns fitted value of data set index at x."""
+        if self._opt is None:
+            raise Exception("Fitting results are not generated")
+        return self._fit_function(x, *self._opt[index])
+
+    @property
+    def reduced_chis(self):
+        """Reduced chi-squares of all data sets. Not defined if y-axis errors are not provided."""
+        if self._sigma is None:
+            raise Exception("sigma is not defined.")
+        deg_of_freedom = len(self._xdata) - len(self.parameters)
+        if deg_of_freedom == 0:
+            raise Exception("Degree of freedom is 0. Cannot calculate reduced chi square.")
+        return self.chi_squares / deg_of_freedom
+
+
+def _truncate_step(params, step, lower, upper, fraction=0.5):
+    """Shortens the steps so that the parameters stay strictly inside the bounds."""
+    with _np.errstate(divide="ignore", invalid="ignore"):
+        room = _np.where(step > 0, (upper - params) / step, (lower - params) / step)
+    room = _np.where(_np.isfinite(room) & (step != 0), room, _np.inf)
+    scale = _np.minimum(1.0, fraction * _np.min(room, axis=1))
+    return step * scale[:, _np.newaxis]
+
+
+def _batched_solve(a, b):
+    """Solves a stack of linear equations a x = b. Falls back to least squares for singular matrices."""
+    try:
+        return _np.linalg.solve(a, b[..., _np.newaxis])[..., 0]
+    except _np.linalg.LinAlgError:
+        return _np.einsum("nij,nj->ni", _np.linalg.pinv(a), b)
+
+
 def get_fitter(function: Callable, xs: _np.ndarray, ys: _np.ndarray, 
                errs: _np.ndarray = None, p0: Iterable = None, 
                bounds: Iterable = None, maxfev: int = 10000, set_absolute_sigma: bool = False):
@@ -374,4 +674,304 @@ def cosx(x: Union[float, _np.ndarray], a: float, x0: float, b: float, c: float)
     """
     Power law with factor.
     """
-    return a * _np.cos(x - x0) + b * x + c
\ No newline at end of file
+    return a * _np.cos(x - x0) + b * x + c
+
+
+def _stack_partials(*partials):
+    """Broadcasts partial derivatives together and stacks them along the last axis."""
+    return _np.stack(_np.broadcast_arrays(*partials), axis=-1)
+
+
+def _gaussian0_partials(f, f0, a, sigma):
+    """Partial derivatives of gaussian0 with respect to f0, a, and sigma."""
+    exponential = _np.exp(-(f - f0) ** 2 / (2 * sigma ** 2))
+    d_f0 = a * exponential * (f - f0) / sigma ** 2
+    d_sigma = a * exponential * (f - f0) ** 2 / sigma ** 3
+    return d_f0, exponential, d_sigma
+
+
+def gaussian0_jacobian(f, f0, a, sigma):
+    """Jacobian of gaussian0."""
+    return _stack_partials(*_gaussian0_partials(f, f0, a, sigma))
+
+
+def gaussianC_jacobian(f, f0, a, sigma, c):
+    """Jacobian of gaussianC."""
+    return _stack_partials(*_gaussian0_partials(f, f0, a, sigma), _np.ones_like(f))
+
+
+def gaussianL_jacobian(f, f0, a, sigma, b, c):
+    """Jacobian of gaussianL."""
+    return _stack_partials(*_gaussian0_partials(f, f0, a, sigma), f, _np.ones_like(f))
+
+
+def two_peak_gaussian_jacobian(f, f1, f2, a1, a2, sigma1, sigma2, b, c):
+    """Jacobian of two_peak_gaussian."""
+    d_f1, d_a1, d_sigma1 = _gaussian0_partials(f, f1, a1, sigma1)
+    d_f2, d_a2, d_sigma2 = _gaussian0_partials(f, f2, a2, sigma2)
+    return _stack_partials(d_f1, d_f2, d_a1, d_a2, d_sigma1, d_sigma2, f, _np.ones_like(f))
+
+
+def four_peak_gaussian_jacobian(f, f1, f2, f3, f4, a1, a2, a3, a4, sigma1, sigma2, sigma3, sigma4, c):
+    """Jacobian of four_peak_gaussian."""
+    peaks = [
+        _gaussian0_partials(f, f0, a, sigma)
+        for f0, a, sigma in zip((f1, f2, f3, f4), (a1, a2, a3, a4), (sigma1, sigma2, sigma3, sigma4))
+    ]
+    d_f0s, d_as, d_sigmas = zip(*peaks)
+    return _stack_partials(*d_f0s, *d_as, *d_sigmas, _np.ones_like(f))
+
+
+def linear_jacobian(x, a, b):
+    """Jacobian of linear."""
+    return _stack_partials(x, _np.ones_like(x))
+
+
+def exp_decay_jacobian(t, tau, a):
+    """Jacobian of exp_decay."""
+    exponential = _np.exp(-t / tau)
+    return _stack_partials(a * exponential * t / tau ** 2, exponential - 1)
+
+
+def power_law_jacobian(x, p, a):
+    """Jacobian of power_law."""
+    power = x ** p
+    with _np.errstate(divide="ignore", invalid="ignore"):
+        d_p = _np.where(power != 0, a * power * _np.log(_np.abs(x)), 0.0)
+    return _stack_partials(d_p, power)
+
+
+def cosx_jacobian(x, a, x0, b, c):
+    """Jacobian of cosx."""
+    return _stack_partials(_np.cos(x - x0), a * _np.sin(x - x0), x, _np.ones_like(x))
+
+
+def _sorted_data(x, y):
+    """Returns 1D x and y data sorted by x."""
+    x = _np.asarray(x, dtype=float)
+    y = _np.asarray(y, dtype=float)
+    order = _np.argsort(x)
+    return x[order], y[order]
+
+
+def _edge_line(x, y, edge_fraction=0.1):
+    """Slope and intercept of a line through the data points near both ends of x."""
+    n_edge = max(1, int(len(x) * edge_fraction))
+    edges = _np.concatenate((_np.arange(n_edge), _np.arange(len(x) - n_edge, len(x))))
+    if len(_np.unique(x[edges])) < 2:
+        return 0.0, float(_np.median(y))
+    b, c = _np.polyfit(x[edges], y[edges], 1)
+    return b, c
+
+
+def _gaussian_peaks(x, y, number_of_peaks):
+    """Estimates (center, amplitude, sigma) of the largest peaks or dips in baseline-free data."""
+    y = y.copy()
+    x_range = x[-1] - x[0]
+    peaks = []
+    for _ in range(number_of_peaks):
+        index = int(_np.argmax(_np.abs(y)))
+        amplitude = y[index]
+        # width from the points above half maximum around the peak.
+        above = _np.abs(y) >= _np.abs(amplitude) / 2
+        left = index
+        while left > 0 and above[left - 1]:
+            left -= 1
+        right = index
+        while right < len(y) - 1 and above[right + 1]:
+            right += 1
+        sigma = (x[right] - x[left]) / 2.355
+        if sigma <= 0:
+            sigma = x_range / len(x)
+        peaks.append((x[index], amplitude, sigma))
+        y[_np.abs(x - x[index]) < 2 * sigma] = 0.0
+    return sorted(peaks, key=lambda peak: peak[0])
+
+
+def linear_p0(x, y):
+    """Initial parameters of linear."""
+    x, y = _sorted_data(x, y)
+    a, b = _np.polyfit(x, y, 1)
+    return {"a": a, "b": b}
+
+
+def gaussian0_p0(f, y):
+    """Initial parameters of gaussian0."""
+    f, y = _sorted_data(f, y)
+    ((f0, a, sigma),) = _gaussian_peaks(f, y, 1)
+    return {"f0": f0, "a": a, "sigma": sigma}
+
+
+def gaussianC_p0(f, y):
+    """Initial parameters of gaussianC."""
+    f, y = _sorted_data(f, y)
+    c = float(_np.median(y))
+    ((f0, a, sigma),) = _gaussian_peaks(f, y - c, 1)
+    return {"f0": f0, "a": a, "sigma": sigma, "c": c}
+
+
+def gaussianL_p0(f, y):
+    """Initial parameters of gaussianL."""
+    f, y = _sorted_data(f, y)
+    b, c = _edge_line(f, y)
+    ((f0, a, sigma),) = _gaussian_peaks(f, y - b * f - c, 1)
+    return {"f0": f0, "a": a, "sigma": sigma, "b": b, "c": c}
+
+
+def two_peak_gaussian_p0(f, y):
+    """Initial parameters of two_peak_gaussian."""
+    f, y = _sorted_data(f, y)
+    b, c = _edge_line(f, y)
+    (f1, a1, sigma1), (f2, a2, sigma2) = _gaussian_peaks(f, y - b * f - c, 2)
+    return {"f1": f1, "f2": f2, "a1": a1, "a2": a2, "sigma1": sigma1, "sigma2": sigma2, "b": b, "c": c}
+
+
+def four_peak_gaussian_p0(f, y):
+    """Initial parameters of four_peak_gaussian."""
+    f, y = _sorted_data(f, y)
+    c = float(_np.median(y))
+    peaks = _gaussian_peaks(f, y - c, 4)
+    p0 = {"c": c}
+    for kk, (f0, a, sigma) in enumerate(peaks):
+        p0[f"f{kk + 1}"] = f0
+        p0[f"a{kk + 1}"] = a
+        p0[f"sigma{kk + 1}"] = sigma
+    return p0
+
+
+def exp_decay_p0(t, y):
+    """Initial parameters of exp_decay."""
+    t, y = _sorted_data(t, y)
+    a = -y[-1]
+    # y reaches (1 - 1 / e) of its asymptotic value at t = tau.
+    reached = _np.nonzero(_np.abs(y) >= (1 - 1 / _np.e) * _np.abs(a))[0]
+    if a == 0 or len(reached) == 0 or t[reached[0]] <= 0:
+        tau = (t[-1] - t[0]) / 3
+    else:
+        tau = t[reached[0]]
+    return {"tau": tau, "a": a}
+
+
+def power_law_p0(x, y):
+    """Initial parameters of power_law."""
+    x, y = _sorted_data(x, y)
+    mask = (x > 0) & (y != 0)
+    if _np.count_nonzero(mask) < 2:
+        return {"p": 1.0, "a": 1.0}
+    sign = _np.sign(_np.median(y[mask]))
+    p, log_a = _np.polyfit(_np.log(x[mask]), _np.log(_np.abs(y[mask])), 1)
+    return {"p": p, "a": sign * _np.exp(log_a)}
+
+
+def cosx_p0(x, y):
+    """Initial parameters of cosx. They are the exact least-squares solution from fit_cosx_linear."""
+    results, _ = fit_cosx_linear(x, y)
+    return results
+
+
+def fit_cosx_linear(x, y):
+    """Fits cosx to many data sets at once by linear least squares.
+
+    cosx is linear in (a cos(x0), a sin(x0), b, c), so the least-squares solution is exact
+    and the same as the minimum found by a nonlinear fit. The fitted amplitude a is positive.
+    Errors are computed the same way as Fitter without y-axis uncertainties, where the reduced
+    chi-square is set to 1.
+
+    Example:
+        results, errors = fit_cosx_linear(phases, ydata)  # ydata has shape (N, len(phases)).
+        print(results["x0"], errors["x0"])  # arrays of length N.
+
+    Args:
+        x: array of floats with shape (M,) or (N, M), x-axis data.
+        y: array of floats with shape (M,) or (N, M), y-axis data.
+
+    Returns:
+        (results, errors), dicts with parameter names as keys. Values are floats if both x and y
+        are 1D, and arrays of length N otherwise.
+    """
+    x = _np.asarray(x, dtype=float)
+    y = _np.asarray(y, dtype=float)
+    single = x.ndim == 1 and y.ndim == 1
+    x, y = _np.broadcast_arrays(_np.atleast_2d(x), _np.atleast_2d(y))
+    n_points = x.shape[-1]
+    if n_points < 4:
+        raise ValueError("At least 4 data points are needed to fit cosx.")
+
+    design = _np.stack((_np.cos(x), _np.sin(x), x, _np.ones_like(x)), axis=-1)
+    normal_matrix = _np.einsum("nmi,nmj->nij", design, design)
+    inverse = _np.linalg.pinv(normal_matrix)
+    solution = _np.einsum("nij,nmj,nm->ni", inverse, design, y)
+    residuals = y - _np.einsum("nmi,ni->nm", design, solution)
+    if n_points > 4:
+        variance = _np.sum(residuals ** 2, axis=-1) / (n_points - 4)
+    else:
+        variance = _np.full(len(y), _np.inf)
+    cov = inverse * variance[:, _np.newaxis, _np.newaxis]
+
+    a_cos, a_sin, b, c = solution.T
+    a = _np.hypot(a_cos, a_sin)
+    var_cos = cov[:, 0, 0]
+    var_sin = cov[:, 1, 1]
+    cov_cos_sin = cov[:, 0, 1]
+    with _np.errstate(divide="ignore", invalid="ignore"):
+        a_err = _np.sqrt((a_cos ** 2 * var_cos + a_sin ** 2 * var_sin + 2 * a_cos * a_sin * cov_cos_sin) / a ** 2)
+        x0_err = _np.sqrt(
+            (a_sin ** 2 * var_cos + a_cos ** 2 * var_sin - 2 * a_cos * a_sin * cov_cos_sin) / a ** 4
+        )
+    results = {"a": a, "x0": _np.arctan2(a_sin, a_cos), "b": b, "c": c}
+    errors = {"a": a_err, "x0": x0_err, "b": _np.sqrt(cov[:, 2, 2]), "c": _np.sqrt(cov[:, 3, 3])}
+    if single:
+        results = {name: value[0] for name, value in results.items()}
+        errors = {name: value[0] for name, value in errors.items()}
+    return results, errors
+
+
+class FitModel:
+    """A fit function with its analytic Jacobian and initial parameter estimator.
+
+    Args:
+        function: fit function f(x, *params).
+        jacobian: function jac(x, *params) that returns the partial derivatives of the fit function
+            with the parameter axis last, or None.
+        p0_estimator: function p0(x, y) that returns a dict of initial parameters estimated from
+            the data, or None.
+    """
+
+    def __init__(self, function: Callable, jacobian: Callable = None, p0_estimator: Callable = None):
+        self.function = function
+        self.jacobian = jacobian
+        self.p0_estimator = p0_estimator
+
+
+_MODELS: Dict[Callable, FitModel] = {}
+
+
+def register_model(function: Callable, jacobian: Callable = None, p0_estimator: Callable = None) -> FitModel:
+    """Registers a fit function so that Fitter and BatchFitter use its Jacobian and p0 estimator."""
+    model = FitModel(function, jacobian, p0_estimator)
+    _MODELS[function] = model
+    return model
+
+
+def get_model(function: Callable) -> Union[FitModel, None]:
+    """Returns the registered FitModel of a fit function, or None if it is not registered."""
+    return _MODELS.get(function)
+
+
+register_model(linear, linear_jacobian, linear_p0)
+register_model(gaussian0, gaussian0_jacobian, gaussian0_p0)
+register_model(gaussianC, gaussianC_jacobian, gaussianC_p0)
+register_model(gaussianL, gaussianL_jacobian, gaussianL_p0)
+register_model(two_peak_gaussian, two_peak_gaussian_jacobian, two_peak_gaussian_p0)
+register_model(four_peak_gaussian, four_peak_gaussian_jacobian, four_peak_gaussian_p0)
+register_model(exp_decay, exp_decay_jacobian, exp_decay_p0)
+register_model(power_law, power_law_jacobian, power_law_p0)
+register_model(cosx, cosx_jacobian, cosx_p0)
+
+
+def jacobian_function(fit_function: Callable) -> Union[Callable, None]:
+    """Returns the analytic Jacobian of a registered fit function, or None if it is not available."""
+    model = get_model(fit_function)
+    if model is None:
+        return None
+    return model.jacobian
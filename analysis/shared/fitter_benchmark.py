@@ -0,0 +1,129 @@
+"""Benchmarks Fitter with and without the model registry.
+
+Fits simulated data of every registered model, and compares the fit time and the convergence
+rate of the registry path (analytic Jacobian and estimated p0) against plain curve_fit with
+finite difference Jacobians and p0 of 1.
+
+Run as a script:
+    python -m onix.analysis.shared.fitter_benchmark
+"""
+import time
+
+import numpy as np
+
+from onix.analysis.shared.fitter import (
+    Fitter,
+    linear,
+    gaussian0,
+    gaussianC,
+    gaussianL,
+    two_peak_gaussian,
+    four_peak_gaussian,
+    exp_decay,
+    power_law,
+    cosx,
+)
+
+# model: (xdata, function that returns random true parameters)
+BENCHMARK_CASES = {
+    linear: (np.linspace(-10, 10, 100), lambda rng: [rng.uniform(-2, 2), rng.uniform(-5, 5)]),
+    gaussian0: (
+        np.linspace(-20, 20, 200),
+        lambda rng: [rng.uniform(-10, 10), rng.uniform(0.5, 2), rng.uniform(1, 4)],
+    ),
+    gaussianC: (
+        np.linspace(-20, 20, 200),
+        lambda rng: [rng.uniform(-10, 10), rng.uniform(0.5, 2), rng.uniform(1, 4), rng.uniform(-1, 1)],
+    ),
+    gaussianL: (
+        np.linspace(-20, 20, 200),
+        lambda rng: [
+            rng.uniform(-10, 10), rng.uniform(0.5, 2), rng.uniform(1, 4),
+            rng.uniform(-0.02, 0.02), rng.uniform(-1, 1),
+        ],
+    ),
+    two_peak_gaussian: (
+        np.linspace(-20, 20, 200),
+        lambda rng: [
+            rng.uniform(-12, -5), rng.uniform(5, 12), -rng.uniform(0.5, 2), -rng.uniform(0.5, 2),
+            rng.uniform(1, 3), rng.uniform(1, 3), rng.uniform(-0.01, 0.01), rng.uniform(-0.5, 0.5),
+        ],
+    ),
+    four_peak_gaussian: (
+        np.linspace(-40, 40, 400),
+        lambda rng: [
+            -30 + rng.uniform(-3, 3), -10 + rng.uniform(-3, 3), 10 + rng.uniform(-3, 3), 30 + rng.uniform(-3, 3),
+            rng.uniform(0.5, 2), rng.uniform(0.5, 2), rng.uniform(0.5, 2), rng.uniform(0.5, 2),
+            rng.uniform(1, 3), rng.uniform(1, 3), rng.uniform(1, 3), rng.uniform(1, 3), rng.uniform(-0.5, 0.5),
+        ],
+    ),
+    exp_decay: (np.linspace(0, 10, 100), lambda rng: [rng.uniform(0.5, 5), rng.uniform(0.5, 3)]),
+    power_law: (np.linspace(0.1, 10, 100), lambda rng: [rng.uniform(-2, 2), rng.uniform(0.5, 3)]),
+    cosx: (
+        np.linspace(-np.pi, np.pi, 16),
+        lambda rng: [rng.uniform(0.5, 2), rng.uniform(-np.pi, np.pi), rng.uniform(-0.1, 0.1), rng.uniform(-1, 1)],
+    ),
+}
+
+
+def _fit_once(function, xdata, ydata, sigma, true_params, use_model_registry):
+    """Returns (fit time, whether the fit converged).
+
+    The fit is converged if its chi-square is not larger than the chi-square of the true parameters.
+    """
+    fitter = Fitter(function, use_model_registry=use_model_registry)
+    fitter.set_data(xdata, ydata, sigma)
+    start = time.perf_counter()
+    try:
+        fitter.fit(maxfev=10000)
+    except (RuntimeError, ValueError):
+        return time.perf_counter() - start, False
+    elapsed = time.perf_counter() - start
+    chi_square = np.sum(fitter.studentized_residuals() ** 2)
+    true_chi_square = np.sum(((ydata - function(xdata, *true_params)) / sigma) ** 2)
+    return elapsed, bool(chi_square <= true_chi_square * (1 + 1e-6))
+
+
+def benchmark(number_of_fits=100, noise=0.05, seed=0):
+    """Runs the benchmark and returns the results.
+
+    Args:
+        number_of_fits: int, number of simulated data sets for each model.
+        noise: float, standard deviation of the noise added to the simulated data.
+        seed: int, random number generator seed.
+
+    Returns:
+        dict, keys are model names, and values are dicts with the mean fit times and convergence
+        rates of the "registry" and "plain" paths.
+    """
+    rng = np.random.default_rng(seed)
+    results = {}
+    for function, (xdata, get_params) in BENCHMARK_CASES.items():
+        times = {"registry": [], "plain": []}
+        converged = {"registry": [], "plain": []}
+        for _ in range(number_of_fits):
+            true_params = get_params(rng)
+            ydata = function(xdata, *true_params) + rng.normal(0, noise, len(xdata))
+            sigma = np.full(len(xdata), noise)
+            for path, use_model_registry in (("registry", True), ("plain", False)):
+                elapsed, success = _fit_once(function, xdata, ydata, sigma, true_params, use_model_registry)
+                times[path].append(elapsed)
+                converged[path].append(success)
+        results[function.__name__] = {
+            path: {"time": np.mean(times[path]), "convergence": np.mean(converged[path])}
+            for path in times
+        }
+    return results
+
+
+if __name__ == "__main__":
+    results = benchmark()
+    print(f"{'model':<20}{'plain time':>14}{'registry time':>16}{'plain conv.':>14}{'registry conv.':>16}")
+    for name, result in results.items():
+        print(
+            f"{name:<20}"
+            f"{result['plain']['time'] * 1e3:>11.2f} ms"
+            f"{result['registry']['time'] * 1e3:>13.2f} ms"
+            f"{result['plain']['convergence']:>14.0%}"
+            f"{result['registry']['convergence']:>16.0%}"
+        )
@@ -6,6 +6,34 @@ from ._data_handler import (
     get_experiment_data,
     get_experiment_data_from_edf,
     get_persistent_data,
+    get_lazy_experiment_data,
+    get_lazy_experiment_data_from_edf,
+    get_experiment_headers,
+    get_experiment_headers_from_edf,
+    get_experiment_data_range,
+)
+from ._experiment_data import ExperimentData
+from ._cache import clear_cache, get_cache_stats, set_cache_size, register_derived_cache
+from ._header_format import (
+    HeaderDict,
+    copy_headers,
+    encode_headers,
+    decode_headers,
+    migrate_header_format,
+    migrate_experiment_header_format,
+)
+from ._data_path import (
+    get_last_expts_data_number,
+    data_folder,
+    DataNumberAllocator,
+    set_experiment_data_number_batch_size,
+    build_analysis_links,
+)
+from ._integrity import scan_data_folder, print_scan_report
+from ._header_index import query_data_numbers, get_indexed_params, backfill_header_index
+from ._process_data import (
+    get_processed_data,
+    save_processed_data,
+    compact_processed_data,
+    migrate_processed_data,
 )
-from ._data_path import get_last_expts_data_number, data_folder
-from ._process_data import (get_processed_data, save_processed_data)
@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+CACHE_MAX_BYTES = 1 << 30  # 1 GiB
+
+
+class _LRUCache:
+    """Thread-safe least recently used cache bounded by the total size of its values in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key: (value, number of bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self.evictions += 1
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests > 0 else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_data_cache = _LRUCache(CACHE_MAX_BYTES)
+_derived_caches = []  # caches of results computed from the data, see register_derived_cache.
+
+
+def register_derived_cache(cache: Any):
+    """Registers a cache of results computed from the data, which clear_cache also clears.
+
+    cache is an object with a clear method, e.g. a dict.
+    """
+    _derived_caches.append(cache)
+
+
+def clear_cache():
+    """Clears the data cache and its statistics, and the registered caches of results computed from the data."""
+    _data_cache.clear()
+    for cache in _derived_caches:
+        cache.clear()
+
+
+def get_cache_stats() -> dict[str, Any]:
+    """Statistics of the data cache: hits, misses, hit_rate, evictions, entries, bytes, and max_bytes."""
+    return _data_cache.stats()
+
+
+def set_cache_size(max_bytes: int):
+    """Sets the maximum size of the data cache in bytes. 0 disables the cache."""
+    _data_cache.resize(max_bytes)
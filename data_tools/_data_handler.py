@@ -1,11 +1,12 @@
-import io
-import pickle
 import pint
 import os.path as op
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Any, Optional
 
 import numpy as np
+import pandas as pd
 
 from onix.units import ureg
 from ._data_path import (
@@ -17,6 +18,10 @@ from ._data_path import (
     get_exist_experiment_path_from_edf,
     get_exist_persistent_path,
 )
+from ._header_index import index_experiment_headers, _flatten_params
+from ._experiment_data import ExperimentData, HEADERS_JSON_KEY, _decode_header_bytes, _flatten_groups
+from ._cache import _data_cache
+from ._header_format import encode_headers, copy_headers
 
 pint.set_application_registry(ureg)
 
@@ -43,41 +48,100 @@ def _save_data(
     headers: Optional[dict[Any, Any]] = None,
     edf_number: Optional[int] = None,
 ):
-    """Saves data and headers in a npz file."""
+    """Saves data and headers in a npz file.
+
+    Dicts of arrays are saved as separate arrays so that they can be loaded lazily, see ExperimentData.
+    Headers are saved in the versioned JSON header format, see encode_headers.
+    """
     if headers is None:
         headers = {}
     _add_default_headers(headers, data_name, data_number, edf_number)
-    data["__headers__"] = pickle.dumps(headers)
+    data = _flatten_groups(data)
+    data[HEADERS_JSON_KEY] = np.frombuffer(encode_headers(headers), dtype=np.uint8)
     np.savez(file_path, **data)
 
 
-def _get_data(file_path: str) -> tuple[dict[Any, Any], dict[Any, Any]]:
-    """Loads the npz file and unpickles the headers.
+def _read_only(value: Any) -> Any:
+    """Marks arrays (and arrays in 0-d object arrays of dicts) read-only, so cached arrays are not changed."""
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject and value.ndim == 0 and isinstance(value[()], dict):
+            for array in value[()].values():
+                _read_only(array)
+        else:
+            value.flags.writeable = False
+    return value
 
-    Skips all custom classes that cannot be unpickled.
+
+def _copy_arrays(value: Any) -> Any:
+    """Copies a cached array, or the dict and arrays in a 0-d object array, so that callers can change them."""
+    if isinstance(value, np.ndarray) and value.dtype.hasobject and value.ndim == 0 and isinstance(value[()], dict):
+        copied = np.empty((), dtype=object)
+        copied[()] = {name: np.array(array) for name, array in value[()].items()}
+        return copied
+    return np.array(value)
+
+
+def _copy_groups(value: Any) -> Any:
+    """Copies the dict in a 0-d object array, so that callers can add or remove groups without changing the cache."""
+    if isinstance(value, np.ndarray) and value.dtype.hasobject and value.ndim == 0 and isinstance(value[()], dict):
+        copied = np.empty((), dtype=object)
+        copied[()] = dict(value[()])
+        return copied
+    return value
+
+
+def _load_data(
+    data: ExperimentData, use_cache: bool = True, read_only: bool = False
+) -> tuple[dict[Any, Any], dict[Any, Any]]:
+    """Loads all data arrays and headers, through the data cache.
+
+    Headers are decoded once and copied for each call, so changing the returned headers does not
+    change the cache. Arrays are copied too, unless read_only is True, which returns the read-only
+    cached arrays without copying.
     """
-    class DummyClass:
-        pass
+    with data:
+        if not use_cache:
+            return (data.to_dict(), data.headers)
+        key = data.cache_key()
+        entry = _data_cache.get(key)
+        if entry is None:
+            arrays = {name: _read_only(value) for name, value in data.to_dict().items()}
+            header_bytes = data._header_bytes()
+            nbytes = len(header_bytes[1])
+            for value in arrays.values():
+                if value.dtype.hasobject and value.ndim == 0 and isinstance(value[()], dict):
+                    nbytes += sum(np.asarray(array).nbytes for array in value[()].values())
+                else:
+                    nbytes += value.nbytes
+            entry = (arrays, _decode_header_bytes(*header_bytes))
+            _data_cache.put(key, entry, nbytes)
+        arrays, headers = entry
+    copy_array = _copy_groups if read_only else _copy_arrays
+    return ({name: copy_array(value) for name, value in arrays.items()}, copy_headers(headers))
 
-    class SkipAttributeErrorUnpickler(pickle._Unpickler):
-        def find_class(self, __module_name: str, __global_name: str) -> Any:
-            try:
-                return super().find_class(__module_name, __global_name)
-            except (AttributeError, ModuleNotFoundError):
-                print(f"Cannot find class {__global_name} in {__module_name}. Skipping.")
-                return DummyClass
 
-    data = dict(np.load(file_path, allow_pickle=True))
-    headers = SkipAttributeErrorUnpickler(io.BytesIO(data.pop("__headers__"))).load()
-    return (data, headers)
+def _get_data(
+    file_path: str, use_cache: bool = True, read_only: bool = False
+) -> tuple[dict[Any, Any], dict[Any, Any]]:
+    """Loads the npz file and the headers.
+
+    Skips all custom classes that cannot be unpickled.
+    """
+    return _load_data(ExperimentData(file_path, mmap=False), use_cache, read_only)
 
 
 def save_experiment_data(
-    data_name: str, data: dict[Any, Any], headers: Optional[dict[Any, Any]] = None, edf_number: Optional[int] = None
+    data_name: str,
+    data: dict[Any, Any],
+    headers: Optional[dict[Any, Any]] = None,
+    edf_number: Optional[int] = None,
 ) -> int:
     """Saves experiment data."""
+    if headers is None:
+        headers = {}
     data_number, file_path = get_new_experiment_path(data_name, edf_number)
     _save_data(file_path, data, data_name, data_number, headers, edf_number)
+    index_experiment_headers(headers)
     return data_number
 
 
@@ -102,19 +166,175 @@ def get_analysis_file_path(data_number: int, file_name: str) -> str:
     return op.join(parent, file_name)
 
 
-def get_experiment_data(data_number: int):
-    """Gets experiment data and headers."""
-    file_path = get_exist_experiment_path(data_number)
-    return _get_data(file_path)
+def get_experiment_data(data_number: int, use_cache: bool = True, read_only: bool = False):
+    """Gets experiment data and headers.
 
+    Data is cached, and copies of the cached arrays are returned. read_only=True returns the
+    cached arrays, which are read-only, without copying. See get_cache_stats.
+    """
+    return _load_data(get_lazy_experiment_data(data_number, mmap=False), use_cache, read_only)
+
+
+def get_experiment_data_from_edf(edf_number: int, use_cache: bool = True, read_only: bool = False):
+    """Gets experiment data and headers.
+
+    Data is cached, and copies of the cached arrays are returned. read_only=True returns the
+    cached arrays, which are read-only, without copying. See get_cache_stats.
+    """
+    return _load_data(get_lazy_experiment_data_from_edf(edf_number, mmap=False), use_cache, read_only)
 
-def get_experiment_data_from_edf(edf_number: int):
-    """Gets experiment data and headers."""
-    file_path = get_exist_experiment_path_from_edf(edf_number)
-    return _get_data(file_path)
 
+def get_persistent_data(data_number: int, data_name: str, use_cache: bool = True, read_only: bool = False):
+    """Gets persistent data and headers.
 
-def get_persistent_data(data_number: int, data_name: str):
-    """Gets persistent data and headers."""
+    Data is cached, and copies of the cached arrays are returned. read_only=True returns the
+    cached arrays, which are read-only, without copying. See get_cache_stats.
+    """
     file_path = get_exist_persistent_path(data_number, data_name)
-    return _get_data(file_path)
+    return _get_data(file_path, use_cache, read_only)
+
+
+def get_lazy_experiment_data(data_number: int, mmap: bool = True) -> ExperimentData:
+    """Gets a lazy handle to experiment data. See ExperimentData."""
+    return ExperimentData(get_exist_experiment_path(data_number), mmap)
+
+
+def get_lazy_experiment_data_from_edf(edf_number: int, mmap: bool = True) -> ExperimentData:
+    """Gets a lazy handle to experiment data. See ExperimentData."""
+    return ExperimentData(get_exist_experiment_path_from_edf(edf_number), mmap)
+
+
+def get_experiment_headers(data_number: int) -> dict[Any, Any]:
+    """Gets experiment headers without loading the data."""
+    with get_lazy_experiment_data(data_number) as data:
+        return data.headers
+
+
+def get_experiment_headers_from_edf(edf_number: int) -> dict[Any, Any]:
+    """Gets experiment headers without loading the data."""
+    with get_lazy_experiment_data_from_edf(edf_number) as data:
+        return data.headers
+
+
+def _header_row(headers: dict[Any, Any]) -> dict[str, Any]:
+    """Flattens headers to one row of the headers table. Quantities are converted to base units."""
+    data_info = headers["data_info"]
+    row = {
+        "data_number": data_info["data_number"],
+        "edf_number": data_info.get("edf_number"),
+        "name": data_info.get("name"),
+        "save_epoch_time": data_info.get("save_epoch_time"),
+    }
+    params = headers.get("params")
+    if isinstance(params, dict):
+        for key, (value, text, unit) in _flatten_params(params).items():
+            row[key] = text if text is not None else value
+            if unit is not None:
+                row[key + ".unit"] = unit
+    return row
+
+
+def get_experiment_data_range(
+    first: int,
+    last: int,
+    fields: Optional[list[str]] = None,
+    use_data_number: bool = False,
+    max_workers: int = 8,
+) -> tuple[dict[str, Any], pd.DataFrame, list[int]]:
+    """Loads experiment data of a range of EDF numbers (or data numbers) in parallel.
+
+    Each field is stacked into one array along a new first axis. Fields saved in groups
+    (e.g. "transmission" with "detect_1" and "detect_2") are stacked per group.
+
+    Example:
+        data, headers, missing = get_experiment_data_range(1000, 1999, ["transmission", "monitor"])
+        detect_2 = data["transmission"]["detect_2"]  # shape (number of EDFs, repeats, points)
+        wait_times = headers["lf.ramsey.wait_time"]  # in seconds
+
+    Args:
+        first: int, first EDF number (or data number).
+        last: int, last EDF number (or data number), inclusive.
+        fields: list of str, data fields to load. Default None loads all fields of the first data.
+        use_data_number: bool, whether first and last are data numbers. Default False.
+        max_workers: int, number of threads reading files.
+
+    Returns:
+        (data, headers, missing). data is a dict of stacked arrays, or of dicts of stacked arrays
+        for fields saved in groups. headers is a DataFrame indexed by the loaded numbers with a
+        column for each flattened parameter in headers["params"], in base units with the unit in a
+        separate "<parameter>.unit" column. missing is a list of the numbers that are not found,
+        which are skipped.
+    """
+    if use_data_number:
+        get_lazy_data = get_lazy_experiment_data
+    else:
+        get_lazy_data = get_lazy_experiment_data_from_edf
+    numbers = list(range(first, last + 1))
+
+    def open_data(number):
+        try:
+            return get_lazy_data(number, mmap=False)
+        except ValueError:
+            return None
+
+    stacked = {}
+    members = []  # (field, group or None)
+
+    def allocate(data):
+        for field in (data.keys() if fields is None else fields):
+            groups = data.groups(field)
+            if len(groups) == 0:
+                array = np.asarray(data.get(field))
+                if array.dtype.hasobject and array.ndim == 0 and isinstance(array[()], dict):
+                    # files saved before groups were stored separately.
+                    groups = list(array[()].keys())
+            if len(groups) == 0:
+                stacked[field] = np.empty((len(numbers),) + array.shape, dtype=array.dtype)
+                members.append((field, None))
+            else:
+                stacked[field] = {}
+                for group in groups:
+                    array = data.get(field, group)
+                    stacked[field][group] = np.empty((len(numbers),) + array.shape, dtype=array.dtype)
+                    members.append((field, group))
+
+    def load(index):
+        data = open_data(numbers[index])
+        if data is None:
+            return None
+        with data:
+            for (field, group), array in zip(members, data.get_many(members)):
+                target = stacked[field] if group is None else stacked[field][group]
+                if np.shape(array) != target.shape[1:]:
+                    raise ValueError(
+                        f"Field {field} {group or ''} of {numbers[index]} has shape {np.shape(array)}, "
+                        f"different from {target.shape[1:]} of the first data."
+                    )
+                target[index] = array
+            return _header_row(data.headers)
+
+    rows = [None] * len(numbers)
+    start = 0
+    # the first data found sets the shapes and dtypes of the stacked arrays.
+    while start < len(numbers) and len(members) == 0:
+        data = open_data(numbers[start])
+        if data is not None:
+            with data:
+                allocate(data)
+            rows[start] = load(start)
+        start += 1
+    with ThreadPoolExecutor(max_workers) as executor:
+        rows[start:] = executor.map(load, range(start, len(numbers)))
+
+    found = np.array([row is not None for row in rows], dtype=bool)
+    missing = [number for number, row in zip(numbers, rows) if row is None]
+    if len(missing) > 0:
+        warnings.warn(f"{len(missing)} of {len(numbers)} experiment data are not found and skipped: {missing}")
+    for field, group in members:
+        if group is None:
+            stacked[field] = stacked[field][found]
+        else:
+            stacked[field][group] = stacked[field][group][found]
+    loaded_numbers = [number for number, row in zip(numbers, rows) if row is not None]
+    headers = pd.DataFrame([row for row in rows if row is not None], index=loaded_numbers)
+    return (stacked, headers, missing)
@@ -1,8 +1,15 @@
 import os
 import os.path as op
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Any, Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    import msvcrt
+
 try:
     data_folder = os.environ["DATAFOLDER"]
 except KeyError:
@@ -34,24 +41,104 @@ def get_last_expts_data_number():
     return last_dnum
 
 
+@contextmanager
+def _lock_folder(folder: str):
+    """Holds an exclusive lock on the "last_dnum.lock" file of a folder.
+
+    The lock is released by the operating system if the process exits, so a crashed writer
+    does not block others.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(op.join(folder, "last_dnum.lock"), "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 s.
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _reserve_data_numbers(folder: str, count: int = 1) -> range:
+    """Increases the "last_dnum" file counter by count and returns the reserved data numbers.
+
+    The counter is read and written while holding the folder lock, and the new value is written
+    to a temporary file first, so concurrent processes never get the same number and the counter
+    is never left half-written.
+    """
+    if count < 1:
+        raise ValueError("At least one data number must be reserved.")
+    with _lock_folder(folder):
+        dnum_file = op.join(folder, "last_dnum")
+        last_dnum = 0
+        if op.isfile(dnum_file):
+            with open(dnum_file, "r") as f:
+                try:
+                    last_dnum = int(f.readline())
+                except ValueError:
+                    pass
+        temp_file = dnum_file + f".{os.getpid()}"
+        with open(temp_file, "w") as f:
+            f.write(str(last_dnum + count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, dnum_file)
+    return range(last_dnum + 1, last_dnum + count + 1)
+
+
 def _increment_last_data_number(folder: str) -> int:
     """Increases the "last_dnum" file counter by 1 and returns the increased number."""
-    os.makedirs(folder, exist_ok=True)
-    dnum_file = op.join(folder, "last_dnum")
-    if not op.exists(dnum_file) or not op.isfile(dnum_file):
-        with open(dnum_file, "w") as f:
-            f.write("0")
+    return _reserve_data_numbers(folder, 1)[0]
 
-    last_dnum = 0
-    with open(dnum_file, "r") as f:
+
+class DataNumberAllocator:
+    """Hands out data numbers from ranges reserved in batches, for writers that save at high rates.
+
+    Each batch locks the counter file once. Numbers of a batch that are not used when the process
+    exits are skipped.
+
+    Args:
+        folder: str, folder of the "last_dnum" counter file, e.g. expt_folder.
+        batch_size: int, number of data numbers reserved at once.
+    """
+
+    def __init__(self, folder: str, batch_size: int = 100):
+        self.folder = folder
+        self.batch_size = batch_size
+        self._reserved = iter(())
+
+    def next(self) -> int:
+        """Returns the next unused data number."""
         try:
-            last_dnum = int(f.readline())
-        except ValueError:
-            pass
-    last_dnum += 1
-    with open(dnum_file, "w") as f:
-        f.write(str(last_dnum))
-    return last_dnum
+            return next(self._reserved)
+        except StopIteration:
+            self._reserved = iter(_reserve_data_numbers(self.folder, self.batch_size))
+            return next(self._reserved)
+
+
+_expt_data_numbers = DataNumberAllocator(expt_folder, batch_size=1)
+
+
+def set_experiment_data_number_batch_size(batch_size: int):
+    """Sets how many experiment data numbers this process reserves at once.
+
+    The default of 1 keeps data numbers of all processes consecutive. Writers that save at high rates
+    can reserve larger batches to lock the counter file less often.
+    """
+    global _expt_data_numbers
+    _expt_data_numbers = DataNumberAllocator(expt_folder, batch_size)
 
 
 def _locate_expt_data_number(data_number: int) -> tuple[str, str]:
@@ -86,16 +173,69 @@ def _locate_expt_edf_number(edf_number: int) -> tuple[str, str]:
     raise ValueError(f"EDF number {edf_number} is not found.")
 
 
+def _anly_link_path(data_number: int) -> str:
+    link_folder_name = str(data_number // 100000).rjust(anly_rjust - 5, "0")
+    return op.join(anly_folder, "links", link_folder_name, str(data_number))
+
+
+def _link_anly_folder(data_number: int, folder: str):
+    """Creates the symlink pointing the analysis data number to its folder, replacing a broken symlink."""
+    link = _anly_link_path(data_number)
+    os.makedirs(op.dirname(link), exist_ok=True)
+    if not op.exists(link):
+        _replace_symlink(folder, link, target_is_directory=True)
+
+
 def _locate_anly_data_number(data_number: int) -> tuple[str, str]:
-    """Walks through all subfolders to find an analysis folder path."""
+    """Finds an analysis folder from its symlink.
+
+    Walks through all subfolders if the symlink does not exist (folders created before the symlinks),
+    and creates the symlink for the next time.
+    """
+    link = _anly_link_path(data_number)
+    if op.exists(link):
+        return op.split(os.readlink(link))
     start_str = str(data_number).rjust(anly_rjust, "0") + " - "
     for path, dirs, files in os.walk(anly_folder):
+        if path == anly_folder and "links" in dirs:
+            dirs.remove("links")
         for directory in dirs:
             if directory.startswith(start_str):
+                _link_anly_folder(data_number, op.join(path, directory))
                 return (path, directory)
     raise ValueError(f"Analysis data number {data_number} is not found.")
 
 
+def build_analysis_links() -> int:
+    """Creates the symlinks of existing analysis folders. Only needs to run once.
+
+    Returns:
+        int, number of symlinks created.
+    """
+    created = 0
+    for path, dirs, files in os.walk(anly_folder):
+        if path == anly_folder and "links" in dirs:
+            dirs.remove("links")
+        for directory in list(dirs):
+            number_str = directory.split(" - ", 1)[0]
+            if " - " not in directory or not number_str.isdigit():
+                continue
+            data_number = int(number_str)
+            if not op.exists(_anly_link_path(data_number)):
+                _link_anly_folder(data_number, op.join(path, directory))
+                created += 1
+            # analysis folders are not nested in other analysis folders.
+            dirs.remove(directory)
+    return created
+
+
+def _replace_symlink(target: str, link: str, target_is_directory: bool = False):
+    """Creates a symlink, replacing an existing symlink at the same path in one step."""
+    temp_link = f"{link}.{os.getpid()}.tmp"
+    os.symlink(target, temp_link, target_is_directory=target_is_directory)
+    os.replace(temp_link, link)
+
+
 def get_new_experiment_path(data_name: str, edf_number: Optional[int] = None) -> tuple[int, str]:
     """Gets the data number and file path for new experiment data.
     
@@ -103,7 +243,7 @@ def get_new_experiment_path(data_name: str, edf_number: Optional[int] = None) ->
     Update 2024-10-08: Also creates a symlink pointing the EDF number to the data file.
     """
     year_month, day = _get_current_date_directory()
-    data_number = _increment_last_data_number(expt_folder)
+    data_number = _expt_data_numbers.next()
     folder = op.join(expt_folder, year_month, day)
     os.makedirs(folder, exist_ok=True)
     file_name = str(data_number).rjust(expt_rjust, "0") + " - " + data_name + ".npz"
@@ -117,7 +257,8 @@ def get_new_experiment_path(data_name: str, edf_number: Optional[int] = None) ->
         edf_link_folder_name = str(edf_number // 100000).rjust(expt_rjust - 5, "0")
         edf_link_folder = op.join(expt_folder, "edf_links", edf_link_folder_name)
         os.makedirs(edf_link_folder, exist_ok=True)
-        os.symlink(op.join(folder, file_name), op.join(edf_link_folder, str(edf_number)))
+        # an EDF that is run again points to the latest data.
+        _replace_symlink(op.join(folder, file_name), op.join(edf_link_folder, str(edf_number)))
     return (data_number, op.join(folder, file_name))
 
 
@@ -136,6 +277,7 @@ def get_new_analysis_folder(data_name: str) -> tuple[int, str]:
     folder_name = str(data_number).rjust(anly_rjust, "0") + " - " + data_name
     folder = op.join(anly_folder, year_month, day, folder_name)
     os.makedirs(folder, exist_ok=True)
+    _link_anly_folder(data_number, folder)
     return (data_number, folder)
 
 
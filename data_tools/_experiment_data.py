@@ -0,0 +1,219 @@
+import io
+import os
+import pickle
+import struct
+import zipfile
+from typing import Any, Optional
+
+import numpy as np
+
+from ._header_format import HEADER_FORMAT_VERSION, decode_headers
+
+GROUP_SEPARATOR = "/"
+HEADERS_KEY = "__headers__"  # pickled headers of files saved before the JSON header format
+HEADERS_JSON_KEY = "__headers_json__"
+
+
+def _load_headers(headers_bytes: bytes) -> dict[Any, Any]:
+    """Unpickles the headers.
+
+    Skips all custom classes that cannot be unpickled.
+    """
+    class DummyClass:
+        pass
+
+    class SkipAttributeErrorUnpickler(pickle.Unpickler):
+        def find_class(self, __module_name: str, __global_name: str) -> Any:
+            try:
+                return super().find_class(__module_name, __global_name)
+            except (AttributeError, ModuleNotFoundError):
+                print(f"Cannot find class {__global_name} in {__module_name}. Skipping.")
+                return DummyClass
+
+    return SkipAttributeErrorUnpickler(io.BytesIO(headers_bytes)).load()
+
+
+def _decode_header_bytes(is_json: bool, headers_bytes: bytes) -> dict[Any, Any]:
+    if is_json:
+        return decode_headers(headers_bytes)
+    return _load_headers(headers_bytes)
+
+
+def _flatten_groups(data: dict[Any, Any]) -> dict[Any, Any]:
+    """Stores dicts of numerical arrays (e.g. detect groups) as separate "name/group" arrays.
+
+    Separate arrays can be loaded and memory-mapped on their own instead of unpickling the whole dict.
+    """
+    flattened = {}
+    for name, value in data.items():
+        if (
+            isinstance(value, dict)
+            and len(value) > 0
+            and all(isinstance(group, str) and GROUP_SEPARATOR not in group for group in value)
+            and all(isinstance(array, np.ndarray) and not array.dtype.hasobject for array in value.values())
+        ):
+            for group, array in value.items():
+                flattened[f"{name}{GROUP_SEPARATOR}{group}"] = array
+        else:
+            flattened[name] = value
+    return flattened
+
+
+def _memmap_member(file_path: str, info: zipfile.ZipInfo) -> Optional[np.ndarray]:
+    """Memory-maps an uncompressed .npy member of a npz file. Returns None if it cannot be memory-mapped."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(file_path, "rb") as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            return None
+        offset = f.tell()
+    if dtype.hasobject or len(shape) == 0 or np.prod(shape) == 0:
+        return None
+    return np.memmap(
+        file_path, dtype=dtype, mode="r", shape=shape, order="F" if fortran_order else "C", offset=offset
+    )
+
+
+class ExperimentData:
+    """Lazy handle to a saved data file.
+
+    Nothing is read when the handle is created. Headers and arrays are loaded when accessed.
+    Uncompressed numerical arrays are memory-mapped. Arrays of dicts saved as separate
+    "name/group" arrays (e.g. one detect group of the transmission data) can be loaded on their own.
+
+    Example:
+        with get_lazy_experiment_data(data_number) as data:
+            headers = data.headers
+            detect_1 = data.get("transmission", "detect_1")
+
+    Args:
+        file_path: str, path of the npz file.
+        mmap: bool, whether to memory-map uncompressed arrays. Default True.
+    """
+
+    def __init__(self, file_path: str, mmap: bool = True):
+        self.file_path = file_path
+        self._mmap = mmap
+        self._zip_file = None
+        self._headers = None
+
+    def _open(self) -> zipfile.ZipFile:
+        if self._zip_file is None:
+            self._zip_file = zipfile.ZipFile(self.file_path)
+        return self._zip_file
+
+    def close(self):
+        """Closes the file. Memory-mapped arrays stay valid."""
+        if self._zip_file is not None:
+            self._zip_file.close()
+            self._zip_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _member_names(self) -> list[str]:
+        return [name[:-4] for name in self._open().namelist() if name.endswith(".npy")]
+
+    def keys(self) -> list[str]:
+        """Names of the data arrays. Arrays saved in groups are listed by their name once."""
+        keys = []
+        for name in self._member_names():
+            if name in (HEADERS_KEY, HEADERS_JSON_KEY):
+                continue
+            key = name.split(GROUP_SEPARATOR, 1)[0]
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def groups(self, name: str) -> list[str]:
+        """Group names of an array saved in groups, e.g. ["detect_1", "detect_2"]."""
+        prefix = name + GROUP_SEPARATOR
+        return [member[len(prefix):] for member in self._member_names() if member.startswith(prefix)]
+
+    def _load_member(self, member: str, mmap: bool) -> np.ndarray:
+        zip_file = self._open()
+        info = zip_file.getinfo(member + ".npy")
+        if mmap:
+            array = _memmap_member(self.file_path, info)
+            if array is not None:
+                return array
+        with zip_file.open(info) as f:
+            return np.lib.format.read_array(f, allow_pickle=True)
+
+    @property
+    def header_format_version(self) -> Optional[int]:
+        """Version of the JSON header format, or None if the headers are pickled."""
+        if HEADERS_JSON_KEY in self._member_names():
+            return HEADER_FORMAT_VERSION
+        return None
+
+    def cache_key(self) -> tuple:
+        """Key of the data in the data cache. Changes when the file is modified."""
+        stat = os.stat(self.file_path)
+        return (os.path.realpath(self.file_path), stat.st_mtime_ns, stat.st_size)
+
+    def _header_bytes(self) -> tuple[bool, bytes]:
+        """(whether the headers use the JSON format, encoded headers)."""
+        if self.header_format_version is not None:
+            return (True, self._load_member(HEADERS_JSON_KEY, mmap=False).tobytes())
+        return (False, self._load_member(HEADERS_KEY, mmap=False).item())
+
+    @property
+    def headers(self) -> dict[Any, Any]:
+        """Headers of the data. Only the headers are read from the file.
+
+        Headers in the JSON format are decoded to HeaderDict.
+        """
+        if self._headers is None:
+            self._headers = _decode_header_bytes(*self._header_bytes())
+        return self._headers
+
+    def get(self, name: str, group: Optional[str] = None, mmap: Optional[bool] = None) -> Any:
+        """Gets a data array.
+
+        Args:
+            name: str, name of the data, e.g. "transmission".
+            group: str or None, group name, e.g. "detect_1". If None and the data is saved in groups,
+                returns a 0-d object array of a dict of all groups, the same as files saved without groups.
+            mmap: bool or None, whether to memory-map the array. Default None uses the handle setting.
+
+        Returns:
+            np.ndarray, the data array.
+        """
+        if mmap is None:
+            mmap = self._mmap
+        if group is not None:
+            groups = self.groups(name)
+            if len(groups) == 0:
+                # files saved before groups were stored separately keep the dict in one pickled array.
+                return self._load_member(name, mmap=False)[()][group]
+            return self._load_member(name + GROUP_SEPARATOR + group, mmap)
+        groups = self.groups(name)
+        if len(groups) == 0:
+            return self._load_member(name, mmap)
+        value = np.empty((), dtype=object)
+        value[()] = {group: self._load_member(name + GROUP_SEPARATOR + group, mmap) for group in groups}
+        return value
+
+    def get_many(self, members: list[tuple[str, Optional[str]]], mmap: Optional[bool] = None) -> list[Any]:
+        """Gets several data arrays from a list of (name, group) tuples. See get."""
+        return [self.get(name, group, mmap) for name, group in members]
+
+    def __getitem__(self, name: str) -> Any:
+        return self.get(name)
+
+    def to_dict(self, mmap: Optional[bool] = None) -> dict[Any, Any]:
+        """Returns all data arrays in a dict."""
+        return {name: self.get(name, mmap=mmap) for name in self.keys()}
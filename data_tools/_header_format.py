@@ -0,0 +1,324 @@
+import base64
+import copy
+import json
+import numbers
+import os
+import shutil
+import zipfile
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+
+from onix.units import ureg, Q_
+
+HEADER_FORMAT_VERSION = 1
+_TYPE = "__type__"
+
+
+@lru_cache(maxsize=None)
+def _unit(unit_str: str):
+    """Parses a unit string. Each unit string is only parsed once."""
+    return ureg.Unit(unit_str)
+
+
+@lru_cache(maxsize=None)
+def _quantity_state(unit_str: str) -> dict:
+    """Attributes of a quantity of the unit. Each unit string is only parsed once."""
+    return dict(Q_(1, _unit(unit_str)).__dict__)
+
+
+def _quantity(magnitude: Any, state: dict) -> Q_:
+    """Makes a quantity from the attributes of another quantity, without the slow Quantity constructor."""
+    quantity = object.__new__(Q_)
+    quantity.__dict__.update(state)
+    quantity._magnitude = magnitude
+    return quantity
+
+
+def _encode(value: Any) -> Any:
+    """Converts a header value to JSON compatible values.
+
+    Values that are not JSON types are stored in typed nodes, e.g. {"__type__": "quantity", ...}.
+    Objects of other classes are stored by their class name and attributes, so that they can be
+    read without importing the class.
+    """
+    if value is None or type(value) in (bool, str, int, float):
+        return value
+    if isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, Q_):
+        return {_TYPE: "quantity", "magnitude": _encode(value.magnitude), "unit": str(value.units)}
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return {_TYPE: "object_array", "shape": list(value.shape), "items": [_encode(kk) for kk in value.ravel()]}
+        array = np.ascontiguousarray(value)
+        return {
+            _TYPE: "ndarray",
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "data": base64.b64encode(array.tobytes()).decode("ascii"),
+        }
+    if isinstance(value, np.generic):
+        return _encode(value.item())
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, numbers.Complex):
+        return {_TYPE: "complex", "real": value.real, "imag": value.imag}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and _TYPE not in value:
+            return {key: _encode(item) for key, item in value.items()}
+        return {_TYPE: "dict", "items": [[_encode(key), _encode(item)] for key, item in value.items()]}
+    if isinstance(value, tuple):
+        return {_TYPE: "tuple", "items": [_encode(kk) for kk in value]}
+    if isinstance(value, (list, set, frozenset)):
+        return [_encode(kk) for kk in value]
+    node = {_TYPE: "object", "class": f"{type(value).__module__}.{type(value).__qualname__}"}
+    if hasattr(value, "__dict__"):
+        node["state"] = _encode(vars(value))
+    else:
+        node["repr"] = repr(value)
+    return node
+
+
+def _decode_node(value: dict) -> Any:
+    """Converts a JSON object back to a header value. Nested dicts are decoded to HeaderDict.
+
+    Used as the object_hook of json.loads, so the items of value are already decoded.
+    """
+    node_type = value.get(_TYPE)
+    if node_type is None:
+        return HeaderDict(value)
+    if node_type == "quantity":
+        magnitude = value["magnitude"]
+        if isinstance(magnitude, list):
+            magnitude = np.asarray(magnitude)
+        return _quantity(magnitude, _quantity_state(value["unit"]))
+    if node_type == "ndarray":
+        data = base64.b64decode(value["data"])
+        return np.frombuffer(data, dtype=np.dtype(value["dtype"])).reshape(value["shape"]).copy()
+    if node_type == "object_array":
+        array = np.empty(len(value["items"]), dtype=object)
+        for kk, item in enumerate(value["items"]):
+            array[kk] = item
+        return array.reshape(value["shape"])
+    if node_type == "complex":
+        return complex(value["real"], value["imag"])
+    if node_type == "dict":
+        return HeaderDict((_hashable(key), item) for key, item in value["items"])
+    if node_type == "tuple":
+        return tuple(value["items"])
+    if node_type == "object":
+        # the class is not imported, so renamed or removed classes can still be read.
+        decoded = {"__class__": value["class"]}
+        if "state" in value:
+            decoded.update(value["state"])
+        else:
+            decoded["__repr__"] = value["repr"]
+        return decoded
+    raise ValueError(f"Header node type {node_type} is not defined.")
+
+
+def _hashable(key: Any) -> Any:
+    if isinstance(key, list):
+        return tuple(_hashable(kk) for kk in key)
+    return key
+
+
+_IMMUTABLE_TYPES = (str, int, float, bool, complex, type(None))
+
+
+def copy_headers(value: Any) -> Any:
+    """Copies decoded headers, so that cached headers are not changed. Faster than decoding again.
+
+    Quantities are copied without calling the Quantity constructor.
+    """
+    value_type = type(value)
+    if value_type in _IMMUTABLE_TYPES:
+        return value
+    if value_type is HeaderDict:
+        return HeaderDict([(key, copy_headers(item)) for key, item in value.items()])
+    if value_type is list:
+        return [copy_headers(kk) for kk in value]
+    if isinstance(value, Q_):
+        return _quantity(copy_headers(value._magnitude), value.__dict__)
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return value.copy()
+    if value_type is dict:
+        return {key: copy_headers(item) for key, item in value.items()}
+    if value_type is tuple:
+        return tuple(copy_headers(kk) for kk in value)
+    return copy.deepcopy(value)
+
+
+class HeaderDict(dict):
+    """dict of decoded headers.
+
+    Values are decoded when the headers are read, so every way of copying or iterating the dict
+    (dict(h), {**h}, dict.update) sees decoded values. Compares values with _headers_equal, so
+    headers with arrays and quantities can be compared. Pickled and copied as a plain dict.
+    """
+
+    def copy(self):
+        return HeaderDict(self)
+
+    def to_dict(self) -> dict:
+        """Returns a plain dict."""
+        return {key: value.to_dict() if isinstance(value, HeaderDict) else value for key, value in self.items()}
+
+    def __eq__(self, other):
+        return _headers_equal(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_dict(), memo)
+
+
+def encode_headers(headers: dict[Any, Any]) -> bytes:
+    """Encodes headers to versioned JSON bytes."""
+    return json.dumps(
+        {"version": HEADER_FORMAT_VERSION, "headers": _encode(headers)}, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def decode_headers(headers_bytes: bytes) -> HeaderDict:
+    """Decodes headers from encode_headers, see HeaderDict."""
+    # nodes are decoded by the JSON parser, without another pass over the headers.
+    document = json.loads(headers_bytes, object_hook=_decode_node)
+    version = document.get("version")
+    if version != HEADER_FORMAT_VERSION:
+        raise ValueError(f"Header format version {version} is not supported.")
+    return document["headers"]
+
+
+def _is_decoded_object(value: Any) -> bool:
+    return type(value) is dict and "__class__" in value
+
+
+def _object_equal(decoded: dict, value: Any) -> bool:
+    """Compares an object decoded from its class name and attributes with the object."""
+    if decoded["__class__"] != f"{type(value).__module__}.{type(value).__qualname__}":
+        return False
+    if "__repr__" in decoded:
+        return decoded["__repr__"] == repr(value)
+    state = {key: item for key, item in decoded.items() if key != "__class__"}
+    return hasattr(value, "__dict__") and _headers_equal(state, vars(value))
+
+
+def _headers_equal(first: Any, second: Any) -> bool:
+    """Compares header values, including arrays and quantities.
+
+    Sets compare equal to lists of the same items, and objects to their decoded dicts, as they are encoded.
+    """
+    if _is_decoded_object(second) and not isinstance(first, dict):
+        first, second = second, first
+    if _is_decoded_object(first) and not isinstance(second, dict):
+        return _object_equal(first, second)
+    if isinstance(second, (set, frozenset)):
+        first, second = second, first
+    if isinstance(first, (set, frozenset)):
+        if isinstance(second, (set, frozenset)):
+            return first == second
+        if not isinstance(second, (list, tuple)) or len(first) != len(second):
+            return False
+        return all(any(_headers_equal(kk, ll) for ll in second) for kk in first)
+    if isinstance(first, dict) and isinstance(second, dict):
+        if set(first.keys()) != set(second.keys()):
+            return False
+        return all(_headers_equal(first[key], second[key]) for key in first)
+    if isinstance(first, (list, tuple)) and isinstance(second, (list, tuple)):
+        return len(first) == len(second) and all(_headers_equal(kk, ll) for kk, ll in zip(first, second))
+    if isinstance(first, Q_) or isinstance(second, Q_):
+        if not (isinstance(first, Q_) and isinstance(second, Q_)) or first.units != second.units:
+            return False
+        return _headers_equal(first.magnitude, second.magnitude)
+    if isinstance(first, np.ndarray) or isinstance(second, np.ndarray):
+        first = np.asarray(first)
+        second = np.asarray(second)
+        if first.dtype.hasobject or second.dtype.hasobject:
+            return first.shape == second.shape and _headers_equal(list(first.ravel()), list(second.ravel()))
+        return first.shape == second.shape and bool(np.all((first == second) | ((first != first) & (second != second))))
+    if isinstance(first, float) and isinstance(second, float) and first != first and second != second:
+        return True
+    try:
+        return bool(first == second)
+    except Exception:
+        return False
+
+
+def migrate_header_format(file_path: str, keep_pickle: bool = False) -> bool:
+    """Rewrites a data file with pickled headers to use the JSON header format.
+
+    The data arrays are copied without change. The file is replaced only after the new file is fully
+    written and its headers decode to the same values.
+
+    Args:
+        file_path: str, path of the npz file.
+        keep_pickle: bool, whether to keep the pickled headers in the file. Default False.
+
+    Returns:
+        bool, whether the file is migrated. False if it already uses the JSON header format.
+    """
+    from ._experiment_data import ExperimentData, HEADERS_KEY, HEADERS_JSON_KEY
+
+    file_path = os.path.realpath(file_path)
+    with ExperimentData(file_path) as data:
+        if data.header_format_version is not None:
+            return False
+        headers = data.headers
+    headers_bytes = encode_headers(headers)
+    if not _headers_equal(decode_headers(headers_bytes), headers):
+        raise ValueError(f"Headers of {file_path} cannot be converted without changes.")
+
+    temp_path = file_path + ".migrating"
+    with zipfile.ZipFile(file_path) as zip_in, zipfile.ZipFile(temp_path, "w", allowZip64=True) as zip_out:
+        for info in zip_in.infolist():
+            if info.filename == HEADERS_KEY + ".npy" and not keep_pickle:
+                continue
+            force_zip64 = info.file_size >= zipfile.ZIP64_LIMIT
+            with zip_in.open(info) as f_in, zip_out.open(info, "w", force_zip64=force_zip64) as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        with zip_out.open(HEADERS_JSON_KEY + ".npy", "w") as f_out:
+            np.lib.format.write_array(f_out, np.frombuffer(headers_bytes, dtype=np.uint8))
+    shutil.copystat(file_path, temp_path)
+    os.replace(temp_path, file_path)
+    return True
+
+
+def migrate_experiment_header_format(first: Optional[int] = None, last: Optional[int] = None, keep_pickle: bool = False) -> int:
+    """Migrates experiment data files to the JSON header format. See migrate_header_format.
+
+    Args:
+        first: int, first data number. Default None starts from data number 1.
+        last: int, last data number. Default None migrates to the last data number.
+        keep_pickle: bool, whether to keep the pickled headers in the files.
+
+    Returns:
+        int, number of migrated files.
+    """
+    from ._data_path import get_exist_experiment_path, get_last_expts_data_number
+
+    if first is None:
+        first = 1
+    if last is None:
+        last = get_last_expts_data_number()
+    migrated = 0
+    for data_number in range(first, last + 1):
+        try:
+            file_path = get_exist_experiment_path(data_number)
+        except ValueError:
+            continue
+        try:
+            migrated += migrate_header_format(file_path, keep_pickle)
+        except Exception as e:
+            print(f"Cannot migrate experiment data {data_number}: {e}")
+    return migrated
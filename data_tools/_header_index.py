@@ -0,0 +1,283 @@
+import numbers
+import os
+import os.path as op
+import sqlite3
+import warnings
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+
+from onix.units import Q_
+from ._data_path import expt_folder
+
+header_index_file = op.join(expt_folder, "header_index.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    data_number INTEGER PRIMARY KEY,
+    edf_number INTEGER,
+    name TEXT,
+    save_epoch_time REAL
+);
+CREATE INDEX IF NOT EXISTS experiments_edf_number ON experiments (edf_number);
+CREATE INDEX IF NOT EXISTS experiments_save_epoch_time ON experiments (save_epoch_time);
+CREATE TABLE IF NOT EXISTS params (
+    data_number INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value REAL,
+    text TEXT,
+    unit TEXT,
+    PRIMARY KEY (data_number, key)
+);
+CREATE INDEX IF NOT EXISTS params_key_value ON params (key, value);
+CREATE INDEX IF NOT EXISTS params_key_text ON params (key, text);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    """Opens the header index database. Waits for other processes that are writing to it."""
+    os.makedirs(op.dirname(header_index_file), exist_ok=True)
+    connection = sqlite3.connect(header_index_file, timeout=30)
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+@lru_cache(maxsize=None)
+def _base_units_scale(units) -> tuple[float, str]:
+    """(scale, base unit) that converts a magnitude in multiplicative units to base units."""
+    one = Q_(1.0, units).to_base_units()
+    return (float(one.magnitude), str(one.units))
+
+
+def _to_base_units(value: Q_) -> tuple[float, str]:
+    """(magnitude, base unit) of a scalar quantity with a real magnitude in base units."""
+    if value._is_multiplicative:
+        scale, base_units = _base_units_scale(value.units)
+        return (scale * float(value.magnitude), base_units)
+    # offset (degC) and logarithmic (dBm) units are not linear in the magnitude.
+    value = value.to_base_units()
+    return (float(value.magnitude), str(value.units))
+
+
+def _index_value(value: Any) -> Optional[tuple[Optional[float], Optional[str], Optional[str]]]:
+    """Converts a header value to (value, text, unit) columns, or None if the value is not indexed.
+
+    Quantities are converted to base units, so that values saved in different units can be compared.
+    Arrays, lists, quantities with magnitudes that are not real numbers (e.g. ufloat), and other
+    non-scalar values are not indexed.
+    """
+    if isinstance(value, Q_):
+        if not isinstance(value.magnitude, (numbers.Real, np.bool_)):
+            return None
+        magnitude, base_units = _to_base_units(value)
+        return (magnitude, None, base_units)
+    if isinstance(value, (bool, np.bool_, numbers.Real)):
+        return (float(value), None, None)
+    if isinstance(value, str):
+        return (None, value, None)
+    return None
+
+
+def _flatten_params(params: dict[Any, Any], prefix: str = "") -> dict[str, tuple]:
+    """Flattens nested parameter dicts to {"lf.ramsey.wait_time": (value, text, unit), ...}."""
+    flattened = {}
+    for key, value in params.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flattened.update(_flatten_params(value, name + "."))
+        else:
+            index_value = _index_value(value)
+            if index_value is not None:
+                flattened[name] = index_value
+    return flattened
+
+
+def _insert_headers(connection: sqlite3.Connection, headers: dict[Any, Any]):
+    data_info = headers["data_info"]
+    data_number = int(data_info["data_number"])
+    edf_number = data_info.get("edf_number")
+    if edf_number is not None:
+        edf_number = int(edf_number)
+    connection.execute(
+        "INSERT OR REPLACE INTO experiments VALUES (?, ?, ?, ?)",
+        (data_number, edf_number, data_info.get("name"), data_info.get("save_epoch_time")),
+    )
+    connection.execute("DELETE FROM params WHERE data_number = ?", (data_number,))
+    params = headers.get("params")
+    if isinstance(params, dict):
+        connection.executemany(
+            "INSERT INTO params VALUES (?, ?, ?, ?, ?)",
+            [(data_number, key, *value) for key, value in _flatten_params(params).items()],
+        )
+
+
+def index_experiment_headers(headers: dict[Any, Any]):
+    """Adds the headers of an experiment data file to the header index.
+
+    Called by save_experiment_data. Errors are reported as warnings so that saving data never fails
+    because of the index. Use backfill_header_index to add missing entries.
+    """
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                _insert_headers(connection, headers)
+        finally:
+            connection.close()
+    except Exception as e:
+        warnings.warn(f"Experiment data {headers['data_info']['data_number']} is not indexed: {e}")
+
+
+def _query_value(key: str, condition: Any) -> tuple:
+    index_value = _index_value(condition)
+    if index_value is None:
+        raise ValueError(f"Parameter {key} cannot be queried with {condition!r}.")
+    return index_value
+
+
+def _where_param(key: str, condition: Any) -> tuple[str, list]:
+    """SQL condition on a parameter.
+
+    condition can be a value (number, bool, str, or Quantity) or a (low, high) tuple for an inclusive range.
+    """
+    clause = "data_number IN (SELECT data_number FROM params WHERE key = ? AND {})"
+    if isinstance(condition, tuple):
+        low, high = condition
+        low = _query_value(key, low)[0] if low is not None else -np.inf
+        high = _query_value(key, high)[0] if high is not None else np.inf
+        return clause.format("value BETWEEN ? AND ?"), [key, low, high]
+    value, text, _ = _query_value(key, condition)
+    if text is not None:
+        return clause.format("text = ?"), [key, text]
+    tolerance = 1e-9 * abs(value)
+    return clause.format("value BETWEEN ? AND ?"), [key, value - tolerance, value + tolerance]
+
+
+def query_data_numbers(
+    params: Optional[dict[str, Any]] = None,
+    name: Optional[str] = None,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    edf_range: Optional[tuple[int, int]] = None,
+) -> list[int]:
+    """Finds experiment data numbers from the header index.
+
+    Example:
+        query_data_numbers(
+            {"lf.ramsey.wait_time": Q_(200, "us"), "field_plate.polarity": -1},
+            start_time=time.time() - 7 * 24 * 3600,
+        )
+
+    Args:
+        params: dict, keys are flattened parameter names in headers["params"] joined by ".",
+            and values are either values (numbers, bools, strings, or Quantities) or inclusive
+            (low, high) ranges. Quantities are compared after converting to base units.
+        name: str, data name.
+        start_time: float, earliest save epoch time.
+        end_time: float, latest save epoch time.
+        edf_range: (first, last) inclusive range of EDF numbers.
+
+    Returns:
+        list of int, sorted data numbers that match all conditions.
+    """
+    clauses = []
+    arguments = []
+    if name is not None:
+        clauses.append("name = ?")
+        arguments.append(name)
+    if start_time is not None:
+        clauses.append("save_epoch_time >= ?")
+        arguments.append(start_time)
+    if end_time is not None:
+        clauses.append("save_epoch_time <= ?")
+        arguments.append(end_time)
+    if edf_range is not None:
+        clauses.append("edf_number BETWEEN ? AND ?")
+        arguments.extend(int(edf_number) for edf_number in edf_range)
+    if params is not None:
+        for key, condition in params.items():
+            clause, clause_arguments = _where_param(key, condition)
+            clauses.append(clause)
+            arguments.extend(clause_arguments)
+    query = "SELECT data_number FROM experiments"
+    if len(clauses) > 0:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY data_number"
+    connection = _connect()
+    try:
+        return [row[0] for row in connection.execute(query, arguments)]
+    finally:
+        connection.close()
+
+
+def get_indexed_params(data_number: int) -> dict[str, Any]:
+    """Returns the indexed parameters of an experiment. Quantities are returned in base units."""
+    connection = _connect()
+    try:
+        rows = connection.execute(
+            "SELECT key, value, text, unit FROM params WHERE data_number = ?", (data_number,)
+        ).fetchall()
+    finally:
+        connection.close()
+    params = {}
+    for key, value, text, unit in rows:
+        if text is not None:
+            params[key] = text
+        elif unit is not None:
+            params[key] = Q_(value, unit)
+        else:
+            params[key] = value
+    return params
+
+
+def backfill_header_index(first: Optional[int] = None, last: Optional[int] = None, commit_every: int = 1000) -> int:
+    """Adds existing experiment data files that are not in the header index.
+
+    Args:
+        first: int, first data number to check. Default None checks from the first data.
+        last: int, last data number to check. Default None checks to the last data.
+        commit_every: int, number of files indexed between database commits.
+
+    Returns:
+        int, number of data files added to the index.
+    """
+    from ._data_handler import get_lazy_experiment_data
+
+    links_folder = op.join(expt_folder, "links")
+    data_numbers = []
+    if op.isdir(links_folder):
+        with os.scandir(links_folder) as shards:
+            for shard in shards:
+                if not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as links:
+                    for link in links:
+                        if not link.name.isdigit():
+                            continue
+                        data_number = int(link.name)
+                        if (first is None or data_number >= first) and (last is None or data_number <= last):
+                            data_numbers.append(data_number)
+    data_numbers.sort()
+
+    connection = _connect()
+    indexed = {row[0] for row in connection.execute("SELECT data_number FROM experiments")}
+    added = 0
+    try:
+        for data_number in data_numbers:
+            if data_number in indexed:
+                continue
+            try:
+                with get_lazy_experiment_data(data_number) as data:
+                    headers = data.headers
+            except Exception as e:
+                print(f"Cannot read experiment data {data_number}: {e}")
+                continue
+            _insert_headers(connection, headers)
+            added += 1
+            if added % commit_every == 0:
+                connection.commit()
+        connection.commit()
+    finally:
+        connection.close()
+    return added
@@ -0,0 +1,210 @@
+import os
+import os.path as op
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from ._data_path import expt_folder, expt_rjust, _replace_symlink
+
+_DATE_FOLDER = re.compile(r"^\d{4}_\d{2}$")
+_DATA_FILE = re.compile(r"^(\d+) - .*\.npz$")
+
+
+def _link_path(folder_name: str, number: int) -> str:
+    link_folder_name = str(number // 100000).rjust(expt_rjust - 5, "0")
+    return op.join(expt_folder, folder_name, link_folder_name, str(number))
+
+
+def _scan_day(day_folder: str) -> list[tuple[int, str]]:
+    """(data number, path) of the data files in a day folder."""
+    files = []
+    with os.scandir(day_folder) as entries:
+        for entry in entries:
+            match = _DATA_FILE.match(entry.name)
+            if match is not None and entry.is_file(follow_symlinks=False):
+                files.append((int(match.group(1)), entry.path))
+    return files
+
+
+def _scan_links(shard_folder: str) -> list[tuple[int, str]]:
+    """(number, link target) of the links in a link folder."""
+    links = []
+    with os.scandir(shard_folder) as entries:
+        for entry in entries:
+            if entry.name.isdigit() and entry.is_symlink():
+                links.append((int(entry.name), os.readlink(entry.path)))
+    return links
+
+
+def _check_file(file_path: str, read_edf_number: bool) -> tuple[Optional[str], Optional[int]]:
+    """(error, EDF number) of a data file. error is None if the zip archive is complete.
+
+    A file that is not completely written has no zip central directory, or members that end
+    beyond the end of the file.
+    """
+    from ._experiment_data import ExperimentData
+
+    try:
+        file_size = op.getsize(file_path)
+        with zipfile.ZipFile(file_path) as zip_file:
+            for info in zip_file.infolist():
+                if info.header_offset + info.compress_size > file_size:
+                    return (f"member {info.filename} is truncated", None)
+        if not read_edf_number:
+            return (None, None)
+        with ExperimentData(file_path) as data:
+            return (None, data.headers["data_info"].get("edf_number"))
+    except (OSError, zipfile.BadZipFile, ValueError, KeyError, EOFError) as e:
+        return (f"{type(e).__name__}: {e}", None)
+
+
+def _subfolders(folder: str) -> list[str]:
+    if not op.isdir(folder):
+        return []
+    with os.scandir(folder) as entries:
+        return [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+
+def scan_data_folder(
+    check_files: bool = True,
+    check_edf_numbers: bool = False,
+    repair: bool = False,
+    max_workers: int = 16,
+) -> dict[str, Any]:
+    """Checks the experiment data folder and optionally repairs the links.
+
+    Checks that
+        - each data link and EDF link resolves to an existing data file,
+        - each data link points to the data file with its data number,
+        - each data file has a data link (files without one are orphaned),
+        - no data number has more than one data file,
+        - no two EDF links point to the same data file,
+        - data files are complete zip archives (check_files),
+        - each EDF number in the headers has an EDF link to its latest data (check_edf_numbers).
+
+    Folders are listed with os.scandir and files are checked in a thread pool, so that the scan can
+    run nightly over millions of files.
+
+    Example:
+        python -c "from onix.data_tools import scan_data_folder; scan_data_folder(repair=True)"
+
+    Args:
+        check_files: bool, whether to check that the data files are complete zip archives.
+        check_edf_numbers: bool, whether to read the EDF numbers from the headers. Slower.
+        repair: bool, whether to remove broken links and create missing and mismatched links.
+            Duplicated data numbers, duplicate EDF links and bad archives are only reported.
+        max_workers: int, number of threads.
+
+    Returns:
+        dict of lists of problems, and a "repaired" list of (link, target) created or removed (target None).
+    """
+    day_folders = [
+        day for year_month in _subfolders(expt_folder) if _DATE_FOLDER.match(op.basename(year_month))
+        for day in _subfolders(year_month)
+    ]
+    with ThreadPoolExecutor(max_workers) as executor:
+        files = {}
+        duplicate_data_numbers = []
+        for day_files in executor.map(_scan_day, day_folders):
+            for data_number, file_path in day_files:
+                if data_number in files:
+                    duplicate_data_numbers.append((data_number, files[data_number], file_path))
+                else:
+                    files[data_number] = file_path
+        links = {}
+        for shard_links in executor.map(_scan_links, _subfolders(op.join(expt_folder, "links"))):
+            links.update(shard_links)
+        edf_links = {}
+        for shard_links in executor.map(_scan_links, _subfolders(op.join(expt_folder, "edf_links"))):
+            edf_links.update(shard_links)
+
+        file_checks = {}
+        if check_files or check_edf_numbers:
+            numbers = sorted(files)
+            results = executor.map(
+                lambda data_number: _check_file(files[data_number], check_edf_numbers), numbers, chunksize=64
+            )
+            file_checks = dict(zip(numbers, results))
+
+    report = {
+        "broken_links": [],
+        "mismatched_links": [],
+        "orphaned_files": [],
+        "duplicate_data_numbers": duplicate_data_numbers,
+        "bad_archives": [],
+        "broken_edf_links": [],
+        "duplicate_edf_links": [],
+        "missing_edf_links": [],
+        "repaired": [],
+    }
+    for data_number, target in sorted(links.items()):
+        if not op.exists(target):
+            report["broken_links"].append((data_number, target))
+        elif data_number in files and op.realpath(target) != op.realpath(files[data_number]):
+            report["mismatched_links"].append((data_number, target, files[data_number]))
+    for data_number, file_path in sorted(files.items()):
+        if data_number not in links:
+            report["orphaned_files"].append((data_number, file_path))
+    for data_number, (error, _) in sorted(file_checks.items()):
+        if error is not None:
+            report["bad_archives"].append((data_number, files[data_number], error))
+
+    edf_targets = {}
+    for edf_number, target in sorted(edf_links.items()):
+        if not op.exists(target):
+            report["broken_edf_links"].append((edf_number, target))
+            continue
+        real_target = op.realpath(target)
+        if real_target in edf_targets:
+            report["duplicate_edf_links"].append((edf_targets[real_target], edf_number, target))
+        else:
+            edf_targets[real_target] = edf_number
+    if check_edf_numbers:
+        latest = {}
+        for data_number, (_, edf_number) in sorted(file_checks.items()):
+            if edf_number is not None:
+                latest[int(edf_number)] = data_number
+        for edf_number, data_number in sorted(latest.items()):
+            target = edf_links.get(edf_number)
+            if target is None or op.realpath(target) != op.realpath(files[data_number]):
+                report["missing_edf_links"].append((edf_number, files[data_number]))
+
+    if repair:
+        for data_number, target in report["broken_links"]:
+            link = _link_path("links", data_number)
+            if data_number in files:
+                _replace_symlink(files[data_number], link)
+                report["repaired"].append((link, files[data_number]))
+            else:
+                os.remove(link)
+                report["repaired"].append((link, None))
+        for data_number, _, file_path in report["mismatched_links"]:
+            link = _link_path("links", data_number)
+            _replace_symlink(file_path, link)
+            report["repaired"].append((link, file_path))
+        for data_number, file_path in report["orphaned_files"]:
+            link = _link_path("links", data_number)
+            os.makedirs(op.dirname(link), exist_ok=True)
+            os.symlink(file_path, link)
+            report["repaired"].append((link, file_path))
+        for edf_number, target in report["broken_edf_links"]:
+            link = _link_path("edf_links", edf_number)
+            os.remove(link)
+            report["repaired"].append((link, None))
+        for edf_number, file_path in report["missing_edf_links"]:
+            link = _link_path("edf_links", edf_number)
+            os.makedirs(op.dirname(link), exist_ok=True)
+            _replace_symlink(file_path, link)
+            report["repaired"].append((link, file_path))
+    return report
+
+
+def print_scan_report(report: dict[str, Any]):
+    """Prints a summary of scan_data_folder results."""
+    for name, problems in report.items():
+        print(f"{name}: {len(problems)}")
+        for problem in problems[:10]:
+            print(f"    {problem}")
+        if len(problems) > 10:
+            print(f"    ... and {len(problems) - 10} more")
@@ -1,78 +1,206 @@
-import pandas as pd
-import numpy as np
-import h5py
-import logging
 import os
-from uncertainties import ufloat, unumpy
-
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-interval = 8
-
-def h5_file_checker_getter(data, save_directory):
-    indices = data.index
-    stops = (np.floor(indices/interval) + 1) * interval - 1
-    starts = np.floor(indices/interval) * interval
-    start_stop = np.stack((starts,stops), axis=1)
-    start_stop = np.unique(start_stop, axis=0)
-    file_list = []
-    for strt_stp in start_stop:
-        with h5py.File(f"{save_directory}{int(strt_stp[0])}_{int(strt_stp[1])}.h5", "a") as f:
-            pass
-        file_list.append(f"{save_directory}{int(strt_stp[0])}_{int(strt_stp[1])}.h5")
-    return file_list
-
-def get_start_stop(file):
-    start_stop_str, _ = file.split(("."))
-    start_str, stop_str = start_stop_str.split("_")
-    start = int(start_str)
-    stop = int(stop_str)
-    return start, stop
-
-def get_saved_files(first, last, save_directory):
-    first_ceiling = (np.floor(first/interval) + 1) * interval - 1
-    first_floor = np.floor(first/interval) * interval
-    last_floor = (np.floor(last/interval) + 1) * interval
-    num_of_intervals = int((last_floor - first_floor + 1) / interval)
-    starts = np.array([first_floor + i*interval for i in range(num_of_intervals)])
-    stops = np.array([first_ceiling + i*interval for i in range(num_of_intervals)])
-    start_stop = np.stack((starts, stops), axis=1)
-    file_list = []
-    for strt_stp in start_stop:
-        file_list.append(f"{save_directory}{int(strt_stp[0])}_{int(strt_stp[1])}.h5")
-    return file_list
-
-              
-def get_processed_data(first, last, save_directory):
-    processed_data_files = get_saved_files(first, last, save_directory)
-    load_df = pd.DataFrame()
-    for file in processed_data_files:
-        try:  # Do try loop if the file exists. If not, continue.
-            file_name = file.rsplit('/', 1)[-1]
-            start, stop = get_start_stop(file_name)
-            floor = max(first, start)
-            ceiling = min(last, stop)
-            load_dataset = pd.read_hdf(file, key="data")
-            load_dataset = load_dataset[(load_dataset.index >= floor) & (load_dataset.index <= ceiling)]
-            load_df = pd.concat((load_df, load_dataset))
-        except:
+import re
+import warnings
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import tables
+
+PARTITION_SIZE = 100000  # index values per partition file.
+KEY = "data"
+_LEGACY_INTERVAL = 8  # partition size of files saved before the table format.
+_PARTITION_FILE = re.compile(r"^(\d+)_(\d+)\.h5$")
+
+
+def _partition_file(save_directory: str, start: int, partition_size: int) -> str:
+    """Path of the partition file that holds the index values from start to start + partition_size - 1.
+
+    save_directory is a path prefix, usually a folder ending with a path separator.
+    """
+    return f"{save_directory}{start}_{start + partition_size - 1}.h5"
+
+
+def _partition_starts(first: int, last: int, partition_size: int) -> range:
+    first_start = int(first) // partition_size * partition_size
+    return range(first_start, int(last) + 1, partition_size)
+
+
+def _read_partition(file: str, first: int, last: int, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    """Reads rows with index values from first to last of a partition file.
+
+    Only the rows in the index range are read from the table. Rows that are saved more than once
+    keep the last saved values.
+    """
+    try:
+        with pd.HDFStore(file, mode="r") as store:
+            storer = store.get_storer(KEY)
+            if storer is None:
+                raise ValueError(f"Processed data file {file} does not contain \"{KEY}\".")
+            if storer.is_table:
+                data = store.select(KEY, where=f"index >= {int(first)} & index <= {int(last)}", columns=columns)
+            else:
+                # fixed format files saved before the table format can only be read fully.
+                data = store.select(KEY, columns=columns)
+                data = data[(data.index >= first) & (data.index <= last)]
+    except (OSError, ValueError, KeyError, TypeError, tables.HDF5ExtError) as e:
+        raise ValueError(f"Cannot read processed data file {file}: {e}") from e
+    return data[~data.index.duplicated(keep="last")]
+
+
+def _legacy_files(save_directory: str, first: int, last: int) -> list[tuple[int, str]]:
+    """(start, path) of the 8-row files saved before the partition files, that overlap first to last."""
+    folder, prefix = os.path.split(save_directory)
+    if not os.path.isdir(folder or "."):
+        return []
+    files = []
+    for name in os.listdir(folder or "."):
+        match = _PARTITION_FILE.match(name[len(prefix):]) if name.startswith(prefix) else None
+        if match is None:
+            continue
+        start, stop = int(match.group(1)), int(match.group(2))
+        if stop - start + 1 == _LEGACY_INTERVAL and start <= last and stop >= first:
+            files.append((start, os.path.join(folder, name)))
+    return sorted(files)
+
+
+def get_processed_data(
+    first: int,
+    last: int,
+    save_directory: str,
+    columns: Optional[list[str]] = None,
+    partition_size: int = PARTITION_SIZE,
+) -> pd.DataFrame:
+    """Gets processed data with index values from first to last.
+
+    Partitions without a file have no saved data and are skipped. Files that cannot be read raise ValueError.
+    8-row files saved before the partition files are also read, until they are moved by migrate_processed_data.
+    Rows in partition files replace rows of the same index in 8-row files, as they are saved later.
+
+    Args:
+        first: int, first index value.
+        last: int, last index value, inclusive.
+        save_directory: str, path prefix of the partition files.
+        columns: list of str, columns to read. Default None reads all columns.
+        partition_size: int, number of index values in each partition file.
+
+    Returns:
+        pd.DataFrame, processed data sorted by index.
+    """
+    frames = []
+    if partition_size != _LEGACY_INTERVAL:
+        for start, file in _legacy_files(save_directory, first, last):
+            frames.append(_read_partition(file, max(first, start), min(last, start + _LEGACY_INTERVAL - 1), columns))
+    for start in _partition_starts(first, last, partition_size):
+        file = _partition_file(save_directory, start, partition_size)
+        if os.path.exists(file):
+            frames.append(_read_partition(file, max(first, start), min(last, start + partition_size - 1), columns))
+    if len(frames) == 0:
+        return pd.DataFrame()
+    data = pd.concat(frames)
+    return data[~data.index.duplicated(keep="last")].sort_index()
+
+
+def _write_partition(file: str, data: pd.DataFrame, min_itemsize: Optional[dict[str, int]] = None):
+    """Writes a partition file in one step.
+
+    Uses the table format, or the fixed format for columns that the table format cannot save
+    (e.g. object or list columns). Fixed format partitions are rewritten on each save.
+    """
+    temp_file = file + ".rewriting"
+    try:
+        data.to_hdf(temp_file, key=KEY, mode="w", format="table", min_itemsize=min_itemsize)
+    except (TypeError, ValueError) as e:
+        warnings.warn(f"Saving processed data file {file} in the fixed format, which cannot be appended to: {e}")
+        data.to_hdf(temp_file, key=KEY, mode="w", format="fixed")
+    os.replace(temp_file, file)
+
+
+def _rewrite_partition(file: str, data: pd.DataFrame, min_itemsize: Optional[dict[str, int]] = None):
+    """Rewrites a partition file with its saved rows and new rows. New rows replace saved rows of the same index."""
+    if os.path.exists(file):
+        saved = pd.read_hdf(file, key=KEY)
+        data = pd.concat((saved, data))
+    data = data[~data.index.duplicated(keep="last")].sort_index()
+    _write_partition(file, data, min_itemsize)
+
+
+def save_processed_data(
+    data: pd.DataFrame,
+    save_directory: str,
+    partition_size: int = PARTITION_SIZE,
+    min_itemsize: Optional[dict[str, int]] = None,
+):
+    """Appends processed data to the partition files.
+
+    Rows are appended to the table of each partition without reading the saved rows. Rows with an index
+    value that is already saved replace the saved rows when read. Use compact_processed_data to remove
+    the replaced rows from the files.
+
+    A partition is rewritten instead if the new rows do not match its columns or dtypes, or if a
+    string is longer than the string column saved in the table.
+
+    Args:
+        data: pd.DataFrame, processed data with an integer index.
+        save_directory: str, path prefix of the partition files.
+        partition_size: int, number of index values in each partition file.
+        min_itemsize: dict of column name to the least number of characters saved for string
+            columns of new partition files, so that longer strings can be appended later.
+    """
+    if len(data) == 0:
+        return
+    index = np.asarray(data.index)
+    if not np.issubdtype(index.dtype, np.integer):
+        raise ValueError("Processed data must have an integer index.")
+    partition_starts = index // partition_size * partition_size
+    for start in np.unique(partition_starts):
+        file = _partition_file(save_directory, int(start), partition_size)
+        new_data = data[partition_starts == start]
+        if not os.path.exists(file):
+            # a failed append would leave an empty table in a new file.
+            _write_partition(file, new_data, min_itemsize)
             continue
-    return load_df
-
-def save_processed_data(data, save_directory):
-    # data is an array like object:
-    first = data.index[0]    # NB: assumes that pandas dataframe is sorted by index from least to greatest
-    last = data.index[-1]
-    file_list = h5_file_checker_getter(data, save_directory)
-    for file in file_list:
-        file_name = file.rsplit('/', 1)[-1]
-        start, stop = get_start_stop(file_name)
-        new_data_in_this_file = data[(data.index >= start) & (data.index <= stop)]
         try:
-            old_data_in_this_file = pd.read_hdf(file)
-            update = pd.concat((old_data_in_this_file, new_data_in_this_file))
-            update = update[~update.index.duplicated(keep='last')]
-            update = update.sort_index()
-            update.to_hdf(file, mode="w", key='data')
-        except:
-            new_data_in_this_file.to_hdf(file, mode="w", key='data')
\ No newline at end of file
+            with pd.HDFStore(file, mode="a") as store:
+                storer = store.get_storer(KEY) if KEY in store else None
+                if storer is not None and not storer.is_table:
+                    raise ValueError("the file is saved in the fixed format")
+                store.append(KEY, new_data, format="table", index=False, min_itemsize=min_itemsize)
+        except (ValueError, TypeError) as e:
+            warnings.warn(f"Rewriting processed data file {file}, as the new rows cannot be appended: {e}")
+            _rewrite_partition(file, new_data, min_itemsize)
+
+
+def compact_processed_data(save_directory: str):
+    """Rewrites each partition file without the rows replaced by later saves, and indexes the table."""
+    folder, prefix = os.path.split(save_directory)
+    for name in sorted(os.listdir(folder or ".")):
+        if name.startswith(prefix) and _PARTITION_FILE.match(name[len(prefix):]):
+            file = os.path.join(folder, name)
+            data = pd.read_hdf(file, key=KEY)
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+            _write_partition(file, data)
+
+
+def migrate_processed_data(save_directory: str, partition_size: int = PARTITION_SIZE) -> int:
+    """Moves processed data saved in 8-row files to partition files of partition_size rows.
+
+    Returns:
+        int, number of files migrated and removed.
+    """
+    folder, prefix = os.path.split(save_directory)
+    files = []
+    for name in os.listdir(folder or "."):
+        match = _PARTITION_FILE.match(name[len(prefix):]) if name.startswith(prefix) else None
+        if match is not None and int(match.group(2)) - int(match.group(1)) + 1 == _LEGACY_INTERVAL:
+            files.append((int(match.group(1)), os.path.join(folder, name)))
+    files.sort()
+    for _, file in files:
+        try:
+            data = pd.read_hdf(file, key=KEY)
+        except (OSError, ValueError, KeyError, tables.HDF5ExtError) as e:
+            raise ValueError(f"Cannot read processed data file {file}: {e}") from e
+        save_processed_data(data, save_directory, partition_size)
+    for _, file in files:
+        os.remove(file)
+    return len(files)
@@ -0,0 +1,47 @@
+"""Stress test of the data number counter with many concurrent writer processes.
+
+Each process reserves data numbers from the same counter file in a temporary folder, one at a time
+or in batches. The test checks that no data number is given out twice and none is skipped.
+
+Run as a script:
+    python -m onix.data_tools.data_number_stress
+"""
+import multiprocessing
+import tempfile
+
+from onix.data_tools._data_path import DataNumberAllocator, _reserve_data_numbers
+
+
+def _reserve(folder, number_of_reserves, batch_size):
+    allocator = DataNumberAllocator(folder, batch_size)
+    return [allocator.next() for _ in range(number_of_reserves)]
+
+
+def stress_test(number_of_processes=16, number_of_reserves=500, batch_size=1):
+    """Runs the stress test.
+
+    Args:
+        number_of_processes: int, number of concurrent writer processes.
+        number_of_reserves: int, number of data numbers each process uses.
+        batch_size: int, number of data numbers each process reserves at once.
+
+    Returns:
+        tuple of (number of duplicated data numbers, number of skipped data numbers).
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        with multiprocessing.Pool(number_of_processes) as pool:
+            results = pool.starmap(
+                _reserve, [(folder, number_of_reserves, batch_size)] * number_of_processes
+            )
+        last = _reserve_data_numbers(folder, 1)[0] - 1
+    numbers = [number for result in results for number in result]
+    duplicated = len(numbers) - len(set(numbers))
+    # numbers left in the last batch of each process are expected to be skipped.
+    skipped = last - len(set(numbers)) - sum(-number_of_reserves % batch_size for _ in results)
+    return duplicated, skipped
+
+
+if __name__ == "__main__":
+    for batch_size in (1, 100):
+        duplicated, skipped = stress_test(batch_size=batch_size)
+        print(f"batch size {batch_size}: {duplicated} duplicated, {skipped} skipped")
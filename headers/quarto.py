@@ -1,42 +1,24 @@
-import serial
-import time
 import re
 import numpy as np
 import matplotlib.pyplot as plt
 
+from onix.headers.quarto_transport import QuartoTransport
 
-class Quarto:
+
+class Quarto(QuartoTransport):
     def __init__(self, location='/dev/ttyACM1'):
-        self.address = location
-        self.device = serial.Serial(self.address,
-                                    baudrate=115200,
-                                    timeout=0.2)
+        super().__init__(location, timeout=0.2)
 
         self.sample_time = 2e-6
 
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        out = "state\n"
-        self.device.write(out.encode('utf-8'))
-        time.sleep(0.1)
-        response = self.device.readlines()
+        self.query("state")
 
     def getset_state(self, set=False, val=0):
         if set == False:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = "state\n"
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
+            response = self.query("state")
         else:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = "state " + str(val) + '\n'
             self.state = val
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
-
-        response = self.device.readlines()[0].decode('utf-8').strip('\n')
+            response = self.query("state " + str(val))
         response = int(re.findall(r'\d+', response)[0])
 
         self.state = response
@@ -44,20 +26,10 @@ class Quarto:
 
     def getset_V_center(self, set=False, val=0):
         if set == False:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = 'vcenter\n'
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
+            response = self.query("vcenter")
         else:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = "vcenter " + str(val) + '\n'
             self.V_center = val
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
-
-        response = self.device.readlines()[0].decode('utf-8').strip('\n')
+            response = self.query("vcenter " + str(val))
         response = float(re.findall(r'\d+\.\d+', response)[0])
 
         self.V_center = response
@@ -65,20 +37,10 @@ class Quarto:
 
     def getset_V_scan(self, set=False, val=0):
         if set == False:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = 'vscan\n'
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
+            response = self.query("vscan")
         else:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = "vscan " + str(val) + '\n'
             self.V_scan = val
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
-
-        response = self.device.readlines()[0].decode('utf-8').strip('\n')
+            response = self.query("vscan " + str(val))
         response = float(re.findall(r'\d+\.\d+', response)[0])
 
         self.V_scan = response
@@ -86,32 +48,16 @@ class Quarto:
 
     def getset_V_pushstep(self, set=False, val=0):
         if set == False:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = "vpushstep\n"
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
+            response = self.query("vpushstep")
         else:
-            self.device.reset_input_buffer()
-            self.device.reset_output_buffer()
-            out = "vpushstep " + str(val) + "\n"
             self.V_pushstep = val
-            self.device.write(out.encode('utf-8'))
-            time.sleep(0.1)
-
-        response = self.device.readlines()[0].decode('utf-8').strip('\n')
+            response = self.query("vpushstep " + str(val))
         response = float(re.findall(r'\d+\.\d+', response)[0])
         self.V_pushstep = response
         print("V push step:", response)
 
     def get_V_output(self):
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        out = "voutput\n"
-        self.device.write(out.encode('utf-8'))
-        time.sleep(0.1)
-
-        response = self.device.readlines()[0].decode('utf-8').strip('\n')
+        response = self.query("voutput")
         response = float(re.findall(r'\d+\.\d+', response)[0])
         self.V_output = response
         print("V output:", response)
@@ -231,6 +177,3 @@ class Quarto:
             plt.show()
         else:
             print("No error data!")
-
-    def close(self):
-        self.device.close()
@@ -1,39 +1,26 @@
-import serial
 import numpy as np
 
+from onix.headers.quarto_transport import QuartoTransport
 
-class Quarto:
-    def __init__(self, location='/dev/ttyACM4'):
-        self.address = location
-        self.device = serial.Serial(
-            self.address,
-            baudrate=115200,
-            timeout=0.22
-        )
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
 
-    def _query(self, name):
-        out = name + '\n'
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\n')
-        return response
+class Quarto(QuartoTransport):
+    def __init__(self, location='/dev/ttyACM4'):
+        super().__init__(location, timeout=0.22)
 
     def setup(self, segment_length: int, segment_number: int):
-        response = self._query(f"setup {segment_length} {segment_number}")
+        response = self.query(f"setup {segment_length} {segment_number}")
         print(response)
 
     def start(self):
-        response = self._query("start")
+        response = self.query("start")
         print(response)
 
     def stop(self):
-        response = self._query("stop")
+        response = self.query("stop")
         print(response)
 
     def data(self):
-        triggers_too_soon = int(self._query("trigger_too_soon").split(" ")[-1])
+        triggers_too_soon = int(self.query("trigger_too_soon").split(" ")[-1])
         if triggers_too_soon > 0:
             raise RuntimeError(f"Triggered too soon {triggers_too_soon} times before data taking finished.")
         self.device.write("data\n".encode('utf-8'))
@@ -42,7 +29,3 @@ class Quarto:
         for kk in range(ch1_length):
             ch1_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
         return np.array(ch1_data)
-
-    def close(self):
-        self.device.close()
-
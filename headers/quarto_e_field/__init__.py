@@ -1,31 +1,12 @@
-import serial
 from onix.headers.find_quarto import find_quarto
+from onix.headers.quarto_transport import QuartoTransport
 
 from onix.units import ureg, Q_
 
 
-class Quarto:
+class Quarto(QuartoTransport):
     def __init__(self, location=find_quarto("digitizer"), num_channels = 4):
-        self.address = location
-        self.device = serial.Serial(
-            self.address,
-            baudrate=115200,
-            timeout=0.22
-        )
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-
-    def _get_param(self, param):
-        out = param + '\n'
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\r\n').split(" ")[-1]
-        return response
-    
-    def _set_param(self, param, value):
-        out = param + " " + str(value) + '\n'
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
+        super().__init__(location, timeout=0.22)
 
     def V_low(self, value = None):
         if value is not None:
@@ -61,7 +42,3 @@ class Quarto:
         rise_time_us = str(int(round(rise_time.to("us").magnitude)))
         fall_time_us = str(int(round(fall_time.to("us").magnitude)))
         self._set_param("pulse_time_us", f"{rise_time_us} {fall_time_us}")
-    
-    def close(self):
-        self.device.close()
-
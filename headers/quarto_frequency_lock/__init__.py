@@ -1,37 +1,66 @@
-import serial
+import struct
 import time
+import zlib
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import animation
 from onix.analysis.power_spectrum import PowerSpectrum
+from onix.headers.quarto_transport import QuartoTransport
 
 
 DEFAULT_GET_DATA_LENGTH = 1000
-
-class Quarto:
-    def __init__(self, location='/dev/ttyACM1'):
-        self.address = location
-        self.device = serial.Serial(self.address,
-                                    baudrate=115200,
-                                    timeout=0.2)
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-
-
-    def _get_param(self, param):
-        out = param + '\n'
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\n').split(" ")[-1]
-        return response
-
-    def _set_param(self, param, val):
-        out = param + " " + str(val) + '\n'
-        self.state = val
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\n').split(" ")[-1]
-        return response
+ALL_DATA_NAMES = ["error", "output", "transmission", "cavity_error"]
+LOCK_STATE_PARAMS = [
+    "state",
+    "integral",
+    "dc_offset",
+    "unlock_counter",
+    "last_transmission_point",
+    "last_output_point",
+    "transmission_unlock",
+    "limit_warnings",
+]
+
+# Binary data frame: "QB", uint8 dtype code, uint8 number of channels, uint32 number of samples per channel,
+# float32 scale, the little-endian samples of each channel, and the uint32 CRC-32 of the samples.
+BINARY_MAGIC = b"QB"
+BINARY_HEADER = struct.Struct("<2sBBIf")
+BINARY_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<i2")}
+
+
+def limit_warning_text(val):
+    """
+    Returns (integral warning, output warning) texts of the "limit_warnings" indicator bits.
+    """
+    if (val // 2**0) % 2 == 1:
+        integral_warning = "Integral warning"
+    elif (val // 2**1) % 2 == 1:
+        integral_warning = "Integral out of bounds"
+    else:
+        integral_warning = "Integrator good"
+
+    if (val // 2**2) % 2 == 1:
+        output_warning = "Output warning"
+    elif (val // 2**3) % 2 == 1:
+        output_warning = "Output out of bounds"
+    else:
+        output_warning = "Output good"
+
+    return integral_warning, output_warning
+
+class Quarto(QuartoTransport):
+    """Frequency lock Quarto.
+
+    Traces are read in binary frames if the firmware supports them, and in ASCII lines otherwise.
+
+    Args:
+        location: str, serial port.
+        binary: bool or None, whether to read traces in binary frames. Default None detects whether
+            the firmware supports binary frames at the first trace readout.
+    """
+    def __init__(self, location='/dev/ttyACM1', binary=None):
+        super().__init__(location, timeout=0.2)
+        self.binary = binary
 
     def get_p_gain(self):
         val = float(self._get_param("p_gain"))
@@ -100,9 +129,32 @@ class Quarto:
         val = float(self._get_param("transmission_unlock"))
         return val
     
+    def get_lock_state(self):
+        """
+        Returns a dict of the lock state values, read in one round trip.
+        """
+        values = self.get_params(LOCK_STATE_PARAMS)
+        state = {
+            "state": int(values["state"]),
+            "integral": float(values["integral"]),
+            "dc_offset": float(values["dc_offset"]),
+            "unlock_counter": float(values["unlock_counter"]),
+            "last_transmission_point": float(values["last_transmission_point"]),
+            "last_output_point": float(values["last_output_point"]),
+            "transmission_unlock": float(values["transmission_unlock"]),
+            "limit_warnings": int(values["limit_warnings"]),
+        }
+        self.state = state["state"]
+        self.integral = state["integral"]
+        self.dc_offset = state["dc_offset"]
+        self.unlock_counter = state["unlock_counter"]
+        return state
+
     def check_lock(self):
-        unlock_counter = self.get_unlock_counter()
-        if self.get_last_transmission_point() > self.get_transmission_voltage():
+        values = self.get_params(["unlock_counter", "last_transmission_point", "transmission_unlock"])
+        unlock_counter = float(values["unlock_counter"])
+        self.unlock_counter = unlock_counter
+        if float(values["last_transmission_point"]) > float(values["transmission_unlock"]):
             locked = True
         else:
             locked = False
@@ -162,148 +214,117 @@ class Quarto:
         """
         Prints warnings if integrator and output are near (within 10% of) their limits or outside of their limits.
         """
-        val = int(self._get_param("limit_warnings"))
-
-        if (val // 2**0) % 2 == 1:
-            integral_warning = "Integral warning"
-        elif (val // 2**1) % 2 == 1:
-            integral_warning = "Integral out of bounds"
-        else:
-            integral_warning = "Integrator good"
-
-        if (val // 2**2) % 2 == 1:
-            output_warning = "Output warning"
-        elif (val // 2**3) % 2 == 1:
-            output_warning = "Output out of bounds"
+        return limit_warning_text(int(self._get_param("limit_warnings")))
+
+    def _read_exact(self, length):
+        """Reads length bytes. Raises TimeoutError if no byte arrives within the serial timeout."""
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.device.read(length - len(data))
+            if len(chunk) == 0:
+                raise TimeoutError(f"Received {len(data)} of {length} bytes from the Quarto.")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _read_binary_frame(self, header):
+        """Reads the rest of a binary data frame after its header and returns a (channels, samples) array."""
+        magic, dtype_code, channels, samples, scale = BINARY_HEADER.unpack(header)
+        if magic != BINARY_MAGIC or dtype_code not in BINARY_DTYPES:
+            raise ValueError(f"Invalid binary data frame header {magic}.")
+        dtype = BINARY_DTYPES[dtype_code]
+        payload = self._read_exact(channels * samples * dtype.itemsize)
+        (checksum,) = struct.unpack("<I", self._read_exact(4))
+        if zlib.crc32(payload) != checksum:
+            raise ValueError("Binary data frame checksum does not match.")
+        data = np.frombuffer(payload, dtype=dtype).reshape(channels, samples)
+        if dtype.kind == "i":
+            return data * scale
+        return data.astype(float)
+
+    def _get_binary_data(self, command):
+        """Reads a binary data frame of a command, or returns None if the firmware does not support binary frames."""
+        if self.binary is False:
+            return None
+        self.device.reset_input_buffer()
+        self.device.reset_output_buffer()
+        self.device.write((command + "\n").encode('utf-8'))
+        if self.binary is None:
+            # old firmware ignores the unknown command, so nothing arrives before the timeout.
+            magic = self.device.read(len(BINARY_MAGIC))
+            if magic != BINARY_MAGIC:
+                self.binary = False
+                self.device.reset_input_buffer()
+                return None
+            self.binary = True
+            header = magic + self._read_exact(BINARY_HEADER.size - len(BINARY_MAGIC))
         else:
-            output_warning = "Output good"
+            header = self._read_exact(BINARY_HEADER.size)
+        return self._read_binary_frame(header)
 
-        return integral_warning, output_warning
+    def _read_ascii_data(self, length):
+        """Reads length lines of ASCII floats."""
+        data = np.empty(length)
+        for i in range(length):
+            try:
+                data[i] = float(self.device.readline().decode('utf-8').strip('\n'))
+            except ValueError as e:
+                print(i)
+                raise e
+        return data
 
-    def get_error_data(self, val = None):
-        """
-        Returns list of error data
-        """
+    def _get_trace_data(self, name, val):
         if val is None:
             val = DEFAULT_GET_DATA_LENGTH
-        self.error_data = []
+        data = self._get_binary_data(f"{name}_data_binary {val}")
+        if data is not None:
+            return data[0]
         self.device.reset_input_buffer()
         self.device.reset_output_buffer()
-        out = "error_data " + str(val) + "\n"
+        out = f"{name}_data {val}\n"
         self.device.write(out.encode('utf-8'))
-        for i in range(val):
-            try:
-                self.error_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        self.error_data = np.asarray(self.error_data)
+        return self._read_ascii_data(val)
 
+    def get_error_data(self, val = None):
+        """
+        Returns list of error data
+        """
+        self.error_data = self._get_trace_data("error", val)
         return self.error_data
 
     def get_transmission_data(self, val = None):
         """
         Returns list of transmission data
         """
-        if val is None:
-            val = DEFAULT_GET_DATA_LENGTH
-        self.transmission_data = []
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        out = "transmission_data " + str(val) + "\n"
-        self.device.write(out.encode('utf-8'))
-        for i in range(val):
-            try:
-                self.transmission_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        self.transmission_data = np.asarray(self.transmission_data)
-
+        self.transmission_data = self._get_trace_data("transmission", val)
         return self.transmission_data
 
     def get_output_data(self, val = None):
         """
         Returns list of output data
         """
-        if val is None:
-            val = DEFAULT_GET_DATA_LENGTH
-        self.output_data = []
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        out = "output_data " + str(val) + "\n"
-        self.device.write(out.encode('utf-8'))
-        for i in range(val):
-            try:
-                self.output_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        self.output_data = np.asarray(self.output_data)
-
+        self.output_data = self._get_trace_data("output", val)
         return self.output_data
     
     def get_cavity_error_data(self, val = None):
         """
-        Returns list of output data
+        Returns list of cavity error data
         """
-        if val is None:
-            val = DEFAULT_GET_DATA_LENGTH
-        self.cavity_error_data = []
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        out = "cavity_error_data"  + str(val) + "\n"
-        self.device.write(out.encode('utf-8'))
-        for i in range(val):
-            try:
-                self.cavity_error_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        self.cavity_error_data = np.asarray(self.cavity_error_data)
-
+        self.cavity_error_data = self._get_trace_data("cavity_error", val)
         return self.cavity_error_data
 
     def get_all_data(self):
-        length = 1000
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        out = "all_data\n"
-        self.device.write(out.encode('utf-8'))
-        error_data = []
-        for i in range(length):
-            try:
-                error_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        output_data = []
-        for i in range(length):
-            try:
-                output_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        transmission_data = []
-        for i in range(length):
-            try:
-                transmission_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        cavity_error_data = []
-        for i in range(length):
-            try:
-                cavity_error_data.append(float(self.device.readline().decode('utf-8').strip('\n')))
-            except ValueError as e:
-                print(i)
-                raise e
-        return {
-            "error": error_data,
-            "output": output_data,
-            "transmission": transmission_data,
-            "cavity_error": cavity_error_data,
-        }
+        """
+        Returns a dict of the error, output, transmission, and cavity error data of the last scan.
+        """
+        data = self._get_binary_data("all_data_binary")
+        if data is None:
+            length = 1000
+            self.device.reset_input_buffer()
+            self.device.reset_output_buffer()
+            out = "all_data\n"
+            self.device.write(out.encode('utf-8'))
+            data = [self._read_ascii_data(length) for name in ALL_DATA_NAMES]
+        return {name: data[kk] for kk, name in enumerate(ALL_DATA_NAMES)}
     
     def get_dc_offset(self):
         val = float(self._get_param("dc_offset"))
@@ -324,7 +345,3 @@ class Quarto:
         val = float(self._set_param("unlock_counter", val))
         self.unlock_counter = val
         return val
-
-    def close(self):
-        self.device.close()
-
@@ -0,0 +1,157 @@
+"""Background acquisition of the frequency lock Quarto traces and lock state.
+
+One thread per Quarto reads the traces and the lock state, so that plots, the linewidth calculation,
+and the InfluxDB recorder read snapshots instead of the serial port.
+
+Example:
+    acquisition = QuartoAcquisition(q)
+    acquisition.start()
+    timestamp, data = acquisition.buffer.latest()
+    times, blocks, next_count = acquisition.buffer.since(last_count)
+    integral = acquisition.lock_state["integral"]
+"""
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from onix.headers.quarto_frequency_lock import ALL_DATA_NAMES, Quarto
+
+
+class TraceRingBuffer:
+    """Ring buffer of trace blocks with one writer and any number of readers.
+
+    Readers do not lock. The writer fills a slot and then increases the block count, and readers copy
+    slots and then drop the blocks that the writer may have overwritten while they were copied.
+    The arrays are allocated at the first append, when the trace length is known.
+
+    Args:
+        capacity: int, number of blocks kept.
+        names: list of str, channel names of the blocks.
+    """
+    def __init__(self, capacity: int, names: list[str]):
+        self.capacity = capacity
+        self.names = list(names)
+        self._blocks = None
+        self._times = np.zeros(capacity)
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        """Number of blocks appended since the buffer was created."""
+        return self._count
+
+    def append(self, data: dict[str, np.ndarray], timestamp: Optional[float] = None):
+        """Appends a block. Only one thread may append."""
+        if timestamp is None:
+            timestamp = time.time()
+        if self._blocks is None:
+            length = len(data[self.names[0]])
+            self._blocks = np.zeros((self.capacity, len(self.names), length))
+        slot = self._count % self.capacity
+        for kk, name in enumerate(self.names):
+            self._blocks[slot, kk] = data[name]
+        self._times[slot] = timestamp
+        self._count += 1
+
+    def _valid(self, counts: np.ndarray) -> np.ndarray:
+        # block k is overwritten from when the writer starts the block k + capacity.
+        return counts > self._count - self.capacity
+
+    def since(self, count: int) -> tuple[np.ndarray, np.ndarray, int]:
+        """Copies the blocks appended after the first count blocks.
+
+        Blocks that are overwritten before they are read are skipped.
+
+        Args:
+            count: int, block count of the last read, 0 to read all blocks kept.
+
+        Returns:
+            (times, blocks, count). times is an array of the block timestamps, blocks is a
+            (number of blocks, channels, samples) array, and count is the block count to pass to the next read.
+        """
+        last = self._count
+        first = max(count, last - self.capacity + 1, 0)
+        counts = np.arange(first, last)
+        if self._blocks is None or len(counts) == 0:
+            return (np.zeros(0), np.zeros((0, len(self.names), 0)), last)
+        slots = counts % self.capacity
+        times = self._times[slots]
+        blocks = self._blocks[slots]
+        valid = self._valid(counts)
+        return (times[valid], blocks[valid], last)
+
+    def latest(self) -> Optional[tuple[float, dict[str, np.ndarray]]]:
+        """Copies the last block. Returns (timestamp, dict of channel data), or None if no block is appended."""
+        times, blocks, _ = self.since(max(self._count - 1, 0))
+        if len(times) == 0:
+            return None
+        return (times[-1], {name: blocks[-1, kk] for kk, name in enumerate(self.names)})
+
+
+class QuartoAcquisition:
+    """Reads the traces and lock state of a frequency lock Quarto in a background thread.
+
+    Traces are appended to buffer, and the lock state (see Quarto.get_lock_state) with its
+    "time" replaces lock_state after each read. Other code that uses the Quarto must hold device_lock.
+
+    Args:
+        quarto: Quarto, the frequency lock Quarto.
+        device_lock: threading.Lock or None, lock of the serial port. Default None creates one.
+        capacity: int, number of trace blocks kept.
+        interval: float, time in s between reads.
+    """
+    def __init__(
+        self,
+        quarto: Quarto,
+        device_lock: Optional[threading.Lock] = None,
+        capacity: int = 200,
+        interval: float = 0.05,
+    ):
+        self.quarto = quarto
+        if device_lock is None:
+            device_lock = threading.Lock()
+        self.device_lock = device_lock
+        self.buffer = TraceRingBuffer(capacity, ALL_DATA_NAMES)
+        self.interval = interval
+        self.lock_state = None
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def read_once(self):
+        """Reads the traces and the lock state once."""
+        with self.device_lock:
+            data = self.quarto.get_all_data()
+            lock_state = self.quarto.get_lock_state()
+        now = time.time()
+        self.buffer.append(data, now)
+        lock_state["time"] = now
+        self.lock_state = lock_state
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                self.read_once()
+            except Exception as e:
+                self.errors += 1
+                print(f"Quarto acquisition error: {e}")
+            self._stop.wait(max(self.interval - (time.monotonic() - start), 0))
+
+    def start(self):
+        """Starts the background thread. Reads once first, so that snapshots are available on return."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.read_once()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
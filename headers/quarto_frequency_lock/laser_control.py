@@ -1,7 +1,8 @@
 import os
 import numpy as np
 import threading
-from onix.headers.quarto_frequency_lock import Quarto
+from onix.headers.quarto_frequency_lock import Quarto, limit_warning_text
+from onix.headers.quarto_frequency_lock.acquisition import QuartoAcquisition
 import pyqtgraph as pg
 from pyqtgraph.Qt import QtCore, QtWidgets
 from PyQt5.QtWidgets import *
@@ -23,10 +24,13 @@ Down Arrow: decrease dc offset by 0.1
 GET_CAVITY_DATA_LENGTH = 1000
 
 ## Initialize wavemeter, quarto, laser class
-wm = WM()
+wm = WM(subscribe=True)
 app = pg.mkQApp("Laser control")
 q = Quarto(find_quarto("frequency", return_all=True)[1])
 device_lock = threading.Lock()
+# reads the traces and lock state in the background. Timers read the snapshots instead of the Quarto.
+acquisition = QuartoAcquisition(q, device_lock=device_lock)
+acquisition.start()
 discriminator_slope = 4.2e-5 
 laser = LaserLinewidth(GET_CAVITY_DATA_LENGTH, 2e-6, discriminator_slope) 
 
@@ -93,8 +97,7 @@ def update_all():
     global data_transmission
     global data_cavity_error
     if plots == True:
-        with device_lock:
-            data = q.get_all_data()
+        _, data = acquisition.buffer.latest()
 
         data_transmission = data["transmission"]
         data_cavity_error = data["cavity_error"]
@@ -169,12 +172,13 @@ extreme_autorelock_state_proxy = QtWidgets.QGraphicsProxyWidget()
 extreme_autorelock_state_proxy.setWidget(extreme_autorelock_state)
 win.addItem(extreme_autorelock_state_proxy, row = 5, col = 1, colspan = 1)
 
-q.set_dc_offset(0)
+with device_lock:
+    q.set_dc_offset(0)
 offset_scan_direction = 0
 unhop_val = True
 def lock_param_update():
     global offset_scan_direction
-    if q.get_state() == 0:
+    if acquisition.lock_state["state"] == 0:
         if initial_extreme_autorelock_state == 1:
             wm_freq = wm.read_frequency(5)
             wm_freq_diff = wm_freq - frequency_setpoint
@@ -209,12 +213,14 @@ def lock_param_update():
                             scan.setValue(max(scan.value() - step_size, 0.1))
                         else:
                             avg_data_cavity_error = np.average(data_cavity_error)
-                            dc_offset = q.get_dc_offset()
+                            dc_offset = acquisition.lock_state["dc_offset"]
                             if np.abs(avg_data_cavity_error) > 0.01:
                                 if avg_data_cavity_error < 0 and dc_offset < 10:
-                                    q.set_dc_offset(dc_offset + 0.1)
+                                    with device_lock:
+                                        q.set_dc_offset(dc_offset + 0.1)
                                 if avg_data_cavity_error > 0 and dc_offset > -10:
-                                    q.set_dc_offset(dc_offset - 0.1)
+                                    with device_lock:
+                                        q.set_dc_offset(dc_offset - 0.1)
                             else:
                                 lock_state.setText("Quarto Autorelock On")
                                 lock_state.setStyleSheet("background-color: green; color: white;")
@@ -230,7 +236,7 @@ lock_param_update_timer.start(50)
 ## Detect unlocks when in EXTREME Autorelock mode
 def transmission_check(): 
     global initial_extreme_autorelock_state
-    if q.get_state() == 2 and initial_extreme_autorelock_state == 1:
+    if acquisition.lock_state["state"] == 2 and initial_extreme_autorelock_state == 1:
         if np.average(data_transmission) < 0.1:
             # unlocked        
             lock_state.setText("Lock Off")
@@ -302,19 +308,19 @@ win.addItem(stop_plots_proxy, row = 6, col = 0)
 
 ## Laser Linewidth Monitor
 kk = 0
+linewidth_block_count = 0
 def update_laser_linewidth():
     global kk
-    with device_lock:
-        transmission = q.get_last_transmission_point()
-    error = data_cavity_error
-    if kk < laser_linewidth_averages:
-        laser.add_data(error)
-    else:
-        laser.update_data(error)
-    try:
+    global linewidth_block_count
+    transmission = acquisition.lock_state["last_transmission_point"]
+    # each cavity error trace read since the last update is averaged once.
+    _, blocks, linewidth_block_count = acquisition.buffer.since(linewidth_block_count)
+    for error in blocks[:, acquisition.buffer.names.index("cavity_error")]:
+        if kk < laser_linewidth_averages:
+            laser.add_data(error)
+        else:
+            laser.update_data(error)
         kk += 1
-    except:
-        kk = laser_linewidth_averages
     if transmission > 0.2:
         laser_linewidth.setText(f"Laser Linewidth: {laser.linewidth} Hz")
     else:
@@ -339,8 +345,7 @@ def round_sig(x, sig=3):
     return round(x, sig-int(np.floor(np.log10(abs(x))))-1)
 
 def update_transmission():
-    with device_lock:
-        val = q.get_last_transmission_point()
+    val = acquisition.lock_state["last_transmission_point"]
     last_transmission.setText(f"Transmission: {round_sig(val,3)} V")
 
 last_transmission = QtWidgets.QPushButton()
@@ -366,8 +371,7 @@ def _toggle_rms_error():
 
 def update_rms_err():
     if plots == True:
-        with device_lock:
-            err_data = q.get_all_data()["cavity_error"]
+        err_data = acquisition.buffer.latest()[1]["cavity_error"]
         err_squared = np.power(err_data, 2)
         value = np.sqrt(sum(err_squared) / len(err_squared))
         rms_err.setText(f"RMS Error: {round_sig(value,3)} V")
@@ -388,7 +392,7 @@ rms_err_timer.start(update_rms_error_interval)
 
 ## Keyboard Controls
 def keyPressed(evt):
-    if q.get_state() == 0:
+    if acquisition.lock_state["state"] == 0:
         if evt.key() == Qt.Key_Left:
             offset.setValue(offset.value() + 0.01)
       
@@ -396,12 +400,16 @@ def keyPressed(evt):
             offset.setValue(offset.value() - 0.01)
 
         if evt.key() == Qt.Key_Up:
-            if q.get_dc_offset() < 10:
-                q.set_dc_offset(q.get_dc_offset() + 0.1)
+            with device_lock:
+                dc_offset = q.get_dc_offset()
+                if dc_offset < 10:
+                    q.set_dc_offset(dc_offset + 0.1)
 
         if evt.key() == Qt.Key_Down:
-            if q.get_dc_offset() > -10:
-                q.set_dc_offset(q.get_dc_offset() - 0.1)
+            with device_lock:
+                dc_offset = q.get_dc_offset()
+                if dc_offset > -10:
+                    q.set_dc_offset(dc_offset - 0.1)
         
 win.sigKeyPress.connect(keyPressed)
 
@@ -441,8 +449,7 @@ dc_offset_text_label = pg.LabelItem(f"Quarto DC Offset: ")
 win.addItem(dc_offset_text_label, row = 4,  col = 1, colspan = 1)
 
 def update_dc_offset():
-    with device_lock:
-        dc_offset_text_label.setText(f"Quarto DC Offset: {q.get_dc_offset():.4f}", color = "#FFFFFF")
+    dc_offset_text_label.setText(f"Quarto DC Offset: {acquisition.lock_state['dc_offset']:.4f}", color = "#FFFFFF")
 
 update_dc_offset_timer = QtCore.QTimer()
 update_dc_offset_timer.timeout.connect(update_dc_offset)
@@ -453,13 +460,11 @@ integral_output_warning = pg.LabelItem(f"")
 win.addItem(integral_output_warning, row = 4,  col = 2, colspan = 1)
 
 def _update_integral_output_warning():
-    with device_lock:
-        state = q.get_state()
-    if state == 0:
+    lock_state = acquisition.lock_state
+    if lock_state["state"] == 0:
         integral_output_warning.setText(f"")
     else:
-        with device_lock:
-            integral_warning, output_warning = q.output_limit_indicator()
+        integral_warning, output_warning = limit_warning_text(lock_state["limit_warnings"])
         warning_text = "Quarto: " + integral_warning + " " + output_warning
         if "out" in integral_warning or "out" in output_warning:
             integral_output_warning.setText(warning_text, color = "#E61414") # red
@@ -481,27 +486,32 @@ bucket_week = "week"
 write_client = influxdb_client.InfluxDBClient(url=url, token=token, org=org)
 write_api = write_client.write_api(write_options=SYNCHRONOUS)
 
-if q.get_state() == 0:
+if acquisition.lock_state["state"] == 0:
     counter_starts_off = True
 else:
     counter_starts_off = False
 
 unlock_counter = 0
 
-# TODO: take average to send to influxDB
+record_block_count = 0
 def record_data():
+    global record_block_count
     try:
         point = Point("laser_controller")
-        with device_lock:
-            data = q.get_all_data()
-            integral = q.get_integral()
-            dc_offset = q.get_dc_offset()
-            unlock_counter = q.get_unlock_counter()
-
-        error = np.mean(data["error"])
-        output = np.mean(data["output"])
-        transmission = np.mean(data["transmission"])
-        cavity_error = np.mean(data["cavity_error"])
+        lock_state = acquisition.lock_state
+        integral = lock_state["integral"]
+        dc_offset = lock_state["dc_offset"]
+        unlock_counter = lock_state["unlock_counter"]
+
+        # averages of all traces read since the last record.
+        _, blocks, record_block_count = acquisition.buffer.since(record_block_count)
+        if len(blocks) == 0:
+            return
+        means = {name: np.mean(blocks[:, kk]) for kk, name in enumerate(acquisition.buffer.names)}
+        error = means["error"]
+        output = means["output"]
+        transmission = means["transmission"]
+        cavity_error = means["cavity_error"]
             
         linewidth = laser.linewidth
         point.field("integral", integral)
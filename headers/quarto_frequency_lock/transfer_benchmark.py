@@ -0,0 +1,141 @@
+"""Benchmarks binary and ASCII trace readout, and batched parameter reads of the frequency lock Quarto.
+
+The Quarto firmware is simulated on a pseudo-terminal, so no device is needed. The simulator answers
+"all_data" and "<trace>_data <length>" in ASCII lines and, unless it simulates old firmware, the
+"..._binary" commands in binary frames. Parameter commands are answered after a simulated USB latency.
+
+Run as a script (Linux and macOS):
+    python -m onix.headers.quarto_frequency_lock.transfer_benchmark
+"""
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from onix.headers import quarto_simulator
+from onix.headers.quarto_frequency_lock import (
+    ALL_DATA_NAMES,
+    BINARY_HEADER,
+    BINARY_MAGIC,
+    LOCK_STATE_PARAMS,
+    Quarto,
+)
+
+SYNC_DATA_LENGTH = 1000
+
+
+class SimulatedQuarto(quarto_simulator.SimulatedQuarto):
+    """Simulated frequency lock Quarto firmware on a pseudo-terminal.
+
+    Args:
+        binary: bool, whether the simulated firmware supports binary frames.
+        latency: float, delay in s before the commands of each received write are answered.
+    """
+    def __init__(self, binary=True, latency=0.0):
+        self.binary = binary
+        rng = np.random.default_rng(0)
+        self.data = {name: rng.normal(0, 1, 2 * SYNC_DATA_LENGTH).astype(np.float32) for name in ALL_DATA_NAMES}
+        params = {name: 0.0 for name in LOCK_STATE_PARAMS}
+        params.update({"state": 1, "limit_warnings": 0, "transmission_unlock": 0.1, "last_transmission_point": 0.5})
+        super().__init__(params, latency)
+
+    def _write_ascii(self, arrays):
+        self._write("".join(f"{value:f}\n" for array in arrays for value in array).encode())
+
+    def _write_binary(self, arrays):
+        payload = b"".join(array.astype("<f4").tobytes() for array in arrays)
+        header = BINARY_HEADER.pack(BINARY_MAGIC, 1, len(arrays), len(arrays[0]), 1.0)
+        self._write(header + payload + struct.pack("<I", zlib.crc32(payload)))
+
+    def _respond(self, line):
+        command, *args = line.split()
+        binary = command.endswith("_binary")
+        if binary:
+            if not self.binary:
+                return  # old firmware ignores unknown commands.
+            command = command[:-len("_binary")]
+        if command == "all_data":
+            arrays = [self.data[name][:SYNC_DATA_LENGTH] for name in ALL_DATA_NAMES]
+        elif command.endswith("_data") and command[:-len("_data")] in self.data:
+            length = int(args[0]) if len(args) > 0 else 2 * SYNC_DATA_LENGTH
+            arrays = [self.data[command[:-len("_data")]][-length:]]
+        else:
+            super()._respond(line)
+            return
+        if binary:
+            self._write_binary(arrays)
+        else:
+            self._write_ascii(arrays)
+
+
+def benchmark(number_of_reads=20):
+    """Runs the benchmark and returns the results.
+
+    Args:
+        number_of_reads: int, number of get_all_data calls for each firmware.
+
+    Returns:
+        dict, keys are "binary" and "ascii", and values are dicts of the mean get_all_data time in s,
+        and the max difference from the simulated data.
+    """
+    results = {}
+    for mode, binary in (("binary", True), ("ascii", False)):
+        simulator = SimulatedQuarto(binary=binary)
+        quarto = Quarto(simulator.port)
+        quarto.get_all_data()  # detects the binary support.
+        start = time.perf_counter()
+        for _ in range(number_of_reads):
+            data = quarto.get_all_data()
+        elapsed = (time.perf_counter() - start) / number_of_reads
+        error = max(
+            np.max(np.abs(data[name] - simulator.data[name][:SYNC_DATA_LENGTH])) for name in ALL_DATA_NAMES
+        )
+        quarto.close()
+        simulator.close()
+        results[mode] = {"time": elapsed, "max_error": error, "binary_detected": quarto.binary}
+    return results
+
+
+def benchmark_lock_state(number_of_reads=20, latency=1e-3):
+    """Compares reading the lock state one parameter at a time and in one batched round trip.
+
+    Args:
+        number_of_reads: int, number of lock state reads for each method.
+        latency: float, simulated USB latency in s of each write to the Quarto.
+
+    Returns:
+        dict, keys are "sequential" and "batched", and values are dicts of the mean time in s and the
+        number of writes received by the simulator for each lock state read.
+    """
+    simulator = SimulatedQuarto(latency=latency)
+    quarto = Quarto(simulator.port, binary=False)
+    methods = {
+        "sequential": lambda: {name: quarto._get_param(name) for name in LOCK_STATE_PARAMS},
+        "batched": quarto.get_lock_state,
+    }
+    results = {}
+    for method, read in methods.items():
+        writes = simulator.writes_received
+        start = time.perf_counter()
+        for _ in range(number_of_reads):
+            read()
+        elapsed = (time.perf_counter() - start) / number_of_reads
+        results[method] = {"time": elapsed, "writes": (simulator.writes_received - writes) / number_of_reads}
+    quarto.close()
+    simulator.close()
+    return results
+
+
+if __name__ == "__main__":
+    results = benchmark()
+    for mode, result in results.items():
+        print(
+            f"{mode:<8}{result['time'] * 1e3:>10.2f} ms per get_all_data, "
+            f"max error {result['max_error']:.1e}, binary detected: {result['binary_detected']}"
+        )
+    for method, result in benchmark_lock_state().items():
+        print(
+            f"{method:<12}{result['time'] * 1e3:>8.2f} ms per lock state read, "
+            f"{result['writes']:.0f} writes to the Quarto"
+        )
@@ -1,44 +1,22 @@
-import serial
 import time
 import numpy as np
 import struct
 import matplotlib.pyplot as plt
 from matplotlib import animation
 from onix.analysis.power_spectrum import PowerSpectrum, CCedPowerSpectrum
+from onix.headers.quarto_transport import QuartoTransport
 
 
 DEFAULT_GET_DATA_LENGTH = 30000
 BYTES_PER_FLOAT = 4 
 
-class Quarto:
+class Quarto(QuartoTransport):
     def __init__(self, location='/dev/ttyACM1'):
-        self.address = location
-        self.device = serial.Serial(
-            self.address,
-            baudrate=115200,
-            timeout=0.2
-        )
-        sample_time_us = float(self._get_param("adc_interval")) 
+        super().__init__(location, timeout=0.2)
+        sample_time_us = float(self._get_param("adc_interval"))
         self.sample_time = sample_time_us * 1e-6
         self.backgrounds = {}
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
-        
-    def _get_param(self, param):
-        out = param + '\n'
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\n').split(" ")[-1]
-        return response
 
-    def _set_param(self, param, val):
-        out = param + " " + str(val) + '\n'
-        self.state = val
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\n').split(" ")[-1]
-        return response
-    
     def get_setpoint(self):
         val = float(self._get_param("pd_setpoint"))
         self.setpoint = val
@@ -549,7 +527,3 @@ class Quarto:
 
     def animate_background_subtracted_spectrum(self, background, averages = 10):
         self._animated_spectrum("power spectrum", averages, background_subtraction = True, background = background)
-
-    def close(self):
-        self.device.close()
-
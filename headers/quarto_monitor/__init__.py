@@ -1,29 +1,15 @@
-import serial
 import numpy as np
 import struct
 from onix.headers.find_quarto import find_quarto
+from onix.headers.quarto_transport import QuartoTransport
 
 BYTES_PER_FLOAT = 4 
 
-class Quarto:
+class Quarto(QuartoTransport):
     def __init__(self, location=find_quarto("digitizer"), num_channels = 4):
         print(find_quarto("digitizer", True))
-        self.address = location
-        self.device = serial.Serial(
-            self.address,
-            baudrate=115200,
-            timeout=0.22
-        )
-        self.device.reset_input_buffer()
-        self.device.reset_output_buffer()
+        super().__init__(location, timeout=0.22)
 
-    def _get_param(self, param):
-        out = param + '\n'
-        self.device.write(out.encode('utf-8'))
-        response = self.device.readline()
-        response = response.decode('utf-8').strip('\r\n').split(" ")[-1]
-        return response
-    
     def adc_interval(self):
         # TODO: without the rounding it always returns self._get_param("adc_interval")
         adc_interval = round(int(self._get_param("adc_interval")) * 1e-6, 6)
@@ -51,8 +37,3 @@ class Quarto:
         ch3 = data[ int(2 * len(data) / 4) : int(3 * len(data) / 4) ]
         ch4 = data[ int(3 * len(data) / 4) : int(len(data)) ]
         return ch1, ch2, ch3, ch4
-
-
-    def close(self):
-        self.device.close()
-
@@ -0,0 +1,69 @@
+"""Quarto qCommand firmware simulated on a pseudo-terminal, for testing device classes without a Quarto.
+
+Example (Linux and macOS):
+    simulator = SimulatedQuarto({"p_gain": 0.1, "state": 0})
+    quarto = QuartoTransport(simulator.port)
+    quarto.get_params(["p_gain", "state"])  # {"p_gain": "0.1", "state": "0"}
+"""
+import os
+import threading
+import time
+import tty
+from typing import Any, Optional
+
+
+class SimulatedQuarto:
+    """Simulated Quarto firmware that answers parameter commands.
+
+    "name" is answered with "name is value", and "name value" sets the parameter before answering.
+    Unknown commands are ignored, as the qCommand firmware does. Subclasses can answer other commands
+    by overriding _respond.
+
+    Args:
+        params: dict, parameter names and initial values. Set values are converted to the type of the initial value.
+        latency: float, delay in s before the commands of each received write are answered, e.g. the USB latency.
+    """
+    def __init__(self, params: Optional[dict[str, Any]] = None, latency: float = 0.0):
+        self.params = dict(params) if params is not None else {}
+        self.latency = latency
+        self.writes_received = 0
+        self.commands_received = 0
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _write(self, data: bytes):
+        view = memoryview(data)
+        while len(view) > 0:
+            view = view[os.write(self._master, view):]
+
+    def _respond(self, line: str):
+        command, *args = line.split()
+        if command not in self.params:
+            return
+        if len(args) > 0:
+            self.params[command] = type(self.params[command])(args[0])
+        self._write(f"{command.replace('_', ' ')} is {self.params[command]}\n".encode())
+
+    def _serve(self):
+        buffer = b""
+        while True:
+            try:
+                received = os.read(self._master, 1024)
+            except OSError:
+                return
+            self.writes_received += 1
+            if self.latency > 0:
+                time.sleep(self.latency)
+            buffer += received
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if len(line.strip()) > 0:
+                    self.commands_received += 1
+                    self._respond(line.decode())
+
+    def close(self):
+        os.close(self._slave)
+        os.close(self._master)
@@ -0,0 +1,94 @@
+import time
+from typing import Any, Optional
+
+import serial
+
+
+class QuartoTransport:
+    """Serial connection to a Quarto running qCommand firmware.
+
+    The firmware answers each command with one line, e.g. "p gain is 0.100000". Commands sent in one
+    write are answered in order, so transact reads the responses of several commands in a single
+    round trip instead of one round trip per command.
+
+    Commands that do not get their responses within the timeout are sent again, up to retries times.
+    query, _set_param, and set_params do not send again, as some commands are not idempotent
+    (e.g. "state 0" counts an unlock).
+
+    Args:
+        location: str, serial port.
+        timeout: float, serial read timeout in s for each response line.
+        retries: int, number of times get commands are sent again after a timeout.
+    """
+    def __init__(self, location: str, timeout: float = 0.2, retries: int = 1):
+        self.address = location
+        self.timeout = timeout
+        self.retries = retries
+        self.device = serial.Serial(
+            self.address,
+            baudrate=115200,
+            timeout=timeout,
+        )
+        self.device.reset_input_buffer()
+        self.device.reset_output_buffer()
+
+    def _read_lines(self, number: int) -> list[str]:
+        """Reads number response lines. Raises TimeoutError if a line does not arrive within the timeout."""
+        lines = []
+        for kk in range(number):
+            line = self.device.readline()
+            if not line.endswith(b"\n"):
+                raise TimeoutError(f"Received {kk} of {number} responses from the Quarto at {self.address}.")
+            lines.append(line.decode("utf-8").strip())
+        return lines
+
+    def transact(self, commands: list[str], retries: Optional[int] = None) -> list[str]:
+        """Sends commands in one write and returns their response lines.
+
+        Args:
+            commands: list of str, commands without the line endings, e.g. ["p_gain", "i_time 0.01"].
+            retries: int or None, number of times the commands are sent again after a timeout.
+                Default None uses self.retries.
+
+        Returns:
+            list of str, the response line of each command.
+        """
+        if retries is None:
+            retries = self.retries
+        out = "".join(command + "\n" for command in commands).encode("utf-8")
+        for attempt in range(retries + 1):
+            self.device.write(out)
+            try:
+                return self._read_lines(len(commands))
+            except TimeoutError:
+                if attempt == retries:
+                    raise
+                # responses that arrive late must not be read as responses of the commands sent again.
+                time.sleep(self.timeout)
+                self.device.reset_input_buffer()
+
+    def query(self, command: str, retries: int = 0) -> str:
+        """Sends one command and returns its response line.
+
+        The command is not sent again after a timeout by default, as it may be an action (e.g. "start").
+        """
+        return self.transact([command], retries)[0]
+
+    def _get_param(self, param: str) -> str:
+        return self.transact([param])[0].split(" ")[-1]
+
+    def _set_param(self, param: str, val: Any) -> str:
+        return self.transact([f"{param} {val}"], retries=0)[0].split(" ")[-1]
+
+    def get_params(self, params: list[str]) -> dict[str, str]:
+        """Reads several parameters in one round trip. Values are the last words of the responses."""
+        responses = self.transact(params)
+        return {param: response.split(" ")[-1] for param, response in zip(params, responses)}
+
+    def set_params(self, values: dict[str, Any]) -> dict[str, str]:
+        """Sets several parameters in one round trip. Values are the last words of the responses."""
+        responses = self.transact([f"{param} {val}" for param, val in values.items()], retries=0)
+        return {param: response.split(" ")[-1] for param, response in zip(values, responses)}
+
+    def close(self):
+        self.device.close()
@@ -32,6 +32,7 @@ import onix.headers.wavemeter.wlmConst as wlmConst
 
 
 # others
+import ast
 import time
 import ctypes
 import zmq
@@ -39,16 +40,56 @@ import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from onix.headers.wavemeter.zmq_publisher import zmqPublisher
+from onix.headers.wavemeter.wavemeter_stream import (
+    NUM_OF_CHANNELS,
+    STREAM_PORT,
+    STREAM_TOPIC,
+    WAVEMETER_HOST,
+    WavemeterStream,
+    encode_frame,
+    frequency_or_error,
+)
 import matplotlib.animation as animation
     
 ##
 
+# reads that client mode WM answers from the frame stream, and the stream quantity of each.
+STREAMED_READS = {"read_frequency": "frequency", "read_laser_power": "power"}
+# quantities of WM.read_all, and the single channel read of each.
+READ_ALL_QUANTITIES = ("frequency", "wavelength", "power", "linewidth")
+READ_REQUESTS = {
+    "frequency": "read_frequency",
+    "wavelength": "read_wavelength",
+    "power": "read_laser_power",
+    "linewidth": "read_linewidth",
+}
+
 class WM:
-    def __init__(self,mode='client',port=9000,publish=False,stream_port=5563,):
+    """
+    HighFinesse wavemeter.
+
+    In server mode it uses the wavemeter DLL, and WM.serve answers the requests of client mode WM
+    and publishes the frequencies and powers of all channels (see wavemeter_stream).
+    In client mode, read_frequency and read_laser_power are answered from the subscribed stream
+    if it subscribes and has a reading newer than max_age, and all other calls are sent as requests.
+
+    Inputs:
+    mode: 'server' or 'client'
+    port: port of the request socket
+    publish: publishes readings of stream_some_frequencies on stream_port
+    subscribe: client mode subscribes to the server frame stream on subscribe_port. Off by default,
+        as each subscription runs a background thread
+    max_age: streamed readings received more than this in s ago are requested instead
+    """
+    def __init__(self,mode='client',port=9000,publish=False,stream_port=5563,
+                 subscribe=False,subscribe_port=STREAM_PORT,max_age=1.0):
         
         self.port = port
         self.mode = mode
         self.publish = publish
+        self.max_age = max_age
+        self.stream = None
+        self._server_reads_all = True
         
         if mode=='server':
             
@@ -60,9 +101,12 @@ class WM:
         elif mode=='client':
             zmq_context = zmq.Context()
             self.socket = zmq_context.socket(zmq.REQ)
-            self.socket.connect("tcp://192.168.0.103:%s"%self.port) #wavemeter comp
+            self.socket.connect("tcp://%s:%s"%(WAVEMETER_HOST,self.port)) #wavemeter comp
             #self.socket.connect("tcp://192.168.0.102:%s"%self.port) # fancy windows comp
-            print("Connected to handler at 192.168.0.103:%s"%self.port)
+            print("Connected to handler at %s:%s"%(WAVEMETER_HOST,self.port))
+
+            if subscribe:
+                self.stream = WavemeterStream(WAVEMETER_HOST,subscribe_port)
         
             if publish:
                 self.publisher = zmqPublisher(port=stream_port,topic='wavemeter')
@@ -72,6 +116,10 @@ class WM:
     def _mode_check(func):
         def wrapper(self,*args,**kwargs):
             if self.mode=='client':
+                if self.stream is not None and func.__name__ in STREAMED_READS:
+                    value = self._read_stream(STREAMED_READS[func.__name__],*args,**kwargs)
+                    if value is not None:
+                        return value
                 msg = func.__name__+';'+str(args)+';'+str(kwargs)
                 resp = self._ask(msg)
                 return resp
@@ -82,30 +130,179 @@ class WM:
 
     def _ask(self,message):
         """ Send request to zmq server to pass message to wavemeter client """
-        if isinstance(message,str): message = message.encode()
-        self.socket.send(message)
-        
-        reply = self.socket.recv()
+        reply = self._ask_bytes(message)
         try:
             reply = float(reply.decode()) #convert answers to floats when applicable
         except:
             reply = reply.decode()
         return reply
+
+    def _ask_bytes(self,message):
+        """ Send request to zmq server and return the reply undecoded """
+        if isinstance(message,str): message = message.encode()
+        self.socket.send(message)
+        return self.socket.recv()
+
+    def close(self):
+        """ Closes the client sockets """
+        if self.mode=='client':
+            if self.stream is not None:
+                self.stream.close()
+            self.socket.close(linger=0)
+
+    def _read_stream(self,quantity,channel):
+        """ Returns the latest streamed frequency or power of channel, or None if there is no recent reading """
+        reading = self.stream.latest(channel,max_age=self.max_age)
+        if reading is None:
+            return None
+        timestamp, frequency, power = reading
+        if quantity=="frequency":
+            return frequency
+        return power
+
+    def _handle_request(self,message):
+        """ Runs a request of a client mode WM, and returns the reply in bytes """
+        try:
+            name, rest = message.split(';',1)
+            args, kwargs = rest.rsplit(';',1)
+            args = ast.literal_eval(args)
+            kwargs = ast.literal_eval(kwargs)
+            if name=='read_all':
+                # binary reply, see read_all.
+                return self._read_all_array(*args,**kwargs).astype('<f8').tobytes()
+            reply = getattr(self,name)(*args,**kwargs)
+        except Exception as e:
+            reply = e
+        return str(reply).encode()
+
+    def _read_value(self,quantity,channel):
+        """ Reads a quantity of channel from the DLL. Frequency error codes are returned as is. """
+        if quantity=='frequency':
+            frequency = float(self.dll.GetFrequencyNum(ctypes.c_long(channel),ctypes.c_double(0.0)))
+            return frequency if frequency<0 else 1e3*frequency
+        elif quantity=='wavelength':
+            return float(self.dll.GetWavelengthNum(channel,0.0))
+        elif quantity=='power':
+            return float(self.dll.GetPowerNum(channel,0))
+        elif quantity=='linewidth':
+            return float(self.dll.GetLinewidthNum(channel,0))
+        raise ValueError("Quantity must be one of %s, not %s."%(READ_ALL_QUANTITIES,quantity))
+
+    def _read_all_array(self,channels,quantities):
+        """ Returns a (quantities, channels) array of readings. Server mode only. """
+        return np.array([[self._read_value(quantity,channel) for channel in channels] for quantity in quantities])
+
+    def read_all(self,channels=range(1,NUM_OF_CHANNELS+1),quantities=('frequency','power')):
+        """
+        Read several quantities of several channels in one request
+
+        Inputs:
+        channels: list of channels
+        quantities: list of 'frequency' (GHz), 'wavelength' (nm), 'power' (uW) or 'linewidth' (GHz)
+
+        Returns a dict of quantity to a list of the values of channels. Frequencies of channels with a
+        measurement error are the error string, as read_frequency.
+        In client mode the server replies with a (quantities, channels) float64 array. Frequencies and
+        powers are taken from the stream instead if all of them have a recent reading. If the server
+        does not support read_all, each value is requested on its own.
+        """
+        channels = [int(channel) for channel in channels]
+        quantities = list(quantities)
+        for quantity in quantities:
+            if quantity not in READ_ALL_QUANTITIES:
+                raise ValueError("Quantity must be one of %s, not %s."%(READ_ALL_QUANTITIES,quantity))
+        values = None
+        if self.mode=='client':
+            if self.stream is not None and set(quantities)<=set(STREAMED_READS.values()):
+                values = self._read_all_stream(channels,quantities)
+            if values is None and self._server_reads_all:
+                message = 'read_all;'+str((channels,quantities))+';{}'
+                reply = self._ask_bytes(message)
+                if len(reply)==8*len(channels)*len(quantities):
+                    values = np.frombuffer(reply,dtype='<f8').reshape(len(quantities),len(channels))
+                else:
+                    print("Unexpected read_all reply, reading each channel: %s"%reply.decode(errors='replace'))
+                    self._server_reads_all = False
+            if values is None:
+                return self._read_each(channels,quantities)
+        else:
+            values = self._read_all_array(channels,quantities)
+
+        result = {}
+        for quantity, row in zip(quantities,values):
+            if quantity=='frequency':
+                result[quantity] = [frequency_or_error(value) for value in row]
+            else:
+                result[quantity] = [float(value) for value in row]
+        return result
+
+    def _read_each(self,channels,quantities):
+        """ Requests each quantity of each channel, for servers without read_all. Client mode only. """
+        result = {}
+        for quantity in quantities:
+            values = [self._ask(READ_REQUESTS[quantity]+';'+str((channel,))+';{}') for channel in channels]
+            if quantity!='frequency':
+                # errors of other quantities have no error string, and are NaN as in the read_all reply.
+                values = [value if isinstance(value,float) else float('nan') for value in values]
+            result[quantity] = values
+        return result
+
+    def _read_all_stream(self,channels,quantities):
+        """ Returns a (quantities, channels) array of streamed readings, or None if a channel has no recent reading """
+        values = np.zeros((len(quantities),len(channels)))
+        for kk, channel in enumerate(channels):
+            reading = self.stream.latest(channel,max_age=self.max_age,raw=True)
+            if reading is None:
+                return None
+            timestamp, frequency, power = reading
+            for ll, quantity in enumerate(quantities):
+                values[ll,kk] = frequency if quantity=='frequency' else power
+        return values
+
+    def serve(self,port=None,stream_port=STREAM_PORT,channels=range(1,NUM_OF_CHANNELS+1),interval=0.05):
+        """
+        Answers requests of client mode WM on port, and publishes frames of the frequencies and powers
+        of channels on stream_port every interval in s. Server mode only.
+
+        Requests and frames are handled in one thread, so the DLL is never called concurrently.
+        """
+        if port is None: port = self.port
+        channels = list(channels)
+        socket = zmq.Context.instance().socket(zmq.REP)
+        socket.bind("tcp://*:%s"%port)
+        publisher = zmqPublisher(port=stream_port,topic=STREAM_TOPIC)
+        print("Serving requests on port %s"%port)
+
+        next_frame = time.monotonic()
+        try:
+            while True:
+                if socket.poll(1e3*max(next_frame-time.monotonic(),0)):
+                    socket.send(self._handle_request(socket.recv_string()))
+                now = time.monotonic()
+                if now>=next_frame:
+                    frequencies, powers = self._read_all_array(channels,('frequency','power'))
+                    publisher.publish_frame(encode_frame(time.time(),channels,frequencies,powers))
+                    next_frame = max(next_frame+interval,now)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket.close()
+            publisher.close()
         
 
 
     # for webapp:
     @property
     def wavelengths(self):
-        return [self.read_wavelength(i+1) for i in range(8)]
+        return self.read_all(quantities=('wavelength',))['wavelength']
         
     @property
     def frequencies(self):
-        return [self.read_frequency(i+1) for i in range(8)]
+        return self.read_all(quantities=('frequency',))['frequency']
         
     @property
     def powers(self):
-        return [self.read_laser_power(i+1) for i in range(8)]
+        return self.read_all(quantities=('power',))['power']
         
         
     @_mode_check    
@@ -469,6 +666,7 @@ class WM:
 
 if __name__=='__main__':
     wm = WM(mode = 'server')
+    wm.serve()
     
 
 
@@ -11,7 +11,7 @@ from wavemeter import WM
 class LivePlotter:
     def __init__(self):
         
-        self.wm = WM()
+        self.wm = WM(subscribe=True)
         
 
         self.freqs = np.array([np.array([0]) for i in range(8)])
@@ -0,0 +1,166 @@
+"""Binary stream of wavemeter readings.
+
+The wavemeter server (WM.serve) reads the frequency and power of all channels at the instrument rate
+and publishes them as one binary frame per reading on a ZMQ PUB socket. WavemeterStream subscribes to
+the frames and keeps the latest reading of each channel and a ring buffer of past readings, so that
+clients read the wavemeter without a request round trip.
+
+Frame format (little endian): timestamp (float64), number of channels n (uint8), channel numbers
+(n uint8), frequencies in GHz (n float64) and laser powers in uW (n float64). A negative frequency
+is the wavemeter error code of the channel.
+
+Example:
+    stream = WavemeterStream()
+    timestamp, frequency, power = stream.latest(5)
+    times, frequencies, powers = stream.history()
+"""
+import struct
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+import zmq
+
+import onix.headers.wavemeter.wlmConst as wlmConst
+
+WAVEMETER_HOST = "192.168.0.103"
+STREAM_PORT = 5564
+STREAM_TOPIC = "wavemeter_frame"
+NUM_OF_CHANNELS = 8
+
+_FRAME_HEADER = struct.Struct("<dB")
+
+
+def encode_frame(
+    timestamp: float, channels: list[int], frequencies: np.ndarray, powers: np.ndarray
+) -> bytes:
+    """Encodes a reading of several channels into a frame."""
+    return (
+        _FRAME_HEADER.pack(timestamp, len(channels))
+        + np.asarray(channels, dtype="<u1").tobytes()
+        + np.asarray(frequencies, dtype="<f8").tobytes()
+        + np.asarray(powers, dtype="<f8").tobytes()
+    )
+
+
+def decode_frame(frame: bytes) -> tuple[float, np.ndarray, np.ndarray, np.ndarray]:
+    """Decodes a frame. Returns (timestamp, channels, frequencies, powers)."""
+    timestamp, num_of_channels = _FRAME_HEADER.unpack_from(frame)
+    offset = _FRAME_HEADER.size
+    channels = np.frombuffer(frame, dtype="<u1", count=num_of_channels, offset=offset)
+    offset += num_of_channels
+    frequencies = np.frombuffer(frame, dtype="<f8", count=num_of_channels, offset=offset)
+    offset += 8 * num_of_channels
+    powers = np.frombuffer(frame, dtype="<f8", count=num_of_channels, offset=offset)
+    return (timestamp, channels, frequencies, powers)
+
+
+def frequency_or_error(frequency: float):
+    """Returns the frequency in GHz, or the error string if it is a wavemeter error code, as WM.read_frequency."""
+    if frequency < 0:
+        return wlmConst.meas_error_to_str(frequency)
+    return float(frequency)
+
+
+class WavemeterStream:
+    """Subscribes to the wavemeter frames in a background thread.
+
+    Channels that are not in a frame are NaN in the history of that frame.
+
+    Args:
+        host: str, address of the wavemeter server.
+        port: int, port of the frame stream.
+        capacity: int, number of frames kept in the history.
+    """
+    def __init__(self, host: str = WAVEMETER_HOST, port: int = STREAM_PORT, capacity: int = 10000):
+        self.capacity = capacity
+        self._times = np.zeros(capacity)
+        self._frequencies = np.full((capacity, NUM_OF_CHANNELS), np.nan)
+        self._powers = np.full((capacity, NUM_OF_CHANNELS), np.nan)
+        self._count = 0
+        self._latest = {}
+        self._lock = threading.Lock()
+
+        self._socket = zmq.Context.instance().socket(zmq.SUB)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.setsockopt_string(zmq.SUBSCRIBE, STREAM_TOPIC)
+        self._socket.connect(f"tcp://{host}:{port}")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def count(self) -> int:
+        """Number of frames received."""
+        return self._count
+
+    def _add_frame(self, frame: bytes):
+        timestamp, channels, frequencies, powers = decode_frame(frame)
+        # max_age is checked against the local receive time, as the server clock may be off.
+        received = time.monotonic()
+        slot = self._count % self.capacity
+        with self._lock:
+            self._times[slot] = timestamp
+            self._frequencies[slot] = np.nan
+            self._powers[slot] = np.nan
+            self._frequencies[slot, channels - 1] = frequencies
+            self._powers[slot, channels - 1] = powers
+            for channel, frequency, power in zip(channels, frequencies, powers):
+                self._latest[int(channel)] = (received, timestamp, float(frequency), float(power))
+            self._count += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._socket.poll(100):
+                continue
+            try:
+                _, frame = self._socket.recv_multipart()
+                self._add_frame(frame)
+            except Exception as e:
+                print(f"Wavemeter stream error: {e}")
+        self._socket.close()
+
+    def latest(self, channel: int, max_age: Optional[float] = None, raw: bool = False) -> Optional[tuple]:
+        """Latest reading of a channel.
+
+        Args:
+            channel: int, wavemeter channel.
+            max_age: float or None, readings received more than this in s ago are not returned.
+            raw: bool, if True, error codes are returned as negative frequencies.
+
+        Returns:
+            (timestamp, frequency, power), or None if there is no reading.
+            The frequency is in GHz, or the error string of the channel.
+        """
+        reading = self._latest.get(channel)
+        if reading is None:
+            return None
+        received, timestamp, frequency, power = reading
+        if max_age is not None and time.monotonic() - received > max_age:
+            return None
+        if raw:
+            return (timestamp, frequency, power)
+        return (timestamp, frequency_or_error(frequency), power)
+
+    def history(self, num_of_frames: Optional[int] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Copies the last frames, oldest first.
+
+        Args:
+            num_of_frames: int or None, number of frames. Default None copies all frames kept.
+
+        Returns:
+            (times, frequencies, powers). frequencies and powers are (frames, channels) arrays,
+            where column k is channel k + 1. Error codes are negative frequencies.
+        """
+        with self._lock:
+            num_kept = min(self._count, self.capacity)
+            if num_of_frames is not None:
+                num_kept = min(num_kept, num_of_frames)
+            slots = np.arange(self._count - num_kept, self._count) % self.capacity
+            return (self._times[slots], self._frequencies[slots], self._powers[slots])
+
+    def close(self):
+        """Stops the background thread."""
+        self._stop.set()
+        self._thread.join()
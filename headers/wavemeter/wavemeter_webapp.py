@@ -23,7 +23,8 @@ def send_data():
     if len(clients)>0:
         #data = wlmeter.wavelengths
         #data = wlmeter.frequencies
-        data = wlmeter.frequencies + wlmeter.powers
+        values = wlmeter.read_all(quantities=('frequency','power'))
+        data = values['frequency'] + values['power']
         str = json.dumps(data) #converts to JavaScript friendly form
         for c in clients:
             c.write_message(str) #tornado websocket function to send message to client
@@ -47,7 +48,7 @@ class WsHandler(tornado.websocket.WebSocketHandler):
 class ApiHandler(tornado.web.RequestHandler):
     """Creates simple HTTP API if you don't like websockets"""
     def get(self, channel=None):
-        w = wlmeter.wavelengths
+        w = wlmeter.read_all(quantities=('wavelength',))['wavelength']
         #sw = wlmeter.switcher_mode
         if channel is None:
             #self.write({ "wavelengths": w, "switcher_mode": sw })
@@ -145,7 +146,7 @@ def get_config():
 config = get_config()
 
 #wlmeter = WavelengthMeter(debug=config["debug"])
-wlmeter = WM()
+wlmeter = WM(subscribe=True)
 
 app = make_app(config)
 
@@ -29,6 +29,11 @@ class zmqPublisher:
             print('error retrieving/parsing data')
             print(e)
 
+    def publish_frame(self,frame,topic=None):
+        """Publishes a binary frame as a (topic, frame) multipart message."""
+        if topic is None: topic = self.topic
+        self.pub_socket.send_multipart([topic.encode(), frame])
+
     def test_stream(self):
         while(True):
             try:
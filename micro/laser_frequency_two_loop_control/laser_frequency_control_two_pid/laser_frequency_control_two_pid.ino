@@ -549,6 +549,106 @@ void cmd_all_data(qCommand& qC, Stream& S){
   pause_data = false;
 }
 
+// Binary data frames: "QB", uint8 dtype (1: float32), uint8 number of channels,
+// uint32 number of samples per channel, float32 scale, the little-endian samples of each channel,
+// and the CRC-32 of the samples.
+const uint8_t BINARY_DTYPE_FLOAT32 = 1;
+
+uint32_t crc32_update(uint32_t crc, const uint8_t* data, size_t length) {
+  crc = ~crc;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (int j = 0; j < 8; j++) {
+      crc = (crc >> 1) ^ (0xEDB88320 & (0 - (crc & 1)));
+    }
+  }
+  return ~crc;
+}
+
+void serial_write_binary_header(Stream& S, uint8_t channels, uint32_t samples) {
+  uint8_t header[12] = {'Q', 'B', BINARY_DTYPE_FLOAT32, channels};
+  float scale = 1.0;
+  memcpy(header + 4, &samples, 4);
+  memcpy(header + 8, &scale, 4);
+  S.write(header, 12);
+}
+
+uint32_t serial_write_binary_block(Stream& S, float array[], int start, int length, uint32_t crc) {
+  const uint8_t* data = (const uint8_t*)(array + start);
+  S.write(data, length * sizeof(float));
+  return crc32_update(crc, data, length * sizeof(float));
+}
+
+void serial_write_binary_data(Stream& S, float array[], int next_index, int length) {
+  if (length < 0 || length > MAX_DATA_LENGTH) {
+    length = MAX_DATA_LENGTH;
+  }
+  serial_write_binary_header(S, 1, length);
+  int first_index = next_index - length;
+  if (first_index < 0) {
+    first_index += MAX_DATA_LENGTH;
+  }
+  uint32_t crc = 0;
+  if (first_index + length > MAX_DATA_LENGTH) {
+    crc = serial_write_binary_block(S, array, first_index, MAX_DATA_LENGTH - first_index, crc);
+    crc = serial_write_binary_block(S, array, 0, first_index + length - MAX_DATA_LENGTH, crc);
+  }
+  else {
+    crc = serial_write_binary_block(S, array, first_index, length, crc);
+  }
+  S.write((const uint8_t*)&crc, 4);
+}
+
+int get_binary_data_length(qCommand& qC) {
+  int get_data_length = MAX_DATA_LENGTH;
+  if ( qC.next() != NULL) {
+    get_data_length = atoi(qC.current());
+  }
+  return get_data_length;
+}
+
+void cmd_error_data_binary(qCommand& qC, Stream& S){
+  pause_data = true;
+  serial_write_binary_data(S, error_data, data_index, get_binary_data_length(qC));
+  pause_data = false;
+}
+
+void cmd_output_data_binary(qCommand& qC, Stream& S){
+  pause_data = true;
+  serial_write_binary_data(S, output_data, data_index, get_binary_data_length(qC));
+  pause_data = false;
+}
+
+void cmd_transmission_data_binary(qCommand& qC, Stream& S){
+  pause_data = true;
+  serial_write_binary_data(S, transmission_data, data_index, get_binary_data_length(qC));
+  pause_data = false;
+}
+
+void cmd_cavity_error_data_binary(qCommand& qC, Stream& S){
+  pause_data = true;
+  serial_write_binary_data(S, cavity_error_data, data_index, get_binary_data_length(qC));
+  pause_data = false;
+}
+
+void cmd_all_data_binary(qCommand& qC, Stream& S){
+  pause_data = true; // pause data taking during process
+  int start_index = SYNC_DATA_LENGTH;
+  if (data_index > SYNC_DATA_LENGTH) {
+    start_index = 0;
+  }
+  serial_write_binary_header(S, 4, SYNC_DATA_LENGTH);
+  uint32_t crc = 0;
+  crc = serial_write_binary_block(S, error_data, start_index, SYNC_DATA_LENGTH, crc);
+  crc = serial_write_binary_block(S, output_data, start_index, SYNC_DATA_LENGTH, crc);
+  crc = serial_write_binary_block(S, transmission_data, start_index, SYNC_DATA_LENGTH, crc);
+  crc = serial_write_binary_block(S, cavity_error_data, start_index, SYNC_DATA_LENGTH, crc);
+  S.write((const uint8_t*)&crc, 4);
+  output_scan_index = 0;
+  data_index = 0;
+  pause_data = false;
+}
+
 void cmd_last_transmission_point(qCommand& qC, Stream& S){
   S.printf("Last transmission point is %f\n", transmission_data[data_index]);
 }
@@ -614,6 +714,11 @@ void setup(void) {
   qC.addCommand("output_data", cmd_output_data);
   qC.addCommand("cavity_error_data", cmd_cavity_error_data);
   qC.addCommand("all_data", cmd_all_data);
+  qC.addCommand("error_data_binary", cmd_error_data_binary);
+  qC.addCommand("output_data_binary", cmd_output_data_binary);
+  qC.addCommand("transmission_data_binary", cmd_transmission_data_binary);
+  qC.addCommand("cavity_error_data_binary", cmd_cavity_error_data_binary);
+  qC.addCommand("all_data_binary", cmd_all_data_binary);
   qC.addCommand("limit_warnings", cmd_limit_warnings);
   qC.addCommand("integral", cmd_integral);
   qC.addCommand("last_transmission_point", cmd_last_transmission_point);
@@ -0,0 +1,259 @@
+"""Asynchronous device monitors.
+
+Each Monitor samples one device at its own interval, so a slow or hung device does not delay the others.
+Blocking drivers run in a thread of the monitor, and coroutine readers run in the event loop.
+Readings are put in a shared queue, and database_writer writes them to InfluxDB.
+
+Example:
+    monitors = [
+        Monitor("pulse_tube", PulseTube, read_pulse_tube, interval=1),
+        Monitor("ruuvi", connect_ruuvi, read_ruuvi, interval=5, timeout=10),
+    ]
+    asyncio.run(run_all(monitors, write_api, "live", "permanent"))
+"""
+import asyncio
+import inspect
+from queue import Queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class Reading:
+    """Points of one device reading. Permanent readings are also written to the permanent bucket."""
+    name: str
+    points: list
+    permanent: bool
+
+
+def _print_error(name: str, message: str, print_traceback: bool = True):
+    time_str = datetime.now().strftime("%H:%M:%S")
+    print(f"{time_str}: {name} {message}")
+    if print_traceback:
+        print(traceback.format_exc())
+
+
+class DeviceThread:
+    """Daemon thread that runs blocking calls one at a time.
+
+    Unlike executor threads, a hung call does not stop the interpreter from exiting.
+    """
+    def __init__(self, name: str):
+        self._calls = Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            loop, future, function, args = call
+            try:
+                result = function(*args)
+            except BaseException as e:
+                loop.call_soon_threadsafe(_set_future, future, None, e)
+            else:
+                loop.call_soon_threadsafe(_set_future, future, result, None)
+
+    def call(self, function: Callable, *args) -> asyncio.Future:
+        """Runs function(*args) in the thread. Returns a future of the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._calls.put((loop, future, function, args))
+        return future
+
+    def stop(self):
+        """Stops the thread after the current call."""
+        self._calls.put(None)
+
+
+def _retrieve_exception(future: asyncio.Future):
+    """Marks the exception of a future that is not awaited as retrieved, so that it is not logged."""
+    if not future.cancelled():
+        future.exception()
+
+
+def _set_future(future: asyncio.Future, result, exception):
+    if future.cancelled():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+class Monitor:
+    """Samples a device and puts its readings in a queue.
+
+    A failed or timed out reading is retried after a backoff that doubles after each failure,
+    and the device is connected again after reconnect_after failures in a row.
+    After a blocking call times out, the device is not called again until that call returns,
+    and it is then closed and connected again.
+
+    Args:
+        name: str, device name used in error messages.
+        connect: function that returns the device. It is called in the monitor thread, and again
+            when a connection fails.
+        read: function or coroutine function of the device that returns a list of points.
+        interval: float, time in s between the starts of readings.
+        timeout: float, time in s after which a reading or connection fails.
+        reconnect_after: int or None, number of failures in a row before connecting again.
+            None never connects again.
+        backoff: float, time in s before retrying after the first failure.
+        max_backoff: float, longest time in s before retrying.
+        permanent_interval: float, time in s between readings that are marked permanent.
+    """
+    def __init__(
+        self,
+        name: str,
+        connect: Callable[[], Any],
+        read: Callable[[Any], list],
+        interval: float = 1,
+        timeout: float = 5,
+        reconnect_after: Optional[int] = 10,
+        backoff: float = 1,
+        max_backoff: float = 60,
+        permanent_interval: float = 280,
+    ):
+        self.name = name
+        self._connect = connect
+        self._read = read
+        self.interval = interval
+        self.timeout = timeout
+        self.reconnect_after = reconnect_after
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.permanent_interval = permanent_interval
+        self.device = None
+        self.failures = 0
+        self._last_permanent = None
+        # one thread per monitor, so that a hung driver only blocks its own monitor.
+        self._thread = DeviceThread(name)
+        self._hung_call = None
+        self._hung_function = None
+        self._hung_device = None
+
+    async def _run_blocking(self, function, *args):
+        future = self._thread.call(function, *args)
+        try:
+            # shielded, so that the future is set when a timed out call returns.
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.add_done_callback(_retrieve_exception)
+            self._hung_call = future
+            self._hung_function = function
+            self._hung_device, self.device = self.device, None
+            raise
+
+    def is_hung(self) -> bool:
+        """Whether a timed out blocking call is still running."""
+        return self._hung_call is not None and not self._hung_call.done()
+
+    def _finish_hung_call(self):
+        """Forgets the returned hung call. Returns the device that it leaves open, which must be closed."""
+        call, function, device = self._hung_call, self._hung_function, self._hung_device
+        self._hung_call, self._hung_function, self._hung_device = None, None, None
+        if function is self._connect and not call.cancelled() and call.exception() is None:
+            # connected after the timeout.
+            device = call.result()
+        return device
+
+    async def connect(self):
+        """Connects to the device."""
+        self.device = await self._run_blocking(self._connect)
+
+    async def disconnect(self):
+        """Closes the device if it has a close method. The next reading connects again."""
+        device = self.device
+        self.device = None
+        await self._close(device)
+
+    async def _close(self, device):
+        if device is not None and hasattr(device, "close"):
+            try:
+                await self._run_blocking(device.close)
+            except Exception:
+                _print_error(self.name, "close error.", print_traceback=False)
+
+    async def read(self) -> list:
+        """Reads the device once. Returns the list of points."""
+        if inspect.iscoroutinefunction(self._read):
+            return await asyncio.wait_for(self._read(self.device), self.timeout)
+        return await self._run_blocking(self._read, self.device)
+
+    def _is_permanent(self) -> bool:
+        now = time.monotonic()
+        if self._last_permanent is None or now - self._last_permanent >= self.permanent_interval:
+            self._last_permanent = now
+            return True
+        return False
+
+    def _retry_delay(self) -> float:
+        return min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+
+    async def run(self, queue: asyncio.Queue):
+        """Reads the device every interval and puts the readings in queue, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            if self.is_hung():
+                await asyncio.sleep(self.interval)
+                continue
+            if self._hung_call is not None:
+                await self._close(self._finish_hung_call())
+            try:
+                if self.device is None:
+                    await self.connect()
+                points = await self.read()
+                self.failures = 0
+            except asyncio.TimeoutError:
+                self.failures += 1
+                _print_error(self.name, "timed out.", print_traceback=False)
+            except Exception:
+                self.failures += 1
+                _print_error(self.name, "error.")
+            else:
+                await queue.put(Reading(self.name, points, self._is_permanent()))
+                await asyncio.sleep(max(self.interval - (loop.time() - start), 0))
+                continue
+
+            if self.reconnect_after is not None and self.failures % self.reconnect_after == 0:
+                await self.disconnect()
+            await asyncio.sleep(self._retry_delay())
+
+
+async def database_writer(queue: asyncio.Queue, write_api, live_bucket: str, permanent_bucket: str, org: str = "onix"):
+    """Writes the readings in queue to InfluxDB, until cancelled.
+
+    Readings that are waiting in the queue are written together. The blocking writes run in a thread.
+    """
+    thread = DeviceThread("database_writer")
+
+    def write(bucket, points):
+        write_api.write(bucket=bucket, org=org, record=points)
+
+    while True:
+        readings = [await queue.get()]
+        while not queue.empty():
+            readings.append(queue.get_nowait())
+        live = [point for reading in readings for point in reading.points]
+        permanent = [point for reading in readings if reading.permanent for point in reading.points]
+        try:
+            await thread.call(write, live_bucket, live)
+            if len(permanent) > 0:
+                await thread.call(write, permanent_bucket, permanent)
+        except Exception:
+            _print_error("Database", "write error.")
+
+
+async def run_all(monitors: list[Monitor], write_api, live_bucket: str, permanent_bucket: str, org: str = "onix"):
+    """Runs the monitors and the database writer until cancelled."""
+    queue = asyncio.Queue()
+    tasks = [asyncio.create_task(monitor.run(queue)) for monitor in monitors]
+    tasks.append(asyncio.create_task(database_writer(queue, write_api, live_bucket, permanent_bucket, org)))
+    await asyncio.gather(*tasks)